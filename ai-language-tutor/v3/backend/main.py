@@ -1,14 +1,16 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from backend.utils import generate_completions
-from backend.utils.handlers import handle_generation_request, INSTRUCTION_TEMPLATES
+from backend.utils.handlers import handle_generation_request, handle_streaming_generation_request, INSTRUCTION_TEMPLATES
 from backend import config
 from typing import Union, List, Literal, Optional
 import logging
 import json
 from backend.cache import cache
+from backend.utils.rate_limiter import limiter
+from backend.utils.retry import retry_policy
 
 logging.basicConfig(level=logging.INFO)
 
@@ -37,10 +39,33 @@ class GenerationRequest(BaseModel):
 class MetadataRequest(BaseModel):
     query: str
 
+@app.on_event("startup")
+async def startup_event():
+    """Open LLM connections before the first requests arrive"""
+    try:
+        await generate_completions.http_pool.prewarm(generate_completions.client)
+    except Exception as e:
+        logging.warning(f"LLM connection prewarm skipped: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close the LLM client and its connection pool"""
+    await generate_completions.client.close()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the AI Learning Assistant API!"}
 
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "cache": cache.stats(),
+        "llm_limiter": limiter.stats(),
+        "llm_retries": retry_policy.stats(),
+        "llm_http_pool": generate_completions.http_pool.stats()
+    }
+
 @app.post("/extract/metadata")
 async def extract_metadata(data: MetadataRequest):
     logging.info(f"Query: {data.query}")
@@ -49,7 +74,8 @@ async def extract_metadata(data: MetadataRequest):
             (str(data.query), config.language_metadata_extraction_prompt),
             generate_completions.get_completions,
             data.query,
-            config.language_metadata_extraction_prompt
+            config.language_metadata_extraction_prompt,
+            category="metadata"
         )
         metadata_dict = json.loads(response_str)
         return JSONResponse(
@@ -93,4 +119,32 @@ async def generate_simulation(data: GenerationRequest):
         data=data,
         mode="simulation",
         instructions_template=INSTRUCTION_TEMPLATES["simulation"]
+    )
+
+# Streaming variants: NDJSON (or SSE with Accept: text/event-stream), one event per finished item
+@app.post("/generate/flashcards/stream")
+async def stream_flashcards(data: GenerationRequest, request: Request):
+    return await handle_streaming_generation_request(
+        request=request,
+        data=data,
+        mode="flashcards",
+        instructions_template=INSTRUCTION_TEMPLATES["flashcards"]
+    )
+
+@app.post("/generate/exercises/stream")
+async def stream_exercises(data: GenerationRequest, request: Request):
+    return await handle_streaming_generation_request(
+        request=request,
+        data=data,
+        mode="exercises",
+        instructions_template=INSTRUCTION_TEMPLATES["exercises"]
+    )
+
+@app.post("/generate/simulation/stream")
+async def stream_simulation(data: GenerationRequest, request: Request):
+    return await handle_streaming_generation_request(
+        request=request,
+        data=data,
+        mode="simulation",
+        instructions_template=INSTRUCTION_TEMPLATES["simulation"]
     )
\ No newline at end of file
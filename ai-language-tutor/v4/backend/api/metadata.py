@@ -26,7 +26,8 @@ async def extract_metadata(
             (str(data.query), config.language_metadata_extraction_prompt),
             generate_completions.get_completions,
             data.query,
-            config.language_metadata_extraction_prompt
+            config.language_metadata_extraction_prompt,
+            category="metadata"
         )
         metadata_dict = json.loads(response_str)
         return {
@@ -1,9 +1,15 @@
+import logging
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
 from fastapi.openapi.utils import get_openapi
 
 from backend.api import curriculum, lessons, flashcards, exercises, simulation, users, metadata
+from backend.cache import cache
+from backend.utils import generate_completions
+from backend.utils.rate_limiter import limiter
+from backend.utils.retry import retry_policy
 
 # Create FastAPI app with custom OpenAPI configuration
 app = FastAPI(
@@ -63,10 +69,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup_event():
+    """Open LLM connections before the first requests arrive"""
+    try:
+        await generate_completions.http_pool.prewarm(generate_completions.client)
+    except Exception as e:
+        logging.warning(f"LLM connection prewarm skipped: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close the LLM client and its connection pool"""
+    await generate_completions.client.close()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the AI Learning Assistant API!"}
 
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "cache": cache.stats(),
+        "llm_limiter": limiter.stats(),
+        "llm_retries": retry_policy.stats(),
+        "llm_http_pool": generate_completions.http_pool.stats()
+    }
+
 # Include routers for modular endpoints
 app.include_router(users.router)
 app.include_router(metadata.router)
@@ -6,12 +6,22 @@ from typing import Union, List, Dict, Literal
 from dotenv import load_dotenv
 import os
 from pydantic import BaseModel
+from backend.utils.rate_limiter import limiter, estimate_tokens
+from backend.utils.retry import admitted, retry_policy
+from backend.utils.http_pool import HttpPool
 load_dotenv()
 
+# Sized, keep-alive connection pool shared by every request of the client below
+http_pool = HttpPool()
+
 # Initialize the async client
 client = AsyncOpenAI(
     base_url=os.getenv("BASE_URL"),
     api_key=os.getenv("API_KEY"),
+    # Retries are handled by retry_policy so they can be logged, hedged and counted
+    max_retries=0,
+    timeout=float(os.getenv("LLM_TIMEOUT", 60)),
+    http_client=http_pool.client,
 )
 
 class Message(BaseModel):
@@ -72,10 +82,21 @@ async def get_completions(
         raise TypeError("Unexpected processed input type.")
 
     # print(os.getenv("MODEL"))
-    response = await client.chat.completions.create(
-        model=os.getenv("MODEL"),
-        messages=messages,
-        response_format={"type": "json_object"}
-    )
+    estimated_tokens = estimate_tokens(messages)
+
+    async def attempt() -> str:
+        # Wait for a slot under the process-wide concurrency and RPM/TPM budgets
+        async with limiter.slot(tokens=estimated_tokens) as usage:
+            # Retry/hedge timing starts here, not while queued for the slot
+            admitted()
+            response = await client.chat.completions.create(
+                model=os.getenv("MODEL"),
+                messages=messages,
+                response_format={"type": "json_object"}
+            )
+            if response.usage is not None:
+                usage["total_tokens"] = response.usage.total_tokens
+        return response.choices[0].message.content  # adjust based on your client
 
-    return response.choices[0].message.content  # adjust based on your client
+    # Each retry or hedge is a separate request and takes its own limiter slot
+    return await retry_policy.run(attempt)
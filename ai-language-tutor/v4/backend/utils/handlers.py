@@ -4,6 +4,7 @@ from typing import Callable, Dict, Any
 from backend import config
 from backend.cache import cache
 from backend.utils import generate_completions
+from backend.utils.prompt_templates import render_instructions
 
 async def handle_generation_request(
     data: Any,
@@ -32,19 +33,15 @@ async def handle_generation_request(
         )
 
     # Format instructions with metadata
-    instructions = (
-        instructions_template
-        .replace("{native_language}", data.native_language)
-        .replace("{target_language}", data.target_language)
-        .replace("{proficiency}", data.proficiency)
-    )
+    instructions = render_instructions(instructions_template, data.native_language, data.target_language, data.proficiency)
 
     # Get response from cache or generate new
     response = await cache.get_or_set(
         (str(data.query), instructions),
         generate_completions.get_completions,
         data.query,
-        instructions
+        instructions,
+        category=mode
     )
 
     return JSONResponse(
@@ -1,15 +1,27 @@
 import asyncio
 import logging
-from typing import Dict, Any
+import os
+from typing import Dict, Any, List
 from backend.storage import storage, ContentStatus
 from backend.utils.handlers import generate_content_data, INSTRUCTION_TEMPLATES
 from backend.models import GenerationRequest
+from backend.utils.rate_limiter import background_priority
+from backend.job_queue import JobQueue, Unit, job_queue
+from backend.database import database
 import json
 
 logger = logging.getLogger(__name__)
 
-async def generate_content_background(curriculum_id: str, content_type: str, generation_request: GenerationRequest):
-    """Background task to generate content (flashcards, exercises, simulation)"""
+CONTENT_TYPES = ["curriculum", "flashcards", "exercises", "simulation"]
+
+# Units generated at the same time by this process (the LLM limiter still caps actual calls)
+MAX_ACTIVE_UNITS = int(os.getenv("GENERATION_MAX_ACTIVE_UNITS", 8))
+# Fallback polling for expired leases; new units wake the worker right away
+POLL_INTERVAL = float(os.getenv("GENERATION_POLL_INTERVAL", 5))
+
+@background_priority
+async def generate_content_background(curriculum_id: str, content_type: str, generation_request: GenerationRequest) -> bool:
+    """Background task to generate content (flashcards, exercises, simulation). Returns whether it was stored."""
     try:
         # Update status to generating
         await storage.update_content_status(curriculum_id, content_type, ContentStatus.GENERATING)
@@ -32,6 +44,7 @@ async def generate_content_background(curriculum_id: str, content_type: str, gen
                 # Store the generated content
                 await storage.store_generated_content(curriculum_id, content_type, content_data)
                 logger.info(f"Successfully generated and stored {content_type} for curriculum {curriculum_id}")
+                return True
             except json.JSONDecodeError as e:
                 logger.error(f"JSON parsing error for {content_type} in curriculum {curriculum_id}: {str(e)}")
                 logger.error(f"Raw data that failed to parse: {result.get('data')}")
@@ -48,14 +61,129 @@ async def generate_content_background(curriculum_id: str, content_type: str, gen
         import traceback
         logger.error(f"Full traceback: {traceback.format_exc()}")
         await storage.update_content_status(curriculum_id, content_type, ContentStatus.FAILED)
+    return False
+
+
+class GenerationWorker:
+    """Runs queued generation units as tasks, renewing their leases while they run"""
+
+    def __init__(self, queue: JobQueue = job_queue, max_active: int = MAX_ACTIVE_UNITS, poll_interval: float = POLL_INTERVAL):
+        self.queue = queue
+        self.max_active = max_active
+        self.poll_interval = poll_interval
+        self.active: Dict[asyncio.Task, Unit] = {}
+        self._loops: List[asyncio.Task] = []
+
+    def start(self):
+        if not self._loops:
+            loop = asyncio.get_running_loop()
+            self._loops = [
+                loop.create_task(self._dispatch_loop(), name="generation-dispatcher"),
+                loop.create_task(self._renew_leases(), name="generation-lease-renewal")
+            ]
+
+    async def stop(self):
+        """Stop taking units and hand the running ones back to the queue for the next start"""
+        for task in self._loops:
+            task.cancel()
+        units = list(self.active.values())
+        for task in list(self.active):
+            task.cancel()
+        await asyncio.gather(*self._loops, *self.active, return_exceptions=True)
+        self._loops = []
+        if units:
+            await self.queue.release(units)
+            logger.info(f"Released {len(units)} generation unit(s) on shutdown")
+
+    async def _dispatch_loop(self):
+        while True:
+            self.queue.wakeup.clear()
+            try:
+                await self.dispatch()
+            except Exception as e:
+                logger.error(f"Generation dispatch failed: {e}")
+            try:
+                await asyncio.wait_for(self.queue.wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def dispatch(self) -> int:
+        """Start as many queued units as there are free slots. Returns units started."""
+        for curriculum_id, content_type in await self.queue.give_up():
+            await storage.update_content_status(curriculum_id, content_type, ContentStatus.FAILED)
+        units = await self.queue.claim(self.max_active - len(self.active))
+        for unit in units:
+            task = asyncio.get_running_loop().create_task(self.run_unit(unit))
+            self.active[task] = unit
+            task.add_done_callback(self._finished)
+        return len(units)
+
+    def _finished(self, task: asyncio.Task):
+        self.active.pop(task, None)
+        # A finished unit frees a slot
+        self.queue.wakeup.set()
+
+    async def run_unit(self, unit: Unit):
+        try:
+            request = GenerationRequest.model_validate_json(unit.request_json)
+        except ValueError as e:
+            await self.queue.complete(unit, error=f"Unreadable generation request: {e}")
+            await storage.update_content_status(unit.curriculum_id, unit.content_type, ContentStatus.FAILED)
+            return
+        stored = await generate_content_background(unit.curriculum_id, unit.content_type, request)
+        await self.queue.complete(unit, error=None if stored else f"Failed to generate {unit.content_type}")
+
+    async def _renew_leases(self):
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            try:
+                await self.queue.renew()
+            except Exception as e:
+                logger.error(f"Failed to renew generation leases: {e}")
+
+
+generation_worker = GenerationWorker()
+
+
+async def recover_generations() -> int:
+    """Startup sweep: put content left 'generating' by a stopped process back in the queue. Returns units re-queued."""
+    recovered = await job_queue.recover()
+    for curriculum_id, content_type in recovered:
+        await storage.update_content_status(curriculum_id, content_type, ContentStatus.PENDING)
+
+    # Curricula from before the queue existed only have their status to go by
+    stalled = await database.get_stalled_curricula()
+    for curriculum in stalled:
+        request = GenerationRequest(
+            user_id=curriculum['user_id'],
+            query=f"{curriculum['title']}: {curriculum['description']}",
+            native_language=curriculum['native_language'],
+            target_language=curriculum['target_language'],
+            proficiency=curriculum['proficiency']
+        )
+        missing = ["curriculum"] + [
+            content_type for content_type in ("flashcards", "exercises", "simulation")
+            if not curriculum[f"has_{content_type}"]
+        ]
+        await storage.update_content_status(curriculum['id'], "curriculum", ContentStatus.PENDING)
+        recovered.extend((curriculum['id'], content_type) for content_type in missing)
+        await job_queue.enqueue(curriculum['id'], missing, request.model_dump_json())
+
+    if stalled:
+        logger.warning(f"Re-queued {len(stalled)} curricula left generating without queued units")
+    return len(recovered)
 
 async def start_background_generations(curriculum_id: str, generation_request: GenerationRequest):
-    """Start all background generation tasks for a curriculum"""
-    content_types = ["curriculum", "flashcards", "exercises", "simulation"]
-    
-    # Start all background generations
+    """Queue all background generations for a curriculum"""
+    if storage.use_database:
+        # Durable: the units survive a restart and are picked up by generation_worker
+        queued = await job_queue.enqueue(curriculum_id, CONTENT_TYPES, generation_request.model_dump_json())
+        logger.info(f"Queued {queued} background generation units for curriculum {curriculum_id}")
+        return queued
+
+    # File-only storage has no database to queue in: run the generations as plain tasks
     tasks = []
-    for content_type in content_types:
+    for content_type in CONTENT_TYPES:
         task = asyncio.create_task(
             generate_content_background(curriculum_id, content_type, generation_request)
         )
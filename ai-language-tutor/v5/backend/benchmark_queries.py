@@ -0,0 +1,181 @@
+"""
+Benchmark for DatabaseManager.get_curriculum
+Compares the old per-lesson (N+1) loading against the current set-based
+queries on throwaway databases with 5, 25 and 100 lessons.
+
+Usage: python -m backend.benchmark_queries [--repeat N]
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+
+import aiosqlite
+
+import backend.database as database_module
+from backend.database import DatabaseManager
+from backend.db_pragmas import connect
+
+LESSON_COUNTS = (5, 25, 100)
+FLASHCARDS_PER_LESSON = 10
+EXERCISES_PER_LESSON = 5
+
+
+class QueryCounter:
+    """Counts statements executed on connections opened through counting_connect()"""
+
+    def __init__(self):
+        self.count = 0
+
+    def trace(self, statement: str):
+        # Pragmas applied on connect are setup cost, not part of the read path
+        if not statement.lstrip().upper().startswith("PRAGMA"):
+            self.count += 1
+
+    @asynccontextmanager
+    async def counting_connect(self, db_path: str):
+        async with connect(db_path) as db:
+            await db.set_trace_callback(self.trace)
+            yield db
+
+
+async def get_curriculum_n_plus_one(db_path: str, curriculum_id: str, connect_fn) -> Dict[str, Any]:
+    """The previous loading strategy: three SELECTs per lesson. Kept here as the baseline."""
+    async with connect_fn(db_path) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute("SELECT * FROM curricula WHERE id = ?", (curriculum_id,)) as cursor:
+            curriculum_row = await cursor.fetchone()
+        async with db.execute(
+            "SELECT * FROM lessons WHERE curriculum_id = ? ORDER BY created_at", (curriculum_id,)
+        ) as cursor:
+            lesson_rows = await cursor.fetchall()
+
+        flashcards, exercises, simulations = [], [], []
+        for lesson_row in lesson_rows:
+            lesson_id = lesson_row["id"]
+            async with db.execute("SELECT * FROM flashcards WHERE lesson_id = ?", (lesson_id,)) as cursor:
+                flashcards.extend(dict(row) for row in await cursor.fetchall())
+            async with db.execute("SELECT * FROM exercises WHERE lesson_id = ?", (lesson_id,)) as cursor:
+                for row in await cursor.fetchall():
+                    exercise = dict(row)
+                    exercise['choices'] = json.loads(exercise['choices'])
+                    exercises.append(exercise)
+            async with db.execute("SELECT * FROM simulations WHERE lesson_id = ?", (lesson_id,)) as cursor:
+                for row in await cursor.fetchall():
+                    simulation = dict(row)
+                    simulation['content'] = json.loads(simulation['content'])
+                    simulations.append(simulation)
+
+    return {
+        "curriculum_row": dict(curriculum_row),
+        "flashcards": flashcards,
+        "exercises": exercises,
+        "simulation": simulations[0] if simulations else None
+    }
+
+
+async def seed_curriculum(database: DatabaseManager, lesson_count: int) -> str:
+    """Create one curriculum with lesson_count lessons, each with flashcards, exercises and a simulation"""
+    curriculum_id = await database.store_curriculum(
+        user_id=1,
+        metadata={
+            "title": f"Benchmark ({lesson_count} lessons)",
+            "description": "Synthetic curriculum",
+            "native_language": "English",
+            "target_language": "Spanish",
+            "proficiency": "intermediate"
+        },
+        curriculum_data={
+            "lesson_topic": "Benchmark",
+            "sub_topics": [
+                {"sub_topic": f"Lesson {i}", "description": f"Lesson {i}", "keywords": ["a", "b"]}
+                for i in range(lesson_count)
+            ]
+        }
+    )
+    for lesson in await database.get_lessons(curriculum_id):
+        await database.store_flashcards(lesson["id"], [
+            {"word": f"word{j}", "definition": f"definition {j}", "example": f"example {j}"}
+            for j in range(FLASHCARDS_PER_LESSON)
+        ])
+        await database.store_exercises(lesson["id"], [
+            {"sentence": f"sentence {j}", "answer": "a", "choices": ["a", "b", "c", "d"], "explanation": "-"}
+            for j in range(EXERCISES_PER_LESSON)
+        ])
+        await database.store_simulation(lesson["id"], {
+            "title": "Simulation", "setting": "Cafe",
+            "content": [{"speaker": "A", "line": "Hola"}, {"speaker": "B", "line": "Hola"}]
+        })
+    return curriculum_id
+
+
+async def measure(run, repeat: int) -> float:
+    """Median latency of `run` in milliseconds"""
+    timings: List[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await run()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+async def benchmark(lesson_count: int, repeat: int) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = DatabaseManager(os.path.join(tmp_dir, "benchmark.db"))
+        await database.initialize_database()
+        curriculum_id = await seed_curriculum(database, lesson_count)
+
+        baseline_counter = QueryCounter()
+        baseline = await get_curriculum_n_plus_one(database.db_path, curriculum_id, baseline_counter.counting_connect)
+
+        # Route DatabaseManager's connections through the counter for one call
+        set_based_counter = QueryCounter()
+        database_module.connect = set_based_counter.counting_connect
+        try:
+            current = await database.get_curriculum(curriculum_id)
+        finally:
+            database_module.connect = connect
+
+        # Both strategies must return the same content in the same order
+        assert current["content"]["flashcards"] == baseline["flashcards"]
+        assert current["content"]["exercises"] == baseline["exercises"]
+        assert current["content"]["simulation"] == baseline["simulation"]
+
+        baseline_ms = await measure(
+            lambda: get_curriculum_n_plus_one(database.db_path, curriculum_id, connect), repeat
+        )
+        set_based_ms = await measure(lambda: database.get_curriculum(curriculum_id), repeat)
+
+    return {
+        "lessons": lesson_count,
+        "n_plus_one_queries": baseline_counter.count,
+        "set_based_queries": set_based_counter.count,
+        "n_plus_one_ms": baseline_ms,
+        "set_based_ms": set_based_ms
+    }
+
+
+async def main():
+    """CLI interface for the benchmark"""
+    repeat = 20
+    if "--repeat" in sys.argv:
+        repeat = int(sys.argv[sys.argv.index("--repeat") + 1])
+
+    print(f"get_curriculum: median of {repeat} runs per strategy")
+    print(f"{'lessons':>8} {'N+1 queries':>12} {'set queries':>12} {'N+1 ms':>10} {'set ms':>10} {'speedup':>8}")
+    for lesson_count in LESSON_COUNTS:
+        result = await benchmark(lesson_count, repeat)
+        speedup = result["n_plus_one_ms"] / result["set_based_ms"] if result["set_based_ms"] else 0.0
+        print(
+            f"{result['lessons']:>8} {result['n_plus_one_queries']:>12} {result['set_based_queries']:>12} "
+            f"{result['n_plus_one_ms']:>10.2f} {result['set_based_ms']:>10.2f} {speedup:>7.1f}x"
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
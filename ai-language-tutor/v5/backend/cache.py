@@ -1,29 +1,193 @@
 import asyncio
-from typing import Any, Callable, Dict, Tuple
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+# Default time-to-live (seconds) per cache category; "default" covers anything unlisted.
+# Override per category with CACHE_TTL_<CATEGORY>, e.g. CACHE_TTL_METADATA=3600.
+DEFAULT_TTLS: Dict[str, float] = {
+    "metadata": 6 * 60 * 60,
+    "curriculum": 24 * 60 * 60,
+    "flashcards": 24 * 60 * 60,
+    "exercises": 24 * 60 * 60,
+    "simulation": 24 * 60 * 60,
+    "default": 24 * 60 * 60,
+}
+
+class CacheEntry(NamedTuple):
+    value: Any
+    size: int
+    category: str
+    expires_at: Optional[float]
+
+def estimate_size(value: Any) -> int:
+    """Approximate resident size of a cached value in bytes"""
+    if isinstance(value, (str, bytes, bytearray)):
+        return sys.getsizeof(value)
+    try:
+        # Parsed JSON payloads: the serialized length is a good proxy for their footprint
+        return sys.getsizeof(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
 
 class AsyncLRUCache:
-    def __init__(self, maxsize=100_000):  # Optimized for 16GB RAM
-        self.cache: Dict[Tuple, Any] = {}
-        self.order = []
+    def __init__(
+        self,
+        maxsize: Optional[int] = 100_000,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[Dict[str, float]] = None
+    ):
+        # OrderedDict keeps recency order, so hits and evictions are O(1)
+        self.cache: "OrderedDict[Tuple, CacheEntry]" = OrderedDict()
         self.maxsize = maxsize
-        self.lock = asyncio.Lock()
-
-    async def get_or_set(self, key: Tuple, coro: Callable, *args, **kwargs):
-        async with self.lock:
-            if key in self.cache:
-                # Move key to end to show it was recently used
-                self.order.remove(key)
-                self.order.append(key)
-                return self.cache[key]
+        # Memory-budget mode: evict least recently used entries until total bytes fit
+        self.max_bytes = max_bytes
+        self.ttl = dict(ttl or {})
+        self.current_bytes = 0
+        # Futures for keys that are currently being computed (single-flight)
+        self.inflight: Dict[Tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get_or_set(self, key: Tuple, coro: Callable, *args, category: str = "default", **kwargs):
+        # All bookkeeping below runs without awaiting, so it is atomic on the event loop
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            return entry.value
+
+        # Another caller is already computing this key, wait for its result
+        pending = self.inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # The leader was cancelled, not us: retry and compute it ourselves
+                if pending.cancelled():
+                    return await self.get_or_set(key, coro, *args, category=category, **kwargs)
+                raise
+
         # Not cached, compute result
-        result = await coro(*args, **kwargs)
-        async with self.lock:
-            self.cache[key] = result
-            self.order.append(key)
-            if len(self.order) > self.maxsize:
-                oldest = self.order.pop(0)
-                del self.cache[oldest]
-        return result
-
-# Initialize cache with optimized size for 16GB RAM
-cache = AsyncLRUCache()  # Uses default maxsize=100_000 
\ No newline at end of file
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            result = await coro(*args, **kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody was waiting on it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            self._store(key, result, category)
+            return result
+        finally:
+            self.inflight.pop(key, None)
+
+    def get(self, key: Tuple, default: Any = None) -> Any:
+        """Return a cached value without computing it on a miss"""
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry.value
+
+    def set(self, key: Tuple, value: Any, category: str = "default"):
+        """Store a value computed elsewhere (e.g. write-through from a slower tier)"""
+        self._store(key, value, category)
+
+    def _lookup(self, key: Tuple) -> Optional[CacheEntry]:
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        # Move key to end to show it was recently used
+        self.cache.move_to_end(key)
+        return entry
+
+    def _ttl_for(self, category: str) -> Optional[float]:
+        return self.ttl.get(category, self.ttl.get("default"))
+
+    def _store(self, key: Tuple, value: Any, category: str):
+        ttl = self._ttl_for(category)
+        size = estimate_size(value) + estimate_size(key)
+        if self.max_bytes is not None and size > self.max_bytes:
+            # A single entry larger than the whole budget would flush everything else
+            return
+        if key in self.cache:
+            self._remove(key)
+        self.cache[key] = CacheEntry(
+            value=value,
+            size=size,
+            category=category,
+            expires_at=time.monotonic() + ttl if ttl else None
+        )
+        self.current_bytes += size
+        while self.cache and (
+            (self.maxsize is not None and len(self.cache) > self.maxsize) or
+            (self.max_bytes is not None and self.current_bytes > self.max_bytes)
+        ):
+            _, evicted = self.cache.popitem(last=False)
+            self.current_bytes -= evicted.size
+            self.evictions += 1
+
+    def _remove(self, key: Tuple):
+        entry = self.cache.pop(key)
+        self.current_bytes -= entry.size
+
+    def purge_expired(self) -> int:
+        """Drop every expired entry and return how many were removed"""
+        now = time.monotonic()
+        expired = [
+            key for key, entry in self.cache.items()
+            if entry.expires_at is not None and entry.expires_at <= now
+        ]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size, resident bytes and hit/miss/eviction counters for monitoring"""
+        return {
+            "size": len(self.cache),
+            "maxsize": self.maxsize,
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "inflight": len(self.inflight),
+        }
+
+def _ttls_from_env() -> Dict[str, float]:
+    ttls = dict(DEFAULT_TTLS)
+    for category in list(ttls):
+        override = os.getenv(f"CACHE_TTL_{category.upper()}")
+        if override:
+            ttls[category] = float(override)
+    return ttls
+
+# Bound the cache by memory rather than a guessed entry count (CACHE_MAX_BYTES, default 256MB)
+cache = AsyncLRUCache(
+    maxsize=None,
+    max_bytes=int(os.getenv("CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+    ttl=_ttls_from_env()
+)
@@ -7,6 +7,8 @@ from datetime import datetime
 from contextlib import asynccontextmanager
 import aiosqlite
 from backend.constants import ContentStatus
+from backend.db_pragmas import connect, check_pragmas
+from backend.pagination import decode_cursor
 import os
 
 class DatabaseManager:
@@ -23,7 +25,7 @@ class DatabaseManager:
 
     async def initialize_database(self):
         """Initialize the database and create tables"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with connect(self.db_path) as db:
             await db.executescript("""
             CREATE TABLE IF NOT EXISTS curricula (
                 id TEXT PRIMARY KEY,
@@ -86,9 +88,32 @@ class DatabaseManager:
             CREATE INDEX IF NOT EXISTS idx_flashcards_lesson_id ON flashcards(lesson_id);
             CREATE INDEX IF NOT EXISTS idx_exercises_lesson_id ON exercises(lesson_id);
             CREATE INDEX IF NOT EXISTS idx_simulations_lesson_id ON simulations(lesson_id);
+
+            -- Background generation queue: one leased unit per curriculum and content type
+            CREATE TABLE IF NOT EXISTS generation_units (
+                curriculum_id TEXT NOT NULL,
+                content_type TEXT NOT NULL,
+                request_json TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued' CHECK(status IN ('queued', 'leased', 'done', 'failed')),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires_at REAL,
+                enqueued_at REAL NOT NULL,
+                finished_at REAL,
+                last_error TEXT,
+                PRIMARY KEY (curriculum_id, content_type),
+                FOREIGN KEY (curriculum_id) REFERENCES curricula (id) ON DELETE CASCADE
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_generation_units_status ON generation_units(status, finished_at);
             """)
             await db.commit()
 
+    async def check_settings(self) -> Dict[str, Any]:
+        """Report the SQLite settings (journal mode, synchronous, ...) in effect"""
+        async with connect(self.db_path) as db:
+            return await check_pragmas(db)
+
     def get_lock(self, curriculum_id: str) -> asyncio.Lock:
         """Get or create a lock for a specific curriculum"""
         if curriculum_id not in self._locks:
@@ -100,7 +125,7 @@ class DatabaseManager:
         curriculum_id = str(uuid.uuid4())
         
         async with self.get_lock(curriculum_id):
-            async with aiosqlite.connect(self.db_path) as db:
+            async with connect(self.db_path) as db:
                 # Extract lesson topic from curriculum data
                 lesson_topic = ""
                 if curriculum_data:
@@ -145,7 +170,7 @@ class DatabaseManager:
 
     async def get_curriculum(self, curriculum_id: str) -> Optional[Dict[str, Any]]:
         """Retrieve curriculum by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with connect(self.db_path) as db:
             db.row_factory = aiosqlite.Row
             
             # Get curriculum metadata
@@ -163,40 +188,29 @@ class DatabaseManager:
             """, (curriculum_id,)) as cursor:
                 lesson_rows = await cursor.fetchall()
             
-            # Get flashcards, exercises, and simulations for all lessons
+            # Get flashcards, exercises, and simulations for all lessons in one query
+            # per table, then group by lesson so the result keeps lesson order
+            lesson_ids = [lesson_row["id"] for lesson_row in lesson_rows]
+            flashcards_by_lesson = await self._fetch_by_lesson(db, "flashcards", curriculum_id)
+            exercises_by_lesson = await self._fetch_by_lesson(db, "exercises", curriculum_id)
+            simulations_by_lesson = await self._fetch_by_lesson(db, "simulations", curriculum_id)
+
             flashcards = []
             exercises = []
             simulations = []
-            
-            for lesson_row in lesson_rows:
-                lesson_id = lesson_row["id"]
-                
-                # Get flashcards for this lesson
-                async with db.execute("""
-                    SELECT * FROM flashcards WHERE lesson_id = ?
-                """, (lesson_id,)) as cursor:
-                    lesson_flashcards = await cursor.fetchall()
-                    flashcards.extend([dict(row) for row in lesson_flashcards])
-                
-                # Get exercises for this lesson
-                async with db.execute("""
-                    SELECT * FROM exercises WHERE lesson_id = ?
-                """, (lesson_id,)) as cursor:
-                    lesson_exercises = await cursor.fetchall()
-                    for exercise_row in lesson_exercises:
-                        exercise = dict(exercise_row)
-                        exercise['choices'] = json.loads(exercise['choices'])
-                        exercises.append(exercise)
-                
-                # Get simulations for this lesson
-                async with db.execute("""
-                    SELECT * FROM simulations WHERE lesson_id = ?
-                """, (lesson_id,)) as cursor:
-                    lesson_simulations = await cursor.fetchall()
-                    for sim_row in lesson_simulations:
-                        simulation = dict(sim_row)
-                        simulation['content'] = json.loads(simulation['content'])
-                        simulations.append(simulation)
+
+            for lesson_id in lesson_ids:
+                flashcards.extend(dict(row) for row in flashcards_by_lesson.get(lesson_id, []))
+
+                for exercise_row in exercises_by_lesson.get(lesson_id, []):
+                    exercise = dict(exercise_row)
+                    exercise['choices'] = json.loads(exercise['choices'])
+                    exercises.append(exercise)
+
+                for sim_row in simulations_by_lesson.get(lesson_id, []):
+                    simulation = dict(sim_row)
+                    simulation['content'] = json.loads(simulation['content'])
+                    simulations.append(simulation)
             
             # Build sub_topics from lessons
             sub_topics = []
@@ -239,10 +253,23 @@ class DatabaseManager:
             
             return curriculum
 
+    async def _fetch_by_lesson(self, db: aiosqlite.Connection, table: str, curriculum_id: str) -> Dict[str, List[aiosqlite.Row]]:
+        """Fetch every row of a per-lesson table for a curriculum, grouped by lesson_id"""
+        # The subquery keeps this one statement regardless of lesson count (no bound-variable limit)
+        grouped: Dict[str, List[aiosqlite.Row]] = {}
+        async with db.execute(f"""
+            SELECT * FROM {table}
+            WHERE lesson_id IN (SELECT id FROM lessons WHERE curriculum_id = ?)
+            ORDER BY rowid
+        """, (curriculum_id,)) as cursor:
+            async for row in cursor:
+                grouped.setdefault(row["lesson_id"], []).append(row)
+        return grouped
+
     async def update_curriculum_status(self, curriculum_id: str, status: ContentStatus):
         """Update the status of a curriculum"""
         async with self.get_lock(curriculum_id):
-            async with aiosqlite.connect(self.db_path) as db:
+            async with connect(self.db_path) as db:
                 await db.execute("""
                     UPDATE curricula 
                     SET status = ?, updated_at = CURRENT_TIMESTAMP
@@ -264,9 +291,28 @@ class DatabaseManager:
         # as status is determined by presence of data
         return True
 
+    async def get_stalled_curricula(self) -> List[Dict[str, Any]]:
+        """Curricula left 'generating' by a process that stopped, with no queued units to resume them
+
+        has_* tell which content types already have rows.
+        """
+        async with connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute("""
+                SELECT
+                    c.*,
+                    EXISTS(SELECT 1 FROM flashcards f JOIN lessons l ON l.id = f.lesson_id WHERE l.curriculum_id = c.id) AS has_flashcards,
+                    EXISTS(SELECT 1 FROM exercises e JOIN lessons l ON l.id = e.lesson_id WHERE l.curriculum_id = c.id) AS has_exercises,
+                    EXISTS(SELECT 1 FROM simulations s JOIN lessons l ON l.id = s.lesson_id WHERE l.curriculum_id = c.id) AS has_simulation
+                FROM curricula c
+                WHERE c.status = ?
+                  AND NOT EXISTS (SELECT 1 FROM generation_units u WHERE u.curriculum_id = c.id)
+            """, (ContentStatus.GENERATING,)) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+
     async def store_flashcards(self, lesson_id: str, flashcards_data: List[Dict[str, Any]]):
         """Store flashcards for a lesson"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with connect(self.db_path) as db:
             # Clear existing flashcards for this lesson
             await db.execute("DELETE FROM flashcards WHERE lesson_id = ?", (lesson_id,))
             
@@ -289,7 +335,7 @@ class DatabaseManager:
 
     async def store_exercises(self, lesson_id: str, exercises_data: List[Dict[str, Any]]):
         """Store exercises for a lesson"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with connect(self.db_path) as db:
             # Clear existing exercises for this lesson
             await db.execute("DELETE FROM exercises WHERE lesson_id = ?", (lesson_id,))
             
@@ -313,7 +359,7 @@ class DatabaseManager:
 
     async def store_simulation(self, lesson_id: str, simulation_data: Dict[str, Any]):
         """Store simulation for a lesson"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with connect(self.db_path) as db:
             # Clear existing simulation for this lesson
             await db.execute("DELETE FROM simulations WHERE lesson_id = ?", (lesson_id,))
             
@@ -335,7 +381,7 @@ class DatabaseManager:
 
     async def get_lessons(self, curriculum_id: str) -> List[Dict[str, Any]]:
         """Get all lessons for a curriculum"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with connect(self.db_path) as db:
             db.row_factory = aiosqlite.Row
             
             async with db.execute("""
@@ -348,7 +394,7 @@ class DatabaseManager:
     async def store_curriculum_content(self, curriculum_id: str, curriculum_data: Dict[str, Any]) -> bool:
         """Store curriculum content by updating the curriculum record and creating lessons"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with connect(self.db_path) as db:
                 # Parse curriculum data to extract lesson topic and sub-topics
                 lesson_topic = curriculum_data.get('lesson_topic', '')
                 sub_topics = curriculum_data.get('sub_topics', [])
@@ -384,7 +430,7 @@ class DatabaseManager:
     async def create_default_lesson(self, curriculum_id: str) -> bool:
         """Create a default lesson if none exists"""
         try:
-            async with aiosqlite.connect(self.db_path) as db:
+            async with connect(self.db_path) as db:
                 lesson_id = str(uuid.uuid4())
                 await db.execute("""
                     INSERT INTO lessons (id, curriculum_id, sub_topic, description, keywords)
@@ -434,57 +480,61 @@ class DatabaseManager:
         
         return True
 
-    async def get_user_curricula(self, user_id: int) -> List[Dict[str, Any]]:
-        """Get all curricula for a user"""
-        async with aiosqlite.connect(self.db_path) as db:
+    async def get_user_curricula(self, user_id: int, limit: Optional[int] = None, cursor: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get curricula for a user, newest first.
+
+        Pass limit to page through them, and the cursor for the last curriculum
+        of the previous page (see backend.pagination) to continue after it.
+        """
+        # The page of curricula itself, ordered by a unique (created_at, id) key so cursors are stable
+        page_sql = "SELECT * FROM curricula WHERE user_id = ?"
+        page_params: List[Any] = [user_id]
+        if cursor:
+            created_at, curriculum_id = decode_cursor(cursor)
+            page_sql += " AND (created_at, id) < (?, ?)"
+            page_params.extend([created_at, curriculum_id])
+        page_sql += " ORDER BY created_at DESC, id DESC"
+        if limit is not None:
+            page_sql += " LIMIT ?"
+            page_params.append(limit)
+
+        async with connect(self.db_path) as db:
             db.row_factory = aiosqlite.Row
             
-            async with db.execute("""
-                SELECT * FROM curricula 
-                WHERE user_id = ? 
-                ORDER BY created_at DESC
-            """, (user_id,)) as cursor:
-                rows = await cursor.fetchall()
+            # One grouped query for the page and its content counts. Counting per lesson
+            # through the lesson_id indexes avoids the row fan-out of joining all three tables.
+            async with db.execute(f"""
+                SELECT page.*,
+                       COALESCE(SUM((SELECT COUNT(*) FROM flashcards WHERE lesson_id = l.id)), 0) AS flashcard_count,
+                       COALESCE(SUM((SELECT COUNT(*) FROM exercises WHERE lesson_id = l.id)), 0) AS exercise_count,
+                       COALESCE(SUM((SELECT COUNT(*) FROM simulations WHERE lesson_id = l.id)), 0) AS simulation_count
+                FROM ({page_sql}) AS page
+                LEFT JOIN lessons l ON l.curriculum_id = page.id
+                GROUP BY page.id
+                ORDER BY page.created_at DESC, page.id DESC
+            """, page_params) as db_cursor:
+                rows = await db_cursor.fetchall()
+            
+            if not rows:
+                return []
+            
+            # Lessons for the whole page, for sub_topics
+            lessons_by_curriculum: Dict[str, List[aiosqlite.Row]] = {}
+            async with db.execute(f"""
+                SELECT * FROM lessons
+                WHERE curriculum_id IN (SELECT id FROM ({page_sql}))
+                ORDER BY created_at
+            """, page_params) as db_cursor:
+                async for lesson_row in db_cursor:
+                    lessons_by_curriculum.setdefault(lesson_row["curriculum_id"], []).append(lesson_row)
             
             curricula = []
             for row in rows:
                 curriculum_id = row["id"]
                 
-                # Get lessons for this curriculum
-                async with db.execute("""
-                    SELECT * FROM lessons WHERE curriculum_id = ? ORDER BY created_at
-                """, (curriculum_id,)) as cursor:
-                    lesson_rows = await cursor.fetchall()
-                
-                # Get content counts for status determination
-                flashcard_count = 0
-                exercise_count = 0
-                simulation_count = 0
-                
-                for lesson_row in lesson_rows:
-                    lesson_id = lesson_row["id"]
-                    
-                    # Count flashcards
-                    async with db.execute("""
-                        SELECT COUNT(*) FROM flashcards WHERE lesson_id = ?
-                    """, (lesson_id,)) as cursor:
-                        flashcard_count += (await cursor.fetchone())[0]
-                    
-                    # Count exercises
-                    async with db.execute("""
-                        SELECT COUNT(*) FROM exercises WHERE lesson_id = ?
-                    """, (lesson_id,)) as cursor:
-                        exercise_count += (await cursor.fetchone())[0]
-                    
-                    # Count simulations
-                    async with db.execute("""
-                        SELECT COUNT(*) FROM simulations WHERE lesson_id = ?
-                    """, (lesson_id,)) as cursor:
-                        simulation_count += (await cursor.fetchone())[0]
-                
                 # Build sub_topics from lessons
                 sub_topics = []
-                for lesson_row in lesson_rows:
+                for lesson_row in lessons_by_curriculum.get(curriculum_id, []):
                     sub_topics.append({
                         "sub_topic": lesson_row["sub_topic"],
                         "description": lesson_row["description"],
@@ -505,9 +555,9 @@ class DatabaseManager:
                     "updated_at": row["updated_at"],
                     "status": {
                         "curriculum": row["status"],
-                        "flashcards": "completed" if flashcard_count > 0 else "pending",
-                        "exercises": "completed" if exercise_count > 0 else "pending",
-                        "simulation": "completed" if simulation_count > 0 else "pending"
+                        "flashcards": "completed" if row["flashcard_count"] > 0 else "pending",
+                        "exercises": "completed" if row["exercise_count"] > 0 else "pending",
+                        "simulation": "completed" if row["simulation_count"] > 0 else "pending"
                     },
                     "content": {
                         "curriculum": {
@@ -530,7 +580,7 @@ class DatabaseManager:
             curriculum_id = str(uuid.uuid4())
         
         async with self.get_lock(curriculum_id):
-            async with aiosqlite.connect(self.db_path) as db:
+            async with connect(self.db_path) as db:
                 try:
                     await db.execute("""
                         INSERT INTO curricula (
@@ -0,0 +1,204 @@
+"""
+Generation Job Queue
+Background generation of a curriculum's content types (curriculum, flashcards,
+exercises, simulation) is durable work in SQLite instead of fire-and-forget
+tasks. Each content type is a generation_units row carrying the request it is
+generated from. Workers lease units and renew the lease while they generate;
+a unit whose lease runs out, or that was leased by a process that has since
+restarted, is handed out again, so a restart resumes generation instead of
+leaving content 'generating' forever.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from backend.database import database
+from backend.db_pragmas import connect
+
+logger = logging.getLogger(__name__)
+
+# How long a claimed unit stays with its worker without a renewal
+LEASE_SECONDS = float(os.getenv("GENERATION_LEASE_SECONDS", 120))
+# Claims (including ones lost to a crash) before a unit is given up on
+MAX_ATTEMPTS = int(os.getenv("GENERATION_MAX_ATTEMPTS", 3))
+
+# A unit can be claimed when it is queued or its lease has run out
+_CLAIMABLE = "(status = 'queued' OR (status = 'leased' AND lease_expires_at < ?))"
+
+
+class Unit(NamedTuple):
+    """One content type of a curriculum, with the request to generate it from"""
+    curriculum_id: str
+    content_type: str
+    request_json: str
+    attempts: int
+
+
+class JobQueue:
+    """SQLite-backed queue of per-content-type generation units"""
+
+    def __init__(self, db_path: str = database.db_path, lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Leases carry the process that took them, so a restart can tell its own leases from a dead process's
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Set whenever there may be new work, so the worker doesn't wait out its poll interval
+        self.wakeup = asyncio.Event()
+        self.counts = {"enqueued": 0, "claimed": 0, "done": 0, "failed": 0, "recovered": 0}
+
+    async def enqueue(self, curriculum_id: str, content_types: Iterable[str], request_json: str) -> int:
+        """Queue content types of a curriculum. Failed units are queued again; returns units queued."""
+        now = time.time()
+        rows = [(curriculum_id, content_type, request_json, now) for content_type in content_types]
+        async with connect(self.db_path) as conn:
+            await conn.executemany("""
+                INSERT INTO generation_units (curriculum_id, content_type, request_json, enqueued_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(curriculum_id, content_type) DO UPDATE SET
+                    status = 'queued', request_json = excluded.request_json, attempts = 0,
+                    lease_owner = NULL, lease_expires_at = NULL, last_error = NULL,
+                    enqueued_at = excluded.enqueued_at, finished_at = NULL
+                WHERE status = 'failed'
+            """, rows)
+            await conn.commit()
+
+        self.counts["enqueued"] += len(rows)
+        self.wakeup.set()
+        return len(rows)
+
+    async def recover(self) -> List[Tuple[str, str]]:
+        """Re-queue units leased by processes that are gone. Call once at startup, before any claims.
+
+        Single node: every lease not taken by this process belongs to one that
+        crashed or was restarted, so there is no need to wait for it to expire.
+        Returns the (curriculum_id, content_type) units recovered.
+        """
+        # Bind the wake-up event to the loop the worker will run on
+        self.wakeup = asyncio.Event()
+        async with connect(self.db_path) as conn:
+            async with conn.execute("""
+                UPDATE generation_units
+                SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL
+                WHERE status = 'leased' AND lease_owner IS NOT ?
+                RETURNING curriculum_id, content_type
+            """, (self.worker_id,)) as cursor:
+                recovered = [tuple(row) for row in await cursor.fetchall()]
+            await conn.commit()
+
+        self.counts["recovered"] += len(recovered)
+        if recovered:
+            logger.warning(f"Recovered {len(recovered)} generation unit(s) from interrupted workers")
+        self.wakeup.set()
+        return recovered
+
+    async def give_up(self) -> List[Tuple[str, str]]:
+        """Fail claimable units that have used up their attempts. Returns them."""
+        now = time.time()
+        async with connect(self.db_path) as conn:
+            async with conn.execute(f"""
+                UPDATE generation_units
+                SET status = 'failed', lease_owner = NULL, lease_expires_at = NULL, finished_at = ?,
+                    last_error = COALESCE(last_error, 'Gave up after ' || attempts || ' attempts')
+                WHERE {_CLAIMABLE} AND attempts >= ?
+                RETURNING curriculum_id, content_type
+            """, (now, now, self.max_attempts)) as cursor:
+                failed = [tuple(row) for row in await cursor.fetchall()]
+            await conn.commit()
+        self.counts["failed"] += len(failed)
+        return failed
+
+    async def claim(self, limit: int) -> List[Unit]:
+        """Lease up to limit claimable units, oldest first"""
+        if limit <= 0:
+            return []
+        now = time.time()
+        async with connect(self.db_path) as conn:
+            async with conn.execute(f"""
+                UPDATE generation_units
+                SET status = 'leased', lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1
+                WHERE rowid IN (
+                    SELECT rowid FROM generation_units
+                    WHERE {_CLAIMABLE} AND attempts < ?
+                    ORDER BY enqueued_at
+                    LIMIT ?
+                )
+                RETURNING curriculum_id, content_type, request_json, attempts
+            """, (self.worker_id, now + self.lease_seconds, now, self.max_attempts, limit)) as cursor:
+                units = [Unit(*row) for row in await cursor.fetchall()]
+            await conn.commit()
+        self.counts["claimed"] += len(units)
+        return units
+
+    async def renew(self) -> int:
+        """Extend every lease this process holds"""
+        async with connect(self.db_path) as conn:
+            async with conn.execute("""
+                UPDATE generation_units SET lease_expires_at = ?
+                WHERE status = 'leased' AND lease_owner = ?
+            """, (time.time() + self.lease_seconds, self.worker_id)) as cursor:
+                renewed = cursor.rowcount
+            await conn.commit()
+        return renewed
+
+    async def complete(self, unit: Unit, error: Optional[str] = None) -> bool:
+        """Mark a leased unit done, or failed with error. False if the lease was lost meanwhile."""
+        async with connect(self.db_path) as conn:
+            async with conn.execute("""
+                UPDATE generation_units
+                SET status = ?, last_error = ?, finished_at = ?, lease_owner = NULL, lease_expires_at = NULL
+                WHERE curriculum_id = ? AND content_type = ? AND status = 'leased' AND lease_owner = ?
+            """, (
+                'failed' if error else 'done', error, time.time(),
+                unit.curriculum_id, unit.content_type, self.worker_id
+            )) as cursor:
+                updated = cursor.rowcount > 0
+            await conn.commit()
+        if updated:
+            self.counts['failed' if error else 'done'] += 1
+        return updated
+
+    async def release(self, units: Iterable[Unit]) -> int:
+        """Hand leased units back without charging the attempt (shutdown)"""
+        keys = [(self.worker_id, unit.curriculum_id, unit.content_type) for unit in units]
+        async with connect(self.db_path) as conn:
+            await conn.executemany("""
+                UPDATE generation_units
+                SET status = 'queued', attempts = MAX(attempts - 1, 0), lease_owner = NULL, lease_expires_at = NULL
+                WHERE lease_owner = ? AND curriculum_id = ? AND content_type = ? AND status = 'leased'
+            """, keys)
+            await conn.commit()
+        return len(keys)
+
+    async def stats(self) -> Dict[str, Any]:
+        """Queue depth, age of the oldest waiting unit and recent throughput"""
+        now = time.time()
+        async with connect(self.db_path) as conn:
+            async with conn.execute("SELECT status, COUNT(*) FROM generation_units GROUP BY status") as cursor:
+                units = {status: count for status, count in await cursor.fetchall()}
+            async with conn.execute("SELECT MIN(enqueued_at) FROM generation_units WHERE status = 'queued'") as cursor:
+                oldest = (await cursor.fetchone())[0]
+            async with conn.execute("""
+                SELECT SUM(finished_at >= ?), COUNT(*) FROM generation_units
+                WHERE status = 'done' AND finished_at >= ?
+            """, (now - 60, now - 300)) as cursor:
+                last_minute, last_5_minutes = await cursor.fetchone()
+        return {
+            "worker_id": self.worker_id,
+            "lease_s": self.lease_seconds,
+            "units": units,
+            # Units still to be generated, whether waiting or in progress
+            "depth": units.get('queued', 0) + units.get('leased', 0),
+            "oldest_queued_age_s": round(now - oldest, 1) if oldest is not None else None,
+            "units_done_last_minute": last_minute or 0,
+            "units_per_minute_5m": round((last_5_minutes or 0) / 5, 2),
+            **self.counts
+        }
+
+
+job_queue = JobQueue()
@@ -1,6 +1,9 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from backend.routes import health, extraction, curriculum
+from backend.routes import health, extraction, curriculum, generation
+from backend.utils import generate_completions
+from backend.background_tasks import generation_worker, recover_generations
+from backend.storage import storage
 import logging
 from contextlib import asynccontextmanager
 
@@ -20,15 +23,34 @@ async def lifespan(app: FastAPI):
         try:
             await database.initialize_database()
             logging.info("Database initialized successfully")
+            settings = await database.check_settings()
+            logging.info(f"SQLite settings: {settings['effective']}")
         except Exception as e:
             logging.error(f"Database initialization failed: {e}")
+        if storage.use_database:
+            # Resume generations a previous process left unfinished, then drain the queue
+            try:
+                requeued = await recover_generations()
+                if requeued:
+                    logging.info(f"Re-queued {requeued} interrupted generation unit(s)")
+            except Exception as e:
+                logging.error(f"Generation recovery failed: {e}")
+            generation_worker.start()
     else:
         logging.warning("Database not available, using file storage only")
+
+    # Open LLM connections before the first generations arrive
+    try:
+        await generate_completions.http_pool.prewarm(generate_completions.client)
+    except Exception as e:
+        logging.warning(f"LLM connection prewarm skipped: {e}")
     
     yield
     
     # Shutdown
     logging.info("Application shutting down")
+    await generation_worker.stop()
+    await generate_completions.client.close()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -44,4 +66,5 @@ app.add_middleware(
 # Include routers
 app.include_router(health.router, tags=["health"])
 app.include_router(extraction.router, prefix="/extract", tags=["extraction"])
-app.include_router(curriculum.router, tags=["curriculum"])
\ No newline at end of file
+app.include_router(curriculum.router, tags=["curriculum"])
+app.include_router(generation.router, prefix="/generate", tags=["generation"])
\ No newline at end of file
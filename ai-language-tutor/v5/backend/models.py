@@ -11,6 +11,8 @@ class GenerationRequest(BaseModel):
     native_language: Optional[str] = None
     target_language: Optional[str] = None
     proficiency: Optional[str] = None
+    # Streaming routes save the finished content to this curriculum when set
+    curriculum_id: Optional[str] = None
 
 class MetadataRequest(BaseModel):
     query: str
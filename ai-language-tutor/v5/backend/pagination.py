@@ -0,0 +1,24 @@
+"""
+Keyset pagination cursors for curriculum listings, ordered by (created_at, id)
+"""
+
+import base64
+import json
+from typing import Any, Dict, Tuple
+
+def encode_cursor(curriculum: Dict[str, Any]) -> str:
+    """Opaque pagination cursor pointing just after the given curriculum"""
+    raw = json.dumps([curriculum["created_at"], curriculum["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Return (created_at, id) from a cursor; raises ValueError if it is malformed"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    # Anything else would reach the keyset comparison in SQL
+    if not (isinstance(position, list) and len(position) == 2 and all(isinstance(value, str) for value in position)):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    created_at, curriculum_id = position
+    return created_at, curriculum_id
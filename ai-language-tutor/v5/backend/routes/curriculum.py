@@ -1,6 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import JSONResponse
 from backend.storage import storage
+from backend.pagination import encode_cursor, decode_cursor
 import logging
 
 logger = logging.getLogger(__name__)
@@ -123,9 +125,22 @@ async def get_curriculum_status(curriculum_id: str):
     })
 
 @router.get("/user/{user_id}/curricula")
-async def get_user_curricula(user_id: int):
-    """Get all curricula for a user"""
-    curricula = await storage.get_user_curricula(user_id)
+async def get_user_curricula(
+    user_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    """Get a page of curricula for a user, newest first; pass next_cursor back to get the next page"""
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    # Fetch one extra row to know whether another page follows
+    curricula = await storage.get_user_curricula(user_id, limit=limit + 1, cursor=cursor)
+    next_cursor = encode_cursor(curricula[limit - 1]) if len(curricula) > limit else None
+    curricula = curricula[:limit]
     
     # Return summary information
     summary = []
@@ -140,4 +155,4 @@ async def get_user_curricula(user_id: int):
             "status": curriculum["status"]
         })
     
-    return JSONResponse(content={"curricula": summary}) 
\ No newline at end of file
+    return JSONResponse(content={"curricula": summary, "next_cursor": next_cursor}) 
\ No newline at end of file
@@ -1,6 +1,7 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from backend.models import GenerationRequest, MetadataBasedRequest
-from backend.utils.handlers import handle_generation_request, INSTRUCTION_TEMPLATES
+from backend.storage import storage
+from backend.utils.handlers import handle_generation_request, handle_streaming_generation_request, INSTRUCTION_TEMPLATES
 
 router = APIRouter()
 
@@ -43,4 +44,44 @@ async def generate_simulation(data: GenerationRequest):
         data=data,
         mode="simulation",
         instructions_template=INSTRUCTION_TEMPLATES["simulation"]
-    ) 
\ No newline at end of file
+    )
+
+# Streaming variants: NDJSON (or SSE with Accept: text/event-stream), one event per finished item.
+# When the request names a curriculum, the assembled result is saved to it before the final event.
+def _save_to_curriculum(data: GenerationRequest, mode: str):
+    if not data.curriculum_id:
+        return None
+
+    async def save(result):
+        await storage.store_generated_content(data.curriculum_id, mode, result)
+    return save
+
+@router.post("/flashcards/stream")
+async def stream_flashcards(data: GenerationRequest, request: Request):
+    return await handle_streaming_generation_request(
+        request=request,
+        data=data,
+        mode="flashcards",
+        instructions_template=INSTRUCTION_TEMPLATES["flashcards"],
+        on_complete=_save_to_curriculum(data, "flashcards")
+    )
+
+@router.post("/exercises/stream")
+async def stream_exercises(data: GenerationRequest, request: Request):
+    return await handle_streaming_generation_request(
+        request=request,
+        data=data,
+        mode="exercises",
+        instructions_template=INSTRUCTION_TEMPLATES["exercises"],
+        on_complete=_save_to_curriculum(data, "exercises")
+    )
+
+@router.post("/simulation/stream")
+async def stream_simulation(data: GenerationRequest, request: Request):
+    return await handle_streaming_generation_request(
+        request=request,
+        data=data,
+        mode="simulation",
+        instructions_template=INSTRUCTION_TEMPLATES["simulation"],
+        on_complete=_save_to_curriculum(data, "simulation")
+    )
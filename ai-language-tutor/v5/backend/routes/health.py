@@ -1,7 +1,43 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from backend.utils.rate_limiter import limiter
+from backend.utils.retry import retry_policy
+from backend.utils import generate_completions
+
+# Import database functionality
+try:
+    from backend.database import database
+    from backend.job_queue import job_queue
+    DATABASE_AVAILABLE = True
+except ImportError:
+    DATABASE_AVAILABLE = False
 
 router = APIRouter()
 
 @router.get("/")
 async def root():
-    return {"message": "Welcome to the AI Learning Assistant API!"} 
\ No newline at end of file
+    return {"message": "Welcome to the AI Learning Assistant API!"}
+
+@router.get("/health")
+async def health():
+    if not DATABASE_AVAILABLE:
+        return {
+            "status": "ok",
+            "database": None,
+            "llm_limiter": limiter.stats(),
+            "llm_retries": retry_policy.stats(),
+            "llm_http_pool": generate_completions.http_pool.stats()
+        }
+    try:
+        settings = await database.check_settings()
+        generation_queue = await job_queue.stats()
+    except Exception as e:
+        return JSONResponse(content={"status": "error", "error": str(e)}, status_code=500)
+    return {
+        "status": "ok",
+        "database": {"path": database.db_path, "sqlite_settings": settings},
+        "generation_queue": generation_queue,
+        "llm_limiter": limiter.stats(),
+        "llm_retries": retry_policy.stats(),
+        "llm_http_pool": generate_completions.http_pool.stats()
+    }
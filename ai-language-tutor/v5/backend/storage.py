@@ -5,6 +5,7 @@ import asyncio
 from typing import Dict, Any, Optional
 from datetime import datetime
 from backend.constants import ContentStatus
+from backend.pagination import decode_cursor
 
 # Import database functionality
 try:
@@ -191,13 +192,13 @@ class CurriculumStorage:
         
         return True
 
-    async def get_user_curricula(self, user_id: int) -> list[Dict[str, Any]]:
-        """Get all curricula for a user"""
+    async def get_user_curricula(self, user_id: int, limit: Optional[int] = None, cursor: Optional[str] = None) -> list[Dict[str, Any]]:
+        """Get curricula for a user, newest first, optionally one page at a time"""
         self.ensure_directories()  # Ensure directories exist before reading
         # Try database first (primary storage)
         if self.use_database:
             try:
-                curricula = await database.get_user_curricula(user_id)
+                curricula = await database.get_user_curricula(user_id, limit=limit, cursor=cursor)
                 return curricula  # Return even if empty list
             except Exception as e:
                 print(f"Database user curricula retrieval failed: {e}")
@@ -224,9 +225,12 @@ class CurriculumStorage:
                         except (json.JSONDecodeError, KeyError):
                             continue
                 
-                # Sort by creation date, newest first
-                curricula.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-                return curricula
+                # Sort by creation date, newest first, with the same keyset as the database
+                curricula.sort(key=lambda x: (x.get("created_at", ""), x.get("id", "")), reverse=True)
+                if cursor:
+                    after = decode_cursor(cursor)
+                    curricula = [c for c in curricula if (c.get("created_at", ""), c.get("id", "")) < after]
+                return curricula[:limit] if limit is not None else curricula
             except Exception as e:
                 print(f"File storage user curricula retrieval failed: {e}")
                 return []
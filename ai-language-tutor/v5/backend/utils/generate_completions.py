@@ -1,17 +1,28 @@
 from openai import AsyncOpenAI, OpenAI
 import asyncio
+import contextlib
 import json
 from typing import AsyncIterator
 from typing import Union, List, Dict, Literal
 from dotenv import load_dotenv
 import os
 from pydantic import BaseModel
+from backend.utils.rate_limiter import limiter, estimate_tokens
+from backend.utils.retry import admitted, retry_policy
+from backend.utils.http_pool import HttpPool
 load_dotenv()
 
+# Sized, keep-alive connection pool shared by every request of the client below
+http_pool = HttpPool()
+
 # Initialize the async client
 client = AsyncOpenAI(
     base_url=os.getenv("BASE_URL"),
     api_key=os.getenv("API_KEY"),
+    # Retries are handled by retry_policy so they can be logged, hedged and counted
+    max_retries=0,
+    timeout=float(os.getenv("LLM_TIMEOUT", 60)),
+    http_client=http_pool.client,
 )
 
 class Message(BaseModel):
@@ -40,10 +51,10 @@ def process_input(data: Union[str, List[Dict[str, str]]]) -> Union[str, List[Dic
     else:
         raise TypeError("Input must be a string or a list of dictionaries with a 'content' field")
 
-async def get_completions(
+def build_messages(
     prompt: Union[str, List[Dict[str, str]]],
     instructions: str
-) -> str:
+) -> List[Dict[str, str]]:
     if isinstance(prompt, list):
         formatted_query = flatten_messages(prompt)
     else:
@@ -71,11 +82,64 @@ async def get_completions(
     else:
         raise TypeError("Unexpected processed input type.")
 
-    # print(os.getenv("MODEL"))
-    response = await client.chat.completions.create(
-        model=os.getenv("MODEL"),
-        messages=messages,
-        response_format={"type": "json_object"}
-    )
+    return messages
+
+async def get_completions(
+    prompt: Union[str, List[Dict[str, str]]],
+    instructions: str
+) -> str:
+    messages = build_messages(prompt, instructions)
+    estimated_tokens = estimate_tokens(messages)
+
+    async def attempt() -> str:
+        # Wait for a slot under the process-wide concurrency and RPM/TPM budgets
+        async with limiter.slot(tokens=estimated_tokens) as usage:
+            # Retry/hedge timing starts here, not while queued for the slot
+            admitted()
+            response = await client.chat.completions.create(
+                model=os.getenv("MODEL"),
+                messages=messages,
+                response_format={"type": "json_object"}
+            )
+            if response.usage is not None:
+                usage["total_tokens"] = response.usage.total_tokens
+        return response.choices[0].message.content  # adjust based on your client
+
+    # Each retry or hedge is a separate request and takes its own limiter slot
+    return await retry_policy.run(attempt)
+
+
+async def stream_completions(
+    prompt: Union[str, List[Dict[str, str]]],
+    instructions: str
+) -> AsyncIterator[str]:
+    """Yield the completion text piece by piece as the model produces it (stream=True)"""
+    messages = build_messages(prompt, instructions)
+    estimated_tokens = estimate_tokens(messages)
+
+    async def attempt():
+        # Each attempt takes its own slot, so none is held through the backoff between attempts
+        slot = contextlib.AsyncExitStack()
+        usage = await slot.enter_async_context(limiter.slot(tokens=estimated_tokens))
+        try:
+            admitted()
+            stream = await client.chat.completions.create(
+                model=os.getenv("MODEL"),
+                messages=messages,
+                response_format={"type": "json_object"},
+                stream=True
+            )
+        except BaseException:
+            await slot.aclose()
+            raise
+        return slot, usage, stream
 
-    return response.choices[0].message.content  # adjust based on your client
+    # Only opening the stream is retried, and never hedged; once open, its slot is held until it ends
+    slot, usage, stream = await retry_policy.run(attempt, hedge=False)
+    async with slot:
+        async with stream:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage["total_tokens"] = chunk.usage.total_tokens
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
@@ -1,9 +1,24 @@
-from fastapi import HTTPException
-from fastapi.responses import JSONResponse
-from typing import Callable, Dict, Any
+import json
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import AsyncIterator, Awaitable, Callable, Dict, Any, Optional
 from backend import config
 from backend.cache import cache
 from backend.utils import generate_completions
+from backend.utils.json_stream import JsonStreamParser
+from backend.utils.prompt_templates import render_instructions
+
+def format_instructions(data: Any, instructions_template: str) -> str:
+    """Validate the request metadata and fill it into the instruction template"""
+    # Validate required metadata
+    if not (data.native_language and data.target_language and data.proficiency):
+        raise HTTPException(
+            status_code=400,
+            detail="native_language, target_language, and proficiency are required. Please extract metadata first."
+        )
+
+    # Memoized: the same string object is returned, so hashing it into cache keys is cheap
+    return render_instructions(instructions_template, data.native_language, data.target_language, data.proficiency)
 
 async def generate_content_data(
     data: Any,
@@ -24,27 +39,15 @@ async def generate_content_data(
     Raises:
         HTTPException: If required metadata is missing or other errors occur
     """
-    # Validate required metadata
-    if not (data.native_language and data.target_language and data.proficiency):
-        raise HTTPException(
-            status_code=400,
-            detail="native_language, target_language, and proficiency are required. Please extract metadata first."
-        )
-
-    # Format instructions with metadata
-    instructions = (
-        instructions_template
-        .replace("{native_language}", data.native_language)
-        .replace("{target_language}", data.target_language)
-        .replace("{proficiency}", data.proficiency)
-    )
+    instructions = format_instructions(data, instructions_template)
 
     # Get response from cache or generate new
     response = await cache.get_or_set(
         (str(data.query), instructions),
         generate_completions.get_completions,
         data.query,
-        instructions
+        instructions,
+        category=mode
     )
 
     return {
@@ -75,6 +78,84 @@ async def handle_generation_request(
     content = await generate_content_data(data, mode, instructions_template)
     return JSONResponse(content=content, status_code=200)
 
+async def stream_generation_events(
+    data: Any,
+    mode: str,
+    instructions: str,
+    on_complete: Optional[Callable[[Any], Awaitable[Any]]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Generate content and yield each item as soon as the model finishes it.
+
+    Yields {"event": "item", "field", "index", "item"} per flashcard, exercise or story
+    segment, then {"event": "done", "data": ...} with the assembled object once it has
+    been cached (and passed to on_complete, e.g. to save it to the database).
+    """
+    key = (str(data.query), instructions)
+    cached = cache.get(key)
+    if cached is None and key in cache.inflight:
+        # A non-streaming request is already generating this: wait for it rather than pay twice
+        cached = await cache.get_or_set(
+            key,
+            generate_completions.get_completions,
+            data.query,
+            instructions,
+            category=mode
+        )
+
+    parser = JsonStreamParser()
+    if cached is not None:
+        for item in parser.feed(cached):
+            yield {"event": "item", **item}
+    else:
+        async for chunk in generate_completions.stream_completions(data.query, instructions):
+            for item in parser.feed(chunk):
+                yield {"event": "item", **item}
+
+    result = parser.result()
+    if cached is None:
+        cache.set(key, parser.document_text(), category=mode)
+    if on_complete is not None:
+        await on_complete(result)
+
+    yield {"event": "done", "type": mode, "data": result, "status": "success"}
+
+async def handle_streaming_generation_request(
+    request: Request,
+    data: Any,
+    mode: str,
+    instructions_template: str,
+    on_complete: Optional[Callable[[Any], Awaitable[Any]]] = None
+) -> StreamingResponse:
+    """
+    Streaming variant of handle_generation_request.
+
+    Sends Server-Sent Events when the client accepts text/event-stream, NDJSON otherwise.
+    Metadata is validated before the stream starts so errors still get a 400 status.
+    """
+    instructions = format_instructions(data, instructions_template)
+    use_sse = "text/event-stream" in request.headers.get("accept", "")
+
+    async def body() -> AsyncIterator[str]:
+        try:
+            async for event in stream_generation_events(data, mode, instructions, on_complete):
+                yield encode_stream_event(event, use_sse)
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            yield encode_stream_event({"event": "error", "type": mode, "detail": str(e), "status": "error"}, use_sse)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream" if use_sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def encode_stream_event(event: Dict[str, Any], use_sse: bool) -> str:
+    payload = json.dumps(event, ensure_ascii=False)
+    if use_sse:
+        return f"event: {event['event']}\ndata: {payload}\n\n"
+    return payload + "\n"
+
 # Mapping of modes to their instruction templates
 INSTRUCTION_TEMPLATES: Dict[str, str] = {
     "curriculum": config.curriculum_instructions,
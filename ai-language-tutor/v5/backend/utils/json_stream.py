@@ -0,0 +1,112 @@
+"""
+Incremental JSON Parser
+Consumes a JSON document as it streams in from the model and yields each
+item of its list (a flashcard, an exercise, a story segment) as soon as the
+item's closing brace arrives, without waiting for the rest of the document.
+"""
+
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class JsonStreamParser:
+    """Feed text chunks with feed(); each call yields the items completed by that chunk.
+
+    An item is an object directly inside the outermost list of the document,
+    e.g. every element of [...] or of {"flashcards": [...]} or the "content"
+    segments of a simulation. Objects nested inside an item are part of it.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        # Open containers: {"type": "{" or "[", "key": key of this container in its parent, ...}
+        self._stack: List[Dict[str, Any]] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._root_start: Optional[int] = None
+        self._root_end: Optional[int] = None
+        self._item_counts: Dict[Optional[str], int] = {}
+
+    def _arrays_open(self) -> int:
+        return sum(1 for container in self._stack if container["type"] == "[")
+
+    def feed(self, chunk: str) -> Iterator[Dict[str, Any]]:
+        self.buffer += chunk
+        buffer = self.buffer
+        while self._pos < len(buffer):
+            i = self._pos
+            char = buffer[i]
+            self._pos += 1
+
+            if self._root_end is not None:
+                # Trailing text after the document (e.g. a closing code fence)
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._stack and self._stack[-1]["type"] == "{":
+                        self._last_string = json.loads(buffer[self._string_start:i + 1])
+                continue
+
+            if not self._stack and char not in "{[":
+                # Text before the document starts (e.g. an opening code fence)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char == ":" and self._stack[-1]["type"] == "{":
+                self._stack[-1]["pending_key"] = self._last_string
+            elif char in "{[":
+                if not self._stack:
+                    self._root_start = i
+                parent = self._stack[-1] if self._stack else None
+                container = {"type": char, "start": i, "key": None, "item": False}
+                if parent is not None and parent["type"] == "{":
+                    container["key"] = parent.get("pending_key")
+                if char == "{" and parent is not None and parent["type"] == "[" and self._arrays_open() == 1:
+                    container["item"] = True
+                    container["field"] = parent["key"]
+                self._stack.append(container)
+            elif char in "}]":
+                container = self._stack.pop()
+                if not self._stack:
+                    self._root_end = i
+                if container["item"]:
+                    field = container["field"]
+                    index = self._item_counts.get(field, 0)
+                    self._item_counts[field] = index + 1
+                    yield {
+                        "field": field,
+                        "index": index,
+                        "item": json.loads(buffer[container["start"]:i + 1])
+                    }
+
+    @property
+    def complete(self) -> bool:
+        return self._root_end is not None
+
+    def document_text(self) -> str:
+        """The JSON document itself, without any text the model put around it"""
+        if self._root_start is None or self._root_end is None:
+            return self.buffer
+        return self.buffer[self._root_start:self._root_end + 1]
+
+    def result(self) -> Any:
+        """Parse the complete document; raises ValueError if the stream ended early"""
+        if not self.complete:
+            raise ValueError("JSON stream ended before the document was complete")
+        return json.loads(self.document_text())
+
+
+def iter_items(text: str) -> Iterator[Dict[str, Any]]:
+    """Yield the items of an already complete document, as the streaming parser would"""
+    yield from JsonStreamParser().feed(text)
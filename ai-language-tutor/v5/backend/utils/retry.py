@@ -0,0 +1,322 @@
+"""
+LLM Retry Policy
+Retries transient completion failures (429, 5xx, timeouts, dropped connections)
+with capped exponential backoff, full jitter and Retry-After support, and can
+hedge a slow call by racing a second request once the first runs past the
+observed p95 latency. Attempts are timed from when they get their rate limiter
+slot (see admitted()), so time spent queued neither triggers hedges nor
+inflates the latency baseline.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+import openai
+
+from backend.utils.rate_limiter import limiter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Status codes worth retrying; other 4xx mean the request itself is wrong
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError)):
+        # APITimeoutError is a subclass of APIConnectionError
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait (retry-after-ms / retry-after headers), if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        # HTTP-date form
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class Admission:
+    """When one attempt got past admission control (its rate limiter slot)"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.at: Optional[float] = None
+        self.event = asyncio.Event()
+
+    def mark(self):
+        if self.at is None:
+            self.at = time.monotonic()
+            self.event.set()
+
+    def elapsed(self) -> float:
+        """Seconds since admission, or since the attempt started if it never reported one"""
+        return time.monotonic() - (self.at if self.at is not None else self.started)
+
+
+_admission: ContextVar[Optional[Admission]] = ContextVar("llm_attempt_admission", default=None)
+
+
+def admitted():
+    """Call from an attempt once it holds its limiter slot; the attempt is timed and hedged from here.
+
+    An attempt that never calls it is timed from its start and never hedged.
+    """
+    admission = _admission.get()
+    if admission is not None:
+        admission.mark()
+
+
+def describe(error: BaseException) -> str:
+    status = getattr(error, "status_code", None)
+    return f"{type(error).__name__}({status})" if status else type(error).__name__
+
+
+class CallRecord:
+    """What happened during one logical LLM call: attempts, retries, hedges and errors"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self):
+        self.id = next(self._ids)
+        self.started = time.monotonic()
+        self.attempts = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.errors: List[Dict[str, Any]] = []
+        self.outcome: Optional[str] = None
+        self.latency: Optional[float] = None
+
+    def finish(self, outcome: str):
+        self.outcome = outcome
+        self.latency = time.monotonic() - self.started
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "outcome": self.outcome,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "errors": self.errors,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None
+        }
+
+
+class RetryPolicy:
+    """Retry and hedging policy applied around a single-attempt coroutine factory"""
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        max_retry_after: float = 60.0,
+        hedge: bool = False,
+        hedge_after: Optional[float] = None,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        latency_window: int = 200,
+        recent_calls: int = 20,
+        saturated: Optional[Callable[[], bool]] = None
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.hedge = hedge
+        # A fixed threshold overrides the observed quantile
+        self.hedge_after = hedge_after
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        # No hedging while this says the limiter is backed up: a hedge would only join the queue
+        self.saturated = saturated or (lambda: False)
+        self.latencies: Deque[float] = deque(maxlen=latency_window)
+        # Calls that needed a retry or hedge, newest last
+        self.recent: Deque[CallRecord] = deque(maxlen=recent_calls)
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        """Delay before the next attempt: full-jitter exponential backoff, floored by Retry-After"""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = random.uniform(0, ceiling)
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, min(requested, self.max_retry_after))
+        return delay
+
+    def hedge_delay(self) -> Optional[float]:
+        """How long to wait before hedging, or None when hedging is off or there is no baseline yet"""
+        if not self.hedge:
+            return None
+        if self.hedge_after is not None:
+            return self.hedge_after
+        if len(self.latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_quantile))]
+
+    async def run(self, attempt: Callable[[], Awaitable[T]], hedge: bool = True) -> T:
+        """Call attempt() until it succeeds, fails permanently or attempts run out.
+
+        Pass hedge=False when a losing attempt's result cannot simply be dropped (e.g. an open stream).
+        """
+        record = CallRecord()
+        self.calls += 1
+        try:
+            for attempt_number in range(1, self.max_attempts + 1):
+                record.attempts += 1
+                try:
+                    result = await self._hedged(attempt, record, hedge)
+                except Exception as e:
+                    record.errors.append({"attempt": attempt_number, "error": describe(e)})
+                    if not is_retryable(e) or attempt_number == self.max_attempts:
+                        record.finish("failed")
+                        self.failures += 1
+                        logger.error(f"LLM call {record.id} failed after {attempt_number} attempt(s): {describe(e)}")
+                        raise
+                    delay = self.backoff(attempt_number, e)
+                    record.retries += 1
+                    self.retries += 1
+                    logger.warning(
+                        f"LLM call {record.id} attempt {attempt_number} failed with {describe(e)}, "
+                        f"retrying in {delay:.2f}s"
+                    )
+                    await asyncio.sleep(delay)
+                else:
+                    record.finish("ok")
+                    return result
+        finally:
+            if record.outcome is None:
+                record.finish("cancelled")
+            if record.retries or record.hedges or record.outcome != "ok":
+                self.recent.append(record)
+
+    async def _hedged(self, attempt: Callable[[], Awaitable[T]], record: CallRecord, hedge: bool) -> T:
+        hedge_after = self.hedge_delay() if hedge else None
+        if hedge_after is None:
+            admission = Admission()
+            result = await self._admitted(attempt, admission)
+            if hedge:
+                # Non-hedgeable calls (stream opens) are not comparable with full completions
+                self.latencies.append(admission.elapsed())
+            return result
+
+        admissions: Dict["asyncio.Future[T]", Admission] = {}
+
+        def launch() -> "asyncio.Future[T]":
+            admission = Admission()
+            task = asyncio.ensure_future(self._admitted(attempt, admission))
+            admissions[task] = admission
+            return task
+
+        primary = launch()
+        pending = {primary}
+        try:
+            # The hedge clock starts once the first request has its slot: queueing is not a slow response
+            admission_wait = asyncio.ensure_future(admissions[primary].event.wait())
+            try:
+                await asyncio.wait({primary, admission_wait}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                admission_wait.cancel()
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0.0, hedge_after - admissions[primary].elapsed())
+            )
+            if not done and not self.saturated():
+                # The first request is slower than usual: race a second one against it
+                backup = launch()
+                pending.add(backup)
+                record.hedges += 1
+                self.hedges += 1
+            error: Optional[BaseException] = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            record.hedge_wins += 1
+                            self.hedge_wins += 1
+                        self.latencies.append(admissions[task].elapsed())
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Drop the loser (or everything, if we were cancelled)
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    async def _admitted(attempt: Callable[[], Awaitable[T]], admission: Admission) -> T:
+        # Hedges run as their own tasks, so each attempt sees its own Admission
+        token = _admission.set(admission)
+        try:
+            return await attempt()
+        finally:
+            _admission.reset(token)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return retry/hedge counters, the current hedge threshold and recent eventful calls"""
+        hedge_after = self.hedge_delay()
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_after_ms": round(hedge_after * 1000, 1) if hedge_after is not None else None,
+            "recent": [record.as_dict() for record in self.recent]
+        }
+
+
+def _hedge_after_from_env() -> Optional[float]:
+    value = os.getenv("LLM_HEDGE_AFTER_MS")
+    return float(value) / 1000 if value else None
+
+
+# LLM_HEDGE=1 turns hedging on; it costs a duplicate request for the slowest ~5% of calls
+retry_policy = RetryPolicy(
+    max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", 4)),
+    base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", 0.5)),
+    max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", 20)),
+    hedge=os.getenv("LLM_HEDGE", "0").lower() in ("1", "true", "yes"),
+    hedge_after=_hedge_after_from_env(),
+    saturated=lambda: limiter.queue_depth > 0
+)
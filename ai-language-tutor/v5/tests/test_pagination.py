@@ -0,0 +1,78 @@
+"""
+Keyset pagination of a user's curricula (GET /user/{user_id}/curricula).
+
+Run from v5/: python -m pytest tests
+"""
+
+import base64
+import json
+import os
+
+os.environ.setdefault("API_KEY", "test")
+os.environ.setdefault("LLM_PREWARM_CONNECTIONS", "0")
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.database import database
+from backend.main import app
+
+USER_ID = 4242
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # The database and file backups live under data/ relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    with TestClient(app) as client:
+        yield client
+
+
+def make_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+def store_curricula(client, count: int):
+    metadata = {
+        "title": "Spanish for travel",
+        "description": "Getting around Spain",
+        "native_language": "English",
+        "target_language": "Spanish",
+        "proficiency": "beginner"
+    }
+    return [
+        client.portal.call(database.store_curriculum, USER_ID, metadata, {"lesson_topic": f"Topic {i}", "sub_topics": []})
+        for i in range(count)
+    ]
+
+
+def test_pages_follow_each_other_through_next_cursor(client):
+    stored = store_curricula(client, 3)
+
+    first = client.get(f"/user/{USER_ID}/curricula", params={"limit": 2})
+    assert first.status_code == 200
+    assert len(first.json()["curricula"]) == 2
+    cursor = first.json()["next_cursor"]
+    assert cursor is not None
+
+    second = client.get(f"/user/{USER_ID}/curricula", params={"limit": 2, "cursor": cursor})
+    assert second.status_code == 200
+    assert second.json()["next_cursor"] is None
+
+    listed = [c["curriculum_id"] for page in (first, second) for c in page.json()["curricula"]]
+    assert sorted(listed) == sorted(stored)
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64 at all!",
+    make_cursor({"created_at": "2024-01-01", "id": "x"}),
+    make_cursor([1, {}]),
+    make_cursor("ab"),
+    make_cursor(["2024-01-01 00:00:00"]),
+    make_cursor(["2024-01-01 00:00:00", "x", "y"]),
+])
+def test_malformed_cursor_is_a_bad_request(client, cursor):
+    response = client.get(f"/user/{USER_ID}/curricula", params={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
@@ -1,17 +1,81 @@
 import aiosqlite
+import asyncio
 import json
 import os
-from typing import Optional, Dict, Any, Callable, Union, List
+from typing import Optional, Dict, Any, Callable, Union, List, Tuple
 import logging
 import hashlib
+import time
+from backend.cache import AsyncLRUCache
+from backend.db_pragmas import connect
+from backend.utils.content_validation import parse_json
 
 logger = logging.getLogger(__name__)
 DB_PATH = os.getenv("DATABASE_PATH", "./ai_tutor.db")
+# In-process L1 size (entries) and how many recent rows to preload into it at startup
+L1_MAXSIZE = int(os.getenv("API_CACHE_L1_SIZE", 2048))
+L1_WARM_ROWS = int(os.getenv("API_CACHE_L1_WARM_ROWS", 500))
+
+# Retention for the api_cache table, per category ("default" covers anything unlisted).
+# Override with API_CACHE_MAX_AGE_<CATEGORY> (seconds) and API_CACHE_MAX_ROWS_<CATEGORY>.
+DEFAULT_MAX_AGE: Dict[str, int] = {
+    "metadata": 7 * 24 * 60 * 60,
+    "curriculum": 30 * 24 * 60 * 60,
+    "flashcards": 30 * 24 * 60 * 60,
+    "exercises": 30 * 24 * 60 * 60,
+    "simulation": 30 * 24 * 60 * 60,
+    "default": 30 * 24 * 60 * 60,
+}
+DEFAULT_MAX_ROWS: Dict[str, int] = {
+    "metadata": 50_000,
+    "curriculum": 20_000,
+    "flashcards": 20_000,
+    "exercises": 20_000,
+    "simulation": 20_000,
+    "default": 20_000,
+}
+MAINTENANCE_INTERVAL = int(os.getenv("API_CACHE_MAINTENANCE_INTERVAL", 15 * 60))
+DELETE_BATCH_SIZE = int(os.getenv("API_CACHE_DELETE_BATCH_SIZE", 500))
+VACUUM_PAGES = int(os.getenv("API_CACHE_VACUUM_PAGES", 1000))
+
+
+def _limits_from_env(defaults: Dict[str, int], prefix: str) -> Dict[str, int]:
+    limits = dict(defaults)
+    for category in list(limits):
+        override = os.getenv(f"{prefix}_{category.upper()}")
+        if override:
+            limits[category] = int(override)
+    return limits
+
+_MISSING = object()
 
 class ApiCache:
-    """Generic caching service using a dedicated database table."""
-    def __init__(self, db_path: str = DB_PATH):
+    """Generic caching service using a dedicated database table.
+
+    Lookups go through an in-process L1 of already-parsed objects before
+    falling back to the SQLite ``api_cache`` table (L2). Values returned from
+    L1 are shared between callers and must be treated as read-only.
+    """
+    def __init__(
+        self,
+        db_path: str = DB_PATH,
+        l1_maxsize: int = L1_MAXSIZE,
+        max_age: Optional[Dict[str, int]] = None,
+        max_rows: Optional[Dict[str, int]] = None
+    ):
         self.db_path = db_path
+        self.max_age = max_age if max_age is not None else _limits_from_env(DEFAULT_MAX_AGE, "API_CACHE_MAX_AGE")
+        self.max_rows = max_rows if max_rows is not None else _limits_from_env(DEFAULT_MAX_ROWS, "API_CACHE_MAX_ROWS")
+        # L1 entries must not outlive the rows they mirror: rows read from the
+        # table get the rest of their lifetime (see _l1_ttl), new rows all of it
+        self.l1 = AsyncLRUCache(maxsize=l1_maxsize, ttl=self.max_age)
+        self.l2_hits = 0
+        self.l2_misses = 0
+        # Generations currently running, so concurrent misses share one LLM call
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.coalesced = 0
+        self._maintenance_task: Optional[asyncio.Task] = None
+        self.last_maintenance: Optional[Dict[str, Any]] = None
 
     def _generate_hash(self, text: str) -> str:
         """Generate a SHA256 hash for a given text."""
@@ -25,6 +89,40 @@ class ApiCache:
         full_key = f"{key_text}|{context_str}"
         return hashlib.sha256(full_key.encode()).hexdigest()
 
+    def _cache_key(self, key_text: str, context: Optional[Dict[str, Any]] = None) -> str:
+        # Generate cache key with context if provided
+        if context:
+            return self._generate_context_hash(key_text, **context)
+        return self._generate_hash(key_text)
+
+    async def get(
+        self,
+        category: str,
+        key_text: str,
+        context: Optional[Dict[str, Any]] = None
+    ) -> Optional[Union[Dict[str, Any], List[Any]]]:
+        """Return the cached entry for key_text, or None without generating anything"""
+        cache_key = self._cache_key(key_text, context)
+        cached = self.l1.get((category, cache_key), _MISSING)
+        if cached is _MISSING:
+            cached = await self._read_l2(category, cache_key, key_text)
+        return None if cached is _MISSING else cached
+
+    async def set(
+        self,
+        category: str,
+        key_text: str,
+        content: Union[Dict[str, Any], List[Any], str],
+        context: Optional[Dict[str, Any]] = None
+    ) -> Union[Dict[str, Any], List[Any], str]:
+        """Store content generated elsewhere (e.g. split out of a multi-lesson batch).
+
+        An entry that is already cached or being generated wins and is returned instead.
+        """
+        async def provided():
+            return content
+        return await self.get_or_set(category, key_text, provided, context=context)
+
     async def get_or_set(
         self,
         category: str,
@@ -48,25 +146,84 @@ class ApiCache:
         Returns:
             The cached or newly generated content.
         """
-        # Generate cache key with context if provided
-        if context:
-            cache_key = self._generate_context_hash(key_text, **context)
+        cache_key = self._cache_key(key_text, context)
+
+        # 1. Check in-process L1, then the database table
+        l1_key = (category, cache_key)
+        cached = self.l1.get(l1_key, _MISSING)
+        if cached is not _MISSING:
+            logger.debug(f"L1 cache hit for {category} with key: {key_text[:50]}...")
+            return cached
+
+        # 2. Another request is already generating this entry: wait for it
+        pending = self._inflight.get(l1_key)
+        if pending is not None:
+            self.coalesced += 1
+            logger.info(f"Coalesced {category} request with in-flight generation: {key_text[:50]}...")
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # The leading request was cancelled, not us: retry as the leader
+                if pending.cancelled():
+                    return await self.get_or_set(category, key_text, coro, *args, context=context, **kwargs)
+                raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[l1_key] = future
+        try:
+            result = await self._load_or_generate(category, cache_key, key_text, coro, *args, **kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody was waiting on it
+            future.exception()
+            raise
         else:
-            cache_key = self._generate_hash(key_text)
-        
-        # 1. Check cache
-        async with aiosqlite.connect(self.db_path) as db:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(l1_key, None)
+
+    async def _read_l2(self, category: str, cache_key: str, key_text: str) -> Any:
+        """Read an entry from the database table into L1; _MISSING if absent or expired"""
+        async with connect(self.db_path) as db:
             db.row_factory = aiosqlite.Row
+            # Rows past their max age are treated as misses until maintenance deletes them
             async with db.execute(
-                "SELECT content_json FROM api_cache WHERE cache_key = ? AND category = ?",
-                (cache_key, category)
+                """
+                SELECT content_json, strftime('%s', created_at) AS created FROM api_cache
+                WHERE cache_key = ? AND category = ? AND created_at > datetime('now', ?)
+                """,
+                (cache_key, category, f"-{self._max_age_for(category)} seconds")
             ) as cursor:
                 row = await cursor.fetchone()
                 if row:
                     logger.info(f"Cache hit for {category} with key: {key_text[:50]}...")
-                    return json.loads(row['content_json'])
+                    self.l2_hits += 1
+                    parsed = json.loads(row['content_json'])
+                    self.l1.set((category, cache_key), parsed, category, ttl=self._l1_ttl(category, row['created']))
+                    return parsed
+        self.l2_misses += 1
+        return _MISSING
 
-        # 2. If miss, generate content
+    async def _load_or_generate(
+        self,
+        category: str,
+        cache_key: str,
+        key_text: str,
+        coro: Callable,
+        *args,
+        **kwargs
+    ) -> Union[Dict[str, Any], List[Any], str]:
+        """Read an entry from the database table, generating and storing it on a miss"""
+        l1_key = (category, cache_key)
+        cached = await self._read_l2(category, cache_key, key_text)
+        if cached is not _MISSING:
+            return cached
+
+        # 3. If miss, generate content
         logger.info(f"Cache miss for {category}: {key_text[:50]}... Generating new content")
         generated_content = await coro(*args, **kwargs)
         
@@ -74,28 +231,198 @@ class ApiCache:
         if isinstance(generated_content, (dict, list)):
             content_to_cache = json.dumps(generated_content)
         elif isinstance(generated_content, str):
-            # Try to parse string to ensure it's valid JSON, then dump it back
-            try:
-                parsed_json = json.loads(generated_content)
-                content_to_cache = json.dumps(parsed_json)
-            except json.JSONDecodeError:
-                # If it's not a JSON string, we can't cache it in this system.
-                # Depending on requirements, we might raise an error or just return it without caching.
-                logger.warning(f"Content for {category} is not valid JSON, returning without caching.")
-                return generated_content
+            # Parse the string (repairing fences, trailing commas or truncation locally), then dump it back.
+            # Unrepairable output raises ContentValidationError instead of reaching the caller uncached.
+            parsed_json, repaired = parse_json(generated_content)
+            if repaired:
+                logger.info(f"Repaired malformed JSON for {category} before caching")
+            content_to_cache = json.dumps(parsed_json)
         else:
             raise TypeError("Cached content must be a JSON string, dict, or list.")
 
-        # 3. Store in cache (use INSERT OR REPLACE to handle duplicates)
-        async with aiosqlite.connect(self.db_path) as db:
+        # 4. Store in cache (upsert, so a concurrent writer from another process doesn't raise)
+        async with connect(self.db_path) as db:
             await db.execute(
-                "INSERT OR REPLACE INTO api_cache (cache_key, category, content_json) VALUES (?, ?, ?)",
+                """
+                INSERT INTO api_cache (cache_key, category, content_json) VALUES (?, ?, ?)
+                ON CONFLICT(cache_key, category) DO UPDATE SET
+                    content_json = excluded.content_json,
+                    created_at = CURRENT_TIMESTAMP
+                """,
                 (cache_key, category, content_to_cache)
             )
             await db.commit()
             logger.info(f"Cached new content for {category} with key: {key_text[:50]}...")
 
-        return json.loads(content_to_cache)
+        # Write-through so the next lookup skips the database entirely
+        parsed = json.loads(content_to_cache)
+        self.l1.set(l1_key, parsed, category)
+        return parsed
+
+    async def warm_l1(self, limit: int = L1_WARM_ROWS) -> int:
+        """Preload L1 with the most recently created cache rows. Returns rows loaded."""
+        if limit <= 0:
+            return 0
+        async with connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            async with db.execute(
+                """
+                SELECT cache_key, category, content_json, strftime('%s', created_at) AS created FROM api_cache
+                ORDER BY created_at DESC LIMIT ?
+                """,
+                (limit,)
+            ) as cursor:
+                rows = await cursor.fetchall()
+
+        # Insert oldest first so the newest rows end up most recently used
+        loaded = 0
+        for row in reversed(rows):
+            ttl = self._l1_ttl(row['category'], row['created'])
+            if ttl <= 0:
+                # Expired, waiting for maintenance to delete it
+                continue
+            try:
+                parsed = json.loads(row['content_json'])
+            except json.JSONDecodeError:
+                continue
+            self.l1.set((row['category'], row['cache_key']), parsed, row['category'], ttl=ttl)
+            loaded += 1
+        logger.info(f"Warmed API cache L1 with {loaded} rows")
+        return loaded
+
+    def _l1_ttl(self, category: str, created: str) -> float:
+        """Seconds a row created at `created` (Unix time, as text) has left before it expires"""
+        return int(created) + self._max_age_for(category) - time.time()
+
+    def _max_age_for(self, category: str) -> int:
+        return self.max_age.get(category, self.max_age["default"])
+
+    def _max_rows_for(self, category: str) -> int:
+        return self.max_rows.get(category, self.max_rows["default"])
+
+    async def _delete_in_batches(self, db: aiosqlite.Connection, select_sql: str, params: tuple) -> int:
+        """Delete the rows picked by select_sql in small transactions so readers aren't blocked"""
+        deleted = 0
+        while True:
+            cursor = await db.execute(
+                f"DELETE FROM api_cache WHERE (cache_key, category) IN ({select_sql} LIMIT {DELETE_BATCH_SIZE})",
+                params
+            )
+            await db.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < DELETE_BATCH_SIZE:
+                return deleted
+            # Yield between batches
+            await asyncio.sleep(0)
+
+    async def _ensure_incremental_vacuum(self, db: aiosqlite.Connection):
+        """Switch databases created before auto_vacuum=INCREMENTAL over (one-off full VACUUM)"""
+        async with db.execute("PRAGMA auto_vacuum") as cursor:
+            mode = (await cursor.fetchone())[0]
+        if mode != 2:
+            logger.info("Enabling incremental auto_vacuum on the database (one-off VACUUM)")
+            await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await db.execute("VACUUM")
+
+    async def _page_count(self, db: aiosqlite.Connection) -> int:
+        async with db.execute("PRAGMA page_count") as cursor:
+            return (await cursor.fetchone())[0]
+
+    async def run_maintenance(self) -> Dict[str, Any]:
+        """Delete expired and over-cap rows, then reclaim free pages with incremental vacuum"""
+        started = time.monotonic()
+        expired_rows = 0
+        capped_rows = 0
+        async with connect(self.db_path) as db:
+            await self._ensure_incremental_vacuum(db)
+            # Databases created from an older schema.sql lack the expiry index
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_api_cache_category_created ON api_cache(category, created_at)"
+            )
+            async with db.execute("PRAGMA page_size") as cursor:
+                page_size = (await cursor.fetchone())[0]
+            pages_before = await self._page_count(db)
+
+            async with db.execute("SELECT DISTINCT category FROM api_cache") as cursor:
+                categories = [row[0] for row in await cursor.fetchall()]
+
+            for category in categories:
+                expired_rows += await self._delete_in_batches(
+                    db,
+                    "SELECT cache_key, category FROM api_cache WHERE category = ? AND created_at <= datetime('now', ?)",
+                    (category, f"-{self._max_age_for(category)} seconds")
+                )
+                # Keep only the newest max_rows entries of the category
+                capped_rows += await self._delete_in_batches(
+                    db,
+                    f"""
+                    SELECT cache_key, category FROM api_cache WHERE category = ?
+                    AND created_at < (
+                        SELECT created_at FROM api_cache WHERE category = ?
+                        ORDER BY created_at DESC LIMIT 1 OFFSET {self._max_rows_for(category) - 1}
+                    )
+                    """,
+                    (category, category)
+                )
+
+            # executescript steps the pragma to completion; execute() would free a single page
+            await db.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES});")
+            pages_after = await self._page_count(db)
+
+        # Expired rows must not linger in L1 either
+        self.l1.purge_expired()
+
+        report = {
+            "expired_rows_deleted": expired_rows,
+            "over_cap_rows_deleted": capped_rows,
+            "rows_deleted": expired_rows + capped_rows,
+            "bytes_reclaimed": max(pages_before - pages_after, 0) * page_size,
+            "duration_ms": round((time.monotonic() - started) * 1000, 2),
+            "finished_at": time.time()
+        }
+        self.last_maintenance = report
+        logger.info(
+            f"API cache maintenance: deleted {report['rows_deleted']} rows, "
+            f"reclaimed {report['bytes_reclaimed']} bytes"
+        )
+        return report
+
+    async def _maintenance_loop(self, interval: int):
+        while True:
+            try:
+                await self.run_maintenance()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"API cache maintenance failed: {e}")
+            await asyncio.sleep(interval)
+
+    def start_maintenance(self, interval: int = MAINTENANCE_INTERVAL):
+        """Start the background maintenance task (no-op if already running)"""
+        if self._maintenance_task is None or self._maintenance_task.done():
+            self._maintenance_task = asyncio.create_task(self._maintenance_loop(interval))
+
+    async def stop_maintenance(self):
+        """Cancel the background maintenance task and wait for it to finish"""
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            try:
+                await self._maintenance_task
+            except asyncio.CancelledError:
+                pass
+            self._maintenance_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return L1 counters, database (L2) hit/miss counts and coalesced requests"""
+        return {
+            "l1": self.l1.stats(),
+            "l2_hits": self.l2_hits,
+            "l2_misses": self.l2_misses,
+            # Each coalesced request is one LLM generation that was not paid for
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+            "last_maintenance": self.last_maintenance
+        }
 
 # Global API cache instance
 api_cache = ApiCache()
\ No newline at end of file
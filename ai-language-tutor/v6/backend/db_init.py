@@ -8,6 +8,7 @@ import aiosqlite
 import logging
 from pathlib import Path
 from typing import Dict, Any, List
+from backend.db_pragmas import connect, check_pragmas
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +43,7 @@ class DatabaseInitializer:
             "views_exist": False,
             "can_write": False,
             "record_count": {},
+            "pragmas": {},
             "errors": []
         }
         
@@ -54,11 +56,17 @@ class DatabaseInitializer:
                 return health_status
             
             # Try to connect to database
-            async with aiosqlite.connect(self.db_path) as db:
+            async with connect(self.db_path) as db:
                 health_status["database_accessible"] = True
                 
+                # Report the journal mode, sync level, etc. SQLite actually applied
+                health_status["pragmas"] = await check_pragmas(db)
+                
                 # Check if required tables exist
-                required_tables = ['metadata_extractions', 'curricula', 'learning_content', 'api_cache']
+                required_tables = [
+                    'metadata_extractions', 'curricula', 'learning_content', 'api_cache', 'llm_usage',
+                    'generation_jobs', 'generation_units'
+                ]
                 existing_tables = await self._get_existing_tables(db)
                 
                 missing_tables = [table for table in required_tables if table not in existing_tables]
@@ -135,7 +143,7 @@ class DatabaseInitializer:
                 logger.info(f"Created directory: {db_dir}")
             
             # Create database and load schema
-            async with aiosqlite.connect(self.db_path) as db:
+            async with connect(self.db_path) as db:
                 # Read schema file
                 with open(self.schema_path, 'r') as f:
                     schema = f.read()
@@ -234,7 +242,7 @@ class DatabaseInitializer:
                 return result
             
             # Database exists but has issues
-            async with aiosqlite.connect(self.db_path) as db:
+            async with connect(self.db_path) as db:
                 # Check and repair missing tables
                 if not health_check["tables_exist"]:
                     with open(self.schema_path, 'r') as f:
@@ -0,0 +1,186 @@
+"""
+Generation Worker
+Drains the generation job queue. A dispatcher loop picks the oldest jobs with
+claimable units and runs each one as a supervised task (see task_registry:
+deadline, admin cancellation, shutdown). A job leases its curriculum's units
+lesson by lesson (a batch of lessons when batching) whenever the content
+generator's window has a free slot, and saves each finished lesson's content
+together with its units' new state, so whatever was generated before a crash
+is never generated again.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.content_generator import ContentGenerator, content_generator
+from backend.db import db
+from backend.job_queue import JobQueue, Unit, job_queue
+from backend.utils.lesson_batches import LESSONS_PER_CALL
+from backend.utils.rate_limiter import background_priority
+from backend.utils.task_registry import TaskRegistry, task_registry
+from backend.utils.token_usage import usage_recorder
+
+logger = logging.getLogger(__name__)
+
+# Curricula generated at the same time by this process
+MAX_ACTIVE_JOBS = int(os.getenv("GENERATION_MAX_ACTIVE_JOBS", 4))
+# Fallback polling for expired leases; new jobs wake the dispatcher right away
+POLL_INTERVAL = float(os.getenv("GENERATION_POLL_INTERVAL", 5))
+
+JOB_KIND = "queued_content"
+
+
+class GenerationWorker:
+    """Runs queued generation jobs under the task registry"""
+
+    def __init__(
+        self,
+        queue: JobQueue = job_queue,
+        generator: ContentGenerator = content_generator,
+        registry: TaskRegistry = task_registry,
+        max_active_jobs: int = MAX_ACTIVE_JOBS,
+        poll_interval: float = POLL_INTERVAL
+    ):
+        self.queue = queue
+        self.generator = generator
+        self.registry = registry
+        self.max_active_jobs = max_active_jobs
+        self.poll_interval = poll_interval
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch_loop(), name="generation-dispatcher")
+
+    async def stop(self):
+        """Stop taking new jobs. Running jobs are cancelled by task_registry.shutdown()."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+    async def _dispatch_loop(self):
+        while True:
+            self.queue.wakeup.clear()
+            try:
+                await self.dispatch()
+            except Exception as e:
+                logger.error(f"Generation dispatch failed: {e}")
+            try:
+                await asyncio.wait_for(self.queue.wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def dispatch(self) -> int:
+        """Start as many runnable jobs as there are free slots. Returns jobs started."""
+        running = [key for key, entry in self.registry.active.items() if entry.kind == JOB_KIND]
+        curriculum_ids = await self.queue.runnable_jobs(self.max_active_jobs - len(running), exclude=running)
+        for curriculum_id in curriculum_ids:
+            self.registry.start(curriculum_id, self.run_job(curriculum_id), kind=JOB_KIND)
+        return len(curriculum_ids)
+
+    @background_priority
+    async def run_job(self, curriculum_id: str):
+        """Generate a curriculum's queued units until none are left, then close the job"""
+        try:
+            await self._run_job(curriculum_id)
+        except asyncio.CancelledError:
+            entry = self.registry.active.get(curriculum_id)
+            reason = entry.cancel_reason if entry is not None else None
+            if reason == "admin":
+                await self.queue.cancel(curriculum_id, reason="Cancelled by admin")
+                await db.update_content_generation_status(
+                    curriculum_id=curriculum_id,
+                    status='failed',
+                    error_message="Content generation was cancelled"
+                )
+            else:
+                # Shutdown or deadline: hand the units back, the job resumes on the next run
+                released = await self.queue.release(curriculum_id, charge_attempt=reason != "shutdown")
+                await db.update_content_generation_status(curriculum_id=curriculum_id, status='pending')
+                logger.info(f"Released {released} unit(s) of curriculum {curriculum_id} ({reason or 'deadline'})")
+            raise
+        finally:
+            # A finished job frees a slot
+            self.queue.wakeup.set()
+
+    async def _run_job(self, curriculum_id: str):
+        job = await self.queue.start_job(curriculum_id)
+        if job is None:
+            return
+        loaded = await self.generator.load_curriculum(curriculum_id)
+        if loaded is None:
+            await self.queue.cancel(curriculum_id, reason="Curriculum not found or unreadable")
+            await db.update_content_generation_status(
+                curriculum_id=curriculum_id,
+                status='failed',
+                error_message="Curriculum not found or unreadable"
+            )
+            return
+        await db.update_content_generation_status(curriculum_id=curriculum_id, status='generating')
+        lessons, metadata = loaded
+        leased: Dict[Tuple[int, str], Unit] = {}
+
+        # Units are leased lesson by lesson as the generator's window frees up slots
+        async def claim(count: int) -> List[Tuple[int, str]]:
+            units = await self.queue.claim(curriculum_id, count)
+            for unit in units:
+                leased[(unit.lesson_index, unit.content_type)] = unit
+            return [(unit.lesson_index, unit.content_type) for unit in units]
+
+        async def save(units: List[Tuple[int, str]], items: List[Dict[str, Any]]):
+            await self.queue.complete([leased.pop(unit) for unit in units], items)
+
+        heartbeat = asyncio.get_running_loop().create_task(self._renew_leases(curriculum_id))
+        try:
+            await self.generator.generate_in_window(
+                curriculum_id,
+                lessons,
+                metadata,
+                claim,
+                save,
+                lessons_per_call=job['lessons_per_call'] or LESSONS_PER_CALL,
+                # Someone is waiting for promoted lessons as well as for lesson 0
+                urgent=lambda unit: unit[0] == 0 or leased[unit].priority > 0
+            )
+        finally:
+            heartbeat.cancel()
+
+        status = await self.queue.finish_job(curriculum_id)
+        if status is None:
+            # Units are still leased elsewhere (e.g. by an earlier run that hasn't expired yet)
+            return
+        await usage_recorder.flush()
+        job = await self.queue.get_job(curriculum_id)
+        if status == 'completed' and sum(job['units'].values()) < (job['expected_units'] or 0):
+            # Lazy generation: later lessons are queued when a learner gets to them
+            await db.update_content_generation_status(curriculum_id=curriculum_id, status='pending')
+            logger.info(f"Content generation job for curriculum {curriculum_id} {status} (lessons queued so far)")
+            return
+        if status == 'completed':
+            await db.mark_curriculum_content_generated(curriculum_id)
+            await db.update_content_generation_status(curriculum_id=curriculum_id, status='completed')
+        else:
+            # Left unmarked, so /admin/generations/resume picks it up
+            await db.update_content_generation_status(
+                curriculum_id=curriculum_id,
+                status='failed',
+                error_message=job['error'] if job else None
+            )
+        logger.info(f"Content generation job for curriculum {curriculum_id} {status}")
+
+    async def _renew_leases(self, curriculum_id: str):
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            try:
+                await self.queue.renew(curriculum_id)
+            except Exception as e:
+                logger.error(f"Failed to renew generation leases for {curriculum_id}: {e}")
+
+
+generation_worker = GenerationWorker()
@@ -0,0 +1,476 @@
+"""
+Generation Job Queue
+Content generation is durable work in SQLite instead of a fire-and-forget
+task. Enqueuing a curriculum writes a generation_jobs row and one
+generation_units row per lesson and content type. Workers lease units in
+small groups and renew the lease while they generate; a unit whose lease runs
+out, or that was leased by a process that has since restarted, is handed out
+again, so a crash or restart resumes generation where it stopped instead of
+losing the curriculum.
+
+Lessons are handed out in priority order, then in lesson order. Asking for a
+lesson that isn't ready yet promotes it (and the lesson after it) ahead of
+the rest of its curriculum.
+"""
+
+import aiosqlite
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from backend.db import db
+from backend.db_pragmas import connect
+from backend.utils.lesson_batches import LESSONS_PER_CALL
+
+logger = logging.getLogger(__name__)
+DB_PATH = os.getenv("DATABASE_PATH", "./ai_tutor.db")
+
+# How long a claimed unit stays with its worker without a renewal
+LEASE_SECONDS = float(os.getenv("GENERATION_LEASE_SECONDS", 120))
+# Claims (including ones lost to a crash) before a unit is given up on
+MAX_ATTEMPTS = int(os.getenv("GENERATION_MAX_ATTEMPTS", 3))
+
+# Unit priorities: a lesson a user asked for, and the one they will open next
+PRIORITY_REQUESTED = 2
+PRIORITY_NEXT = 1
+# Finished jobs the time-to-first-lesson percentiles are computed over
+FIRST_LESSON_SAMPLES = int(os.getenv("GENERATION_FIRST_LESSON_SAMPLES", 100))
+
+# A unit can be claimed when it is queued or its lease has run out
+_CLAIMABLE = "(status = 'queued' OR (status = 'leased' AND lease_expires_at < ?))"
+
+
+class Unit(NamedTuple):
+    """One lesson x content type of a curriculum's generation job"""
+    curriculum_id: str
+    lesson_index: int
+    content_type: str
+    attempts: int
+    priority: int
+
+
+class JobQueue:
+    """SQLite-backed queue of per-lesson, per-content-type generation units"""
+
+    def __init__(self, db_path: str = DB_PATH, lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Leases carry the process that took them, so a restart can tell its own leases from a dead process's
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Set whenever there may be new work, so the dispatcher doesn't wait out its poll interval
+        self.wakeup = asyncio.Event()
+        self.counts = {
+            "enqueued": 0, "claimed": 0, "done": 0, "retried": 0, "failed": 0, "recovered": 0, "promoted": 0,
+            "cancelled": 0
+        }
+
+    @property
+    def abandoned_units(self) -> int:
+        """Units that ended failed or cancelled since startup; changes whenever one does"""
+        return self.counts["failed"] + self.counts["cancelled"]
+
+    async def enqueue(
+        self,
+        curriculum_id: str,
+        units: Iterable[Tuple[int, str]],
+        lessons_per_call: Optional[int] = None,
+        expected_units: Optional[int] = None
+    ) -> int:
+        """Queue (lesson_index, content_type) units for a curriculum. Returns units waiting to be generated.
+
+        expected_units is the number of cells of the curriculum's grid still
+        without content when only part of them is queued (lazy generation).
+        Re-enqueuing a curriculum re-opens its job; units that are already done
+        are kept unless their content has gone missing since, failed and
+        cancelled ones are queued again with fresh attempts.
+        """
+        now = time.time()
+        rows = [(curriculum_id, lesson_index, content_type) for lesson_index, content_type in units]
+        async with connect(self.db_path) as conn:
+            await conn.execute("""
+                INSERT INTO generation_jobs (curriculum_id, status, lessons_per_call, expected_units, enqueued_at)
+                VALUES (?, 'queued', ?, ?, ?)
+                ON CONFLICT(curriculum_id) DO UPDATE SET
+                    status = CASE WHEN status = 'running' THEN 'running' ELSE 'queued' END,
+                    lessons_per_call = COALESCE(excluded.lessons_per_call, lessons_per_call),
+                    expected_units = MAX(COALESCE(expected_units, 0), excluded.expected_units),
+                    finished_at = NULL,
+                    error = NULL
+            """, (curriculum_id, lessons_per_call, expected_units if expected_units is not None else len(rows), now))
+            await conn.executemany("""
+                INSERT INTO generation_units (curriculum_id, lesson_index, content_type)
+                VALUES (?, ?, ?)
+                ON CONFLICT(curriculum_id, lesson_index, content_type) DO UPDATE SET
+                    status = 'queued', attempts = 0, lease_owner = NULL, lease_expires_at = NULL, last_error = NULL
+                WHERE status IN ('failed', 'cancelled') OR (status = 'done' AND NOT EXISTS (
+                    SELECT 1 FROM learning_content lc
+                    WHERE lc.curriculum_id = generation_units.curriculum_id
+                      AND lc.lesson_index = generation_units.lesson_index
+                      AND lc.content_type = generation_units.content_type
+                ))
+            """, rows)
+            async with conn.execute("""
+                SELECT COUNT(*) FROM generation_units WHERE curriculum_id = ? AND status IN ('queued', 'leased')
+            """, (curriculum_id,)) as cursor:
+                pending = (await cursor.fetchone())[0]
+            await conn.commit()
+
+        self.counts["enqueued"] += 1
+        self.wakeup.set()
+        logger.info(f"Queued content generation for curriculum {curriculum_id}: {pending} unit(s) pending")
+        return pending
+
+    async def recover(self) -> int:
+        """Re-queue units leased by processes that are gone. Call once at startup, before any claims.
+
+        Single node: every lease not taken by this process belongs to one that
+        crashed or was restarted, so there is no need to wait for it to expire.
+        """
+        # Bind the wake-up event to the loop the worker will run on
+        self.wakeup = asyncio.Event()
+        async with connect(self.db_path) as conn:
+            async with conn.execute("""
+                UPDATE generation_units
+                SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL
+                WHERE status = 'leased' AND lease_owner IS NOT ?
+            """, (self.worker_id,)) as cursor:
+                recovered = cursor.rowcount
+            await conn.execute("UPDATE generation_jobs SET status = 'queued' WHERE status = 'running'")
+            await conn.commit()
+
+        self.counts["recovered"] += recovered
+        if recovered:
+            logger.warning(f"Recovered {recovered} generation unit(s) from interrupted workers")
+        self.wakeup.set()
+        return recovered
+
+    async def runnable_jobs(self, limit: int, exclude: Sequence[str] = ()) -> List[str]:
+        """Open jobs with claimable units, or with nothing left to do but finishing up.
+
+        Jobs with promoted units come first, then the oldest.
+        """
+        if limit <= 0:
+            return []
+        async with connect(self.db_path) as conn:
+            async with conn.execute(f"""
+                SELECT j.curriculum_id FROM generation_jobs j
+                WHERE j.status IN ('queued', 'running')
+                AND (
+                    EXISTS (SELECT 1 FROM generation_units u WHERE u.curriculum_id = j.curriculum_id AND {_CLAIMABLE})
+                    OR NOT EXISTS (
+                        SELECT 1 FROM generation_units u
+                        WHERE u.curriculum_id = j.curriculum_id AND u.status IN ('queued', 'leased')
+                    )
+                )
+                ORDER BY (
+                    SELECT MAX(priority) FROM generation_units u
+                    WHERE u.curriculum_id = j.curriculum_id AND u.status = 'queued'
+                ) DESC, j.enqueued_at
+                LIMIT ?
+            """, (time.time(), limit + len(exclude))) as cursor:
+                rows = await cursor.fetchall()
+        excluded = set(exclude)
+        return [row[0] for row in rows if row[0] not in excluded][:limit]
+
+    async def start_job(self, curriculum_id: str) -> Optional[Dict[str, Any]]:
+        """Mark a job running; None if there is no open job for the curriculum"""
+        async with connect(self.db_path) as conn:
+            conn.row_factory = aiosqlite.Row
+            async with conn.execute("""
+                UPDATE generation_jobs SET status = 'running', started_at = COALESCE(started_at, ?)
+                WHERE curriculum_id = ? AND status IN ('queued', 'running')
+                RETURNING *
+            """, (time.time(), curriculum_id)) as cursor:
+                row = await cursor.fetchone()
+            await conn.commit()
+        return dict(row) if row else None
+
+    async def claim(self, curriculum_id: str, lessons: int) -> List[Unit]:
+        """Lease the claimable units of the next `lessons` lessons of a curriculum, highest priority first"""
+        now = time.time()
+        async with connect(self.db_path) as conn:
+            async with conn.execute(f"""
+                UPDATE generation_units
+                SET status = 'leased', lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1
+                WHERE curriculum_id = ? AND {_CLAIMABLE}
+                AND lesson_index IN (
+                    SELECT lesson_index FROM generation_units
+                    WHERE curriculum_id = ? AND {_CLAIMABLE}
+                    GROUP BY lesson_index
+                    ORDER BY MAX(priority) DESC, lesson_index
+                    LIMIT ?
+                )
+                RETURNING curriculum_id, lesson_index, content_type, attempts, priority
+            """, (self.worker_id, now + self.lease_seconds, curriculum_id, now, curriculum_id, now, lessons)) as cursor:
+                units = [Unit(*row) for row in await cursor.fetchall()]
+            await conn.commit()
+
+        self.counts["claimed"] += len(units)
+        return sorted(units, key=lambda unit: (-unit.priority, unit.lesson_index, unit.content_type))
+
+    async def promote(self, curriculum_id: str, lesson_index: int, content_type: str) -> bool:
+        """Move a lesson someone asked for, and the lesson after it, to the front of its curriculum.
+
+        Returns True if the requested unit is still waiting or being generated,
+        False if the queue has nothing pending for it.
+        """
+        async with connect(self.db_path) as conn:
+            async with conn.execute("""
+                SELECT status FROM generation_units WHERE curriculum_id = ? AND lesson_index = ? AND content_type = ?
+            """, (curriculum_id, lesson_index, content_type)) as cursor:
+                row = await cursor.fetchone()
+            if row is None or row[0] not in ('queued', 'leased'):
+                return False
+            async with conn.execute("""
+                UPDATE generation_units
+                SET priority = CASE WHEN lesson_index = ? THEN ? ELSE ? END
+                WHERE curriculum_id = ? AND lesson_index IN (?, ?) AND status = 'queued'
+                AND priority < CASE WHEN lesson_index = ? THEN ? ELSE ? END
+            """, (
+                lesson_index, PRIORITY_REQUESTED, PRIORITY_NEXT,
+                curriculum_id, lesson_index, lesson_index + 1,
+                lesson_index, PRIORITY_REQUESTED, PRIORITY_NEXT
+            )) as cursor:
+                promoted = cursor.rowcount
+            await conn.commit()
+
+        if promoted:
+            self.counts["promoted"] += promoted
+            # A job still waiting for a slot may now be first in line
+            self.wakeup.set()
+            logger.info(f"Promoted lesson {lesson_index} of curriculum {curriculum_id} ({promoted} unit(s))")
+        return True
+
+    async def pending_units(self, curriculum_id: str, lesson_index: int) -> Set[Tuple[int, str]]:
+        """A lesson's units that are waiting or being generated"""
+        async with connect(self.db_path) as conn:
+            async with conn.execute("""
+                SELECT lesson_index, content_type FROM generation_units
+                WHERE curriculum_id = ? AND lesson_index = ? AND status IN ('queued', 'leased')
+            """, (curriculum_id, lesson_index)) as cursor:
+                return {(row[0], row[1]) for row in await cursor.fetchall()}
+
+    async def renew(self, curriculum_id: str) -> int:
+        """Extend this worker's leases on a curriculum's units. Returns leases renewed."""
+        async with connect(self.db_path) as conn:
+            async with conn.execute("""
+                UPDATE generation_units SET lease_expires_at = ?
+                WHERE curriculum_id = ? AND status = 'leased' AND lease_owner = ?
+            """, (time.time() + self.lease_seconds, curriculum_id, self.worker_id)) as cursor:
+                renewed = cursor.rowcount
+            await conn.commit()
+        return renewed
+
+    async def complete(self, units: List[Unit], items: List[Dict[str, Any]], error: str = "Generation failed") -> int:
+        """Save generated content and settle its units in one transaction.
+
+        items are learning content rows (see db.save_learning_content_many).
+        Claimed units without an item are retried until they run out of
+        attempts. Content for a unit this worker no longer holds (its lease
+        expired and someone else took it) is dropped rather than saved twice.
+        Returns units done.
+        """
+        if not units:
+            return 0
+        now = time.time()
+        by_unit = {(item['lesson_index'], item['content_type']): item for item in items}
+        curriculum_id = units[0].curriculum_id
+        async with connect(self.db_path) as conn:
+            async with conn.execute("""
+                SELECT lesson_index, content_type FROM generation_units
+                WHERE curriculum_id = ? AND status = 'leased' AND lease_owner = ?
+            """, (curriculum_id, self.worker_id)) as cursor:
+                held = {tuple(row) for row in await cursor.fetchall()}
+            claimed = [unit for unit in units if (unit.lesson_index, unit.content_type) in held]
+            done = [unit for unit in claimed if (unit.lesson_index, unit.content_type) in by_unit]
+            missing = [unit for unit in claimed if (unit.lesson_index, unit.content_type) not in by_unit]
+
+            await db.insert_learning_content(conn, [by_unit[(unit.lesson_index, unit.content_type)] for unit in done])
+            await conn.executemany("""
+                UPDATE generation_units
+                SET status = 'done', lease_owner = NULL, lease_expires_at = NULL, last_error = NULL, finished_at = ?
+                WHERE curriculum_id = ? AND lesson_index = ? AND content_type = ?
+            """, [(now, unit.curriculum_id, unit.lesson_index, unit.content_type) for unit in done])
+            if done:
+                # Time to first usable lesson: the first time any lesson has every content type
+                await conn.execute("""
+                    UPDATE generation_jobs SET first_lesson_ready_at = ?
+                    WHERE curriculum_id = ? AND first_lesson_ready_at IS NULL
+                    AND EXISTS (
+                        SELECT 1 FROM generation_units WHERE curriculum_id = ?
+                        GROUP BY lesson_index HAVING SUM(status != 'done') = 0
+                    )
+                """, (now, curriculum_id, curriculum_id))
+            await conn.executemany("""
+                UPDATE generation_units
+                SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                    lease_owner = NULL, lease_expires_at = NULL, last_error = ?,
+                    finished_at = CASE WHEN attempts >= ? THEN ? END
+                WHERE curriculum_id = ? AND lesson_index = ? AND content_type = ?
+            """, [
+                (self.max_attempts, error, self.max_attempts, now, unit.curriculum_id, unit.lesson_index, unit.content_type)
+                for unit in missing
+            ])
+            await conn.commit()
+
+        gave_up = sum(1 for unit in missing if unit.attempts >= self.max_attempts)
+        self.counts["done"] += len(done)
+        self.counts["failed"] += gave_up
+        self.counts["retried"] += len(missing) - gave_up
+        if len(claimed) < len(units):
+            logger.warning(f"Lost the lease on {len(units) - len(claimed)} unit(s) of curriculum {curriculum_id}")
+        return len(done)
+
+    async def release(self, curriculum_id: str, charge_attempt: bool = False) -> int:
+        """Hand this worker's leased units of a curriculum back to the queue.
+
+        At shutdown the interrupted claim isn't the unit's fault and is given
+        back; after a deadline it counts, so a unit that always hangs ends up
+        failed instead of being retried forever. Returns units released.
+        """
+        now = time.time()
+        async with connect(self.db_path) as conn:
+            if charge_attempt:
+                async with conn.execute("""
+                    UPDATE generation_units
+                    SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                        lease_owner = NULL, lease_expires_at = NULL, last_error = 'Exceeded the generation deadline',
+                        finished_at = CASE WHEN attempts >= ? THEN ? END
+                    WHERE curriculum_id = ? AND status = 'leased' AND lease_owner = ?
+                    RETURNING status
+                """, (self.max_attempts, self.max_attempts, now, curriculum_id, self.worker_id)) as cursor:
+                    statuses = [row[0] for row in await cursor.fetchall()]
+                released = len(statuses)
+                self.counts["failed"] += statuses.count('failed')
+            else:
+                async with conn.execute("""
+                    UPDATE generation_units
+                    SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL, attempts = MAX(attempts - 1, 0)
+                    WHERE curriculum_id = ? AND status = 'leased' AND lease_owner = ?
+                """, (curriculum_id, self.worker_id)) as cursor:
+                    released = cursor.rowcount
+            await conn.commit()
+        return released
+
+    async def cancel(self, curriculum_id: str, reason: str = "cancelled") -> bool:
+        """Cancel an open job and its unfinished units; False if the curriculum has no open job"""
+        now = time.time()
+        async with connect(self.db_path) as conn:
+            async with conn.execute("""
+                UPDATE generation_jobs SET status = 'cancelled', finished_at = ?, error = ?
+                WHERE curriculum_id = ? AND status IN ('queued', 'running')
+            """, (now, reason, curriculum_id)) as cursor:
+                cancelled = cursor.rowcount > 0
+            async with conn.execute("""
+                UPDATE generation_units
+                SET status = 'cancelled', lease_owner = NULL, lease_expires_at = NULL, last_error = ?
+                WHERE curriculum_id = ? AND status IN ('queued', 'leased')
+            """, (reason, curriculum_id)) as cursor:
+                units_cancelled = cursor.rowcount
+            await conn.commit()
+        self.counts["cancelled"] += units_cancelled
+        return cancelled
+
+    async def finish_job(self, curriculum_id: str) -> Optional[str]:
+        """Close a job once none of its units are pending. Returns the job's status, or None while units remain."""
+        now = time.time()
+        async with connect(self.db_path) as conn:
+            async with conn.execute("""
+                SELECT status, COUNT(*) FROM generation_units WHERE curriculum_id = ? GROUP BY status
+            """, (curriculum_id,)) as cursor:
+                units = {status: count for status, count in await cursor.fetchall()}
+            if units.get('queued') or units.get('leased'):
+                return None
+            failed = units.get('failed', 0)
+            status = 'failed' if failed else 'completed'
+            error = f"{failed} unit(s) failed after {self.max_attempts} attempts" if failed else None
+            await conn.execute("""
+                UPDATE generation_jobs SET status = ?, finished_at = ?, error = ?
+                WHERE curriculum_id = ? AND status IN ('queued', 'running')
+            """, (status, now, error, curriculum_id))
+            await conn.commit()
+        return status
+
+    async def get_job(self, curriculum_id: str) -> Optional[Dict[str, Any]]:
+        """A job with its unit counts by status"""
+        async with connect(self.db_path) as conn:
+            conn.row_factory = aiosqlite.Row
+            async with conn.execute(
+                "SELECT * FROM generation_jobs WHERE curriculum_id = ?", (curriculum_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return None
+            async with conn.execute("""
+                SELECT status, COUNT(*) FROM generation_units WHERE curriculum_id = ? GROUP BY status
+            """, (curriculum_id,)) as cursor:
+                units = {status: count for status, count in await cursor.fetchall()}
+        return {**dict(row), "units": units}
+
+    async def stats(self) -> Dict[str, Any]:
+        """Queue depth, age of the oldest waiting job and recent throughput"""
+        now = time.time()
+        async with connect(self.db_path) as conn:
+            async with conn.execute("SELECT status, COUNT(*) FROM generation_jobs GROUP BY status") as cursor:
+                jobs = {status: count for status, count in await cursor.fetchall()}
+            async with conn.execute("SELECT status, COUNT(*) FROM generation_units GROUP BY status") as cursor:
+                units = {status: count for status, count in await cursor.fetchall()}
+            async with conn.execute("""
+                SELECT MIN(enqueued_at) FROM generation_jobs WHERE status IN ('queued', 'running')
+            """) as cursor:
+                oldest = (await cursor.fetchone())[0]
+            async with conn.execute("""
+                SELECT SUM(finished_at >= ?), COUNT(*) FROM generation_units
+                WHERE status = 'done' AND finished_at >= ?
+            """, (now - 60, now - 300)) as cursor:
+                last_minute, last_5_minutes = await cursor.fetchone()
+            # Units of lazily generated curricula nobody has asked for (yet)
+            async with conn.execute("""
+                SELECT
+                    SUM(unqueued),
+                    SUM(unqueued * 1.0 / MAX(COALESCE(lessons_per_call, ?), 1))
+                FROM (
+                    SELECT j.lessons_per_call, j.expected_units - COUNT(u.curriculum_id) AS unqueued
+                    FROM generation_jobs j
+                    LEFT JOIN generation_units u ON u.curriculum_id = j.curriculum_id
+                    GROUP BY j.curriculum_id
+                )
+            """, (LESSONS_PER_CALL,)) as cursor:
+                not_generated, calls_avoided = await cursor.fetchone()
+            async with conn.execute("""
+                SELECT first_lesson_ready_at - enqueued_at FROM generation_jobs
+                WHERE first_lesson_ready_at IS NOT NULL
+                ORDER BY enqueued_at DESC
+                LIMIT ?
+            """, (FIRST_LESSON_SAMPLES,)) as cursor:
+                first_lesson = sorted(row[0] for row in await cursor.fetchall())
+        return {
+            "worker_id": self.worker_id,
+            "lease_s": self.lease_seconds,
+            "jobs": jobs,
+            "units": units,
+            # Units still to be generated, whether waiting or in progress
+            "depth": units.get('queued', 0) + units.get('leased', 0),
+            "oldest_open_job_age_s": round(now - oldest, 1) if oldest is not None else None,
+            "units_done_last_minute": last_minute or 0,
+            "units_per_minute_5m": round((last_5_minutes or 0) / 5, 2),
+            "units_not_generated": not_generated or 0,
+            # One call per unit, or per lessons_per_call units when batching
+            "generation_calls_avoided": round(calls_avoided or 0),
+            # Seconds from queuing a curriculum to its first lesson having all content, over recent jobs
+            "time_to_first_lesson_s": {
+                "samples": len(first_lesson),
+                "p50": round(first_lesson[len(first_lesson) // 2], 2) if first_lesson else None,
+                "p95": round(first_lesson[int(len(first_lesson) * 0.95)], 2) if first_lesson else None,
+                "max": round(first_lesson[-1], 2) if first_lesson else None
+            },
+            **self.counts
+        }
+
+
+job_queue = JobQueue()
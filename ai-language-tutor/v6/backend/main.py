@@ -8,6 +8,14 @@ from backend.db import db
 from backend.db_init import db_initializer
 from backend.content_generator import content_generator
 from backend.db_cache import api_cache
+from backend.utils.rate_limiter import limiter
+from backend.utils.retry import retry_policy
+from backend.utils.lesson_batches import batch_stats
+from backend.utils.token_usage import usage_recorder, usage_scope
+from backend.utils.content_validation import content_validator
+from backend.utils.task_registry import task_registry
+from backend.job_queue import job_queue
+from backend.generation_worker import generation_worker
 from typing import Union, List, Literal, Optional
 from datetime import datetime
 import logging
@@ -52,6 +60,8 @@ async def startup_event():
         health = init_result["health_check"]
         if health.get("record_count"):
             logging.info(f"Database records: {health['record_count']}")
+        if health.get("pragmas"):
+            logging.info(f"SQLite settings: {health['pragmas']['effective']}")
     else:
         logging.error(f"Database initialization failed: {init_result['errors']}")
         # Try to repair
@@ -63,6 +73,35 @@ async def startup_event():
             logging.error(f"Database repair failed: {repair_result['errors']}")
             raise RuntimeError("Failed to initialize database")
 
+    # Preload the in-process API cache with the most recent entries
+    try:
+        await api_cache.warm_l1()
+    except Exception as e:
+        logging.warning(f"API cache warm-up skipped: {e}")
+
+    # Expire, trim and vacuum the api_cache table in the background
+    api_cache.start_maintenance()
+
+    # Open LLM connections now so the first generations skip the TCP/TLS handshakes
+    try:
+        await generate_completions.llm_backend.prewarm()
+    except Exception as e:
+        logging.warning(f"LLM connection prewarm skipped: {e}")
+
+    # Resume content generation interrupted by a crash or restart, then start draining the queue
+    await job_queue.recover()
+    generation_worker.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop taking queued jobs, hand running ones back to the queue, stop maintenance and close LLM connections"""
+    await generation_worker.stop()
+    await task_registry.shutdown()
+    await api_cache.stop_maintenance()
+    await generate_completions.llm_backend.aclose()
+    # Usage of generations cancelled above is still buffered
+    await usage_recorder.flush()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the AI Language Tutor API v2.0!"}
@@ -86,6 +125,17 @@ async def health_check():
                 "status": "healthy" if is_healthy else "unhealthy",
                 "api_version": "2.0.0",
                 "database": db_health,
+                "api_cache": api_cache.stats(),
+                "llm_limiter": limiter.stats(),
+                "llm_retries": retry_policy.stats(),
+                "llm_backend": generate_completions.llm_backend.stats(),
+                "llm_http_pool": generate_completions.llm_backend.http_pool_stats(),
+                "lesson_batches": batch_stats.stats(),
+                "llm_usage": usage_recorder.stats(),
+                "content_validation": content_validator.stats(),
+                "generations": task_registry.stats(),
+                "generation_queue": await job_queue.stats(),
+                "content_generation": content_generator.stats(),
                 "timestamp": datetime.now().isoformat()
             },
             status_code=200 if is_healthy else 503
@@ -128,6 +178,106 @@ async def repair_database():
             status_code=500
         )
 
+@app.post("/admin/cache/maintenance")
+async def run_cache_maintenance():
+    """Expire and trim api_cache rows now and report what was reclaimed (admin endpoint)"""
+    try:
+        report = await api_cache.run_maintenance()
+        return JSONResponse(
+            content={
+                "success": True,
+                "report": report,
+                "timestamp": datetime.now().isoformat()
+            },
+            status_code=200
+        )
+    except Exception as e:
+        return JSONResponse(
+            content={
+                "success": False,
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            },
+            status_code=500
+        )
+
+@app.get("/admin/generations")
+async def list_generations():
+    """In-flight and recently finished background generations (admin endpoint)"""
+    return JSONResponse(
+        content={
+            **task_registry.list(),
+            "timestamp": datetime.now().isoformat()
+        },
+        status_code=200
+    )
+
+@app.post("/admin/generations/{curriculum_id}/cancel")
+async def cancel_generation(
+    curriculum_id: str = Path(..., description="Curriculum ID")
+):
+    """Cancel the running or queued content generation of a curriculum (admin endpoint)"""
+    # A running job cancels its own queue entry as it unwinds
+    if not task_registry.cancel(curriculum_id, reason="admin"):
+        if not await job_queue.cancel(curriculum_id, "Cancelled by admin"):
+            raise HTTPException(status_code=404, detail="No generation running or queued for this curriculum")
+        await db.update_content_generation_status(
+            curriculum_id=curriculum_id,
+            status='failed',
+            error_message="Content generation was cancelled"
+        )
+    return JSONResponse(
+        content={
+            "success": True,
+            "curriculum_id": curriculum_id,
+            "timestamp": datetime.now().isoformat()
+        },
+        status_code=200
+    )
+
+@app.post("/admin/generations/resume")
+async def resume_generations(
+    include_cancelled: bool = Query(False, description="Also resume generations an admin cancelled"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of curricula to resume")
+):
+    """Queue the missing content of every failed or stuck curriculum (admin endpoint)
+
+    Stuck means the curriculum isn't fully generated and no job is queued or
+    running for it. Only lessons and content types without content are
+    generated again.
+    """
+    job_statuses = ('failed', 'cancelled') if include_cancelled else ('failed',)
+    resumed = []
+    unchanged = []
+    for curriculum in await db.get_incomplete_curricula(job_statuses, limit):
+        units = await content_generator.enqueue_content_generation(curriculum['curriculum_id'])
+        if units:
+            # Back in the queue; the worker sets 'generating' when it picks the job up
+            await db.update_content_generation_status(curriculum_id=curriculum['curriculum_id'], status='pending')
+            resumed.append({**curriculum, "units_queued": units})
+        else:
+            # Fully generated (now marked as such), lazy and waiting for learners, or unreadable
+            unchanged.append(curriculum['curriculum_id'])
+    return JSONResponse(
+        content={
+            "resumed": resumed,
+            "unchanged": unchanged,
+            "timestamp": datetime.now().isoformat()
+        },
+        status_code=200
+    )
+
+@app.get("/admin/generation-queue")
+async def get_generation_queue():
+    """Generation queue depth and throughput (admin endpoint)"""
+    return JSONResponse(
+        content={
+            **await job_queue.stats(),
+            "timestamp": datetime.now().isoformat()
+        },
+        status_code=200
+    )
+
 @app.post("/admin/database/recreate")
 async def recreate_database():
     """Recreate database from scratch (admin endpoint)"""
@@ -161,82 +311,86 @@ async def extract_metadata(data: MetadataRequest):
     """Extract language learning metadata from user query"""
     logging.info(f"Extracting metadata for query: {data.query[:50]}...")
     try:
-        # Generate metadata using AI, with caching (include user context)
-        metadata_dict = await api_cache.get_or_set(
-            category="metadata",
-            key_text=data.query,
-            coro=generate_completions.get_completions,
-            context={
-                'user_id': data.user_id
-            },
-            prompt=data.query,
-            instructions=config.language_metadata_extraction_prompt
-        )
-
-        # Check for existing curriculum first before creating new metadata extraction
-        existing_curriculum = await db.find_existing_curriculum(
-            query=data.query,
-            native_language=metadata_dict['native_language'],
-            target_language=metadata_dict['target_language'],
-            proficiency=metadata_dict['proficiency'],
-            user_id=data.user_id  # Use the actual user_id for consistent lookup
-        )
-
-        if existing_curriculum:
-            # Found existing curriculum - return it regardless of user
-            logging.info(f"Found existing curriculum for query '{data.query[:50]}...': {existing_curriculum['id']}")
-            return JSONResponse(
-                content={
-                    "message": "Found existing curriculum for your query.",
-                    "curriculum_id": existing_curriculum['id'],
-                    "status_endpoint": f"/content/status/{existing_curriculum['id']}",
-                    "cached": True
+        # Attribute the metadata, curriculum and content calls to the resulting curriculum
+        with usage_scope(content_type="metadata") as usage:
+            # Generate metadata using AI, with caching (include user context)
+            metadata_dict = await api_cache.get_or_set(
+                category="metadata",
+                key_text=data.query,
+                coro=generate_completions.get_completions,
+                context={
+                    'user_id': data.user_id
                 },
-                status_code=200
+                prompt=data.query,
+                instructions=config.language_metadata_extraction_prompt
             )
 
-        # No suitable existing curriculum found, generate new one
-        logging.info(f"No existing curriculum found, generating new one for user {data.user_id}")
-        
-        # Save metadata to database
-        extraction_id = await db.save_metadata_extraction(
-            query=data.query,
-            metadata=metadata_dict,
-            user_id=data.user_id
-        )
+            # Check for existing curriculum first before creating new metadata extraction
+            existing_curriculum = await db.find_existing_curriculum(
+                query=data.query,
+                native_language=metadata_dict['native_language'],
+                target_language=metadata_dict['target_language'],
+                proficiency=metadata_dict['proficiency'],
+                user_id=data.user_id  # Use the actual user_id for consistent lookup
+            )
+
+            if existing_curriculum:
+                # Found existing curriculum - return it regardless of user
+                logging.info(f"Found existing curriculum for query '{data.query[:50]}...': {existing_curriculum['id']}")
+                usage["curriculum_id"] = existing_curriculum['id']
+                return JSONResponse(
+                    content={
+                        "message": "Found existing curriculum for your query.",
+                        "curriculum_id": existing_curriculum['id'],
+                        "status_endpoint": f"/content/status/{existing_curriculum['id']}",
+                        "cached": True
+                    },
+                    status_code=200
+                )
 
-        # Process extraction (generate curriculum and start content generation)
-        try:
-            processing_result = await content_generator.process_metadata_extraction(
-                extraction_id=extraction_id,
+            # No suitable existing curriculum found, generate new one
+            logging.info(f"No existing curriculum found, generating new one for user {data.user_id}")
+        
+            # Save metadata to database
+            extraction_id = await db.save_metadata_extraction(
                 query=data.query,
                 metadata=metadata_dict,
-                user_id=data.user_id,
-                generate_content=True,  # Automatically generate all content
-                skip_curriculum_lookup=True  # Skip lookup since we already did it above
+                user_id=data.user_id
             )
 
-            curriculum_id = processing_result['curriculum_id']
-            
-            # Update status to generating
-            await db.update_content_generation_status(curriculum_id, 'generating')
+            # Process extraction (generate curriculum and start content generation)
+            try:
+                processing_result = await content_generator.process_metadata_extraction(
+                    extraction_id=extraction_id,
+                    query=data.query,
+                    metadata=metadata_dict,
+                    user_id=data.user_id,
+                    generate_content=True,  # Automatically generate all content
+                    skip_curriculum_lookup=True  # Skip lookup since we already did it above
+                )
 
-            return JSONResponse(
-                content={
-                    "message": "Content generation has been initiated.",
-                    "curriculum_id": curriculum_id,
-                    "status_endpoint": f"/content/status/{curriculum_id}",
-                    "cached": False
-                },
-                status_code=202
-            )
-        except Exception as content_error:
-            # If content generation fails, update status to failed
-            if 'curriculum_id' in locals():
-                await db.update_content_generation_status(
-                    curriculum_id, 'failed', str(content_error)
+                curriculum_id = processing_result['curriculum_id']
+                usage["curriculum_id"] = curriculum_id
+            
+                # Update status to generating
+                await db.update_content_generation_status(curriculum_id, 'generating')
+
+                return JSONResponse(
+                    content={
+                        "message": "Content generation has been initiated.",
+                        "curriculum_id": curriculum_id,
+                        "status_endpoint": f"/content/status/{curriculum_id}",
+                        "cached": False
+                    },
+                    status_code=202
                 )
-            raise content_error
+            except Exception as content_error:
+                # If content generation fails, update status to failed
+                if 'curriculum_id' in locals():
+                    await db.update_content_generation_status(
+                        curriculum_id, 'failed', str(content_error)
+                    )
+                raise content_error
     except Exception as e:
         logging.error(f"Error extracting metadata: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -275,6 +429,21 @@ async def get_curriculum(curriculum_id: str = Path(..., description="Curriculum
     
     return JSONResponse(content=curriculum, status_code=200)
 
+@app.get("/curriculum/{curriculum_id}/usage")
+async def get_curriculum_usage(
+    curriculum_id: str = Path(..., description="Curriculum ID")
+):
+    """LLM token usage of a curriculum: totals, per content type and per lesson"""
+    curriculum = await db.get_curriculum(curriculum_id)
+    if not curriculum:
+        raise HTTPException(status_code=404, detail="Curriculum not found")
+    
+    # Include records that are still buffered in memory
+    await usage_recorder.flush()
+    usage = await db.get_curriculum_usage(curriculum_id)
+    
+    return JSONResponse(content=usage, status_code=200)
+
 @app.get("/content/status/{curriculum_id}")
 async def get_content_generation_status(curriculum_id: str = Path(..., description="Curriculum ID")):
     """Get content generation status for a curriculum"""
@@ -288,10 +457,15 @@ async def get_content_generation_status(curriculum_id: str = Path(..., descripti
         "error": status['content_generation_error'],
         "started_at": status['content_generation_started_at'],
         "completed_at": status['content_generation_completed_at'],
-        "is_content_generated": bool(status['is_content_generated'])
+        "is_content_generated": bool(status['is_content_generated']),
+        # Queue state (units done/queued/failed); None for curricula generated without the queue
+        "generation_job": await job_queue.get_job(curriculum_id)
     }, status_code=200)
 
 
+# Seconds a client is told to wait before asking again for content that is still being generated
+LESSON_RETRY_AFTER = 5
+
 async def _get_lesson_content_by_type(
     curriculum_id: str,
     lesson_index: int,
@@ -304,11 +478,33 @@ async def _get_lesson_content_by_type(
         content_type=content_type
     )
     if not content_list:
+        # Lazy generation: a lesson nobody has opened yet is queued on first request
+        if content_generator.mode == "lazy":
+            try:
+                await content_generator.request_lesson(curriculum_id, lesson_index)
+            except Exception as e:
+                # The lesson may already be queued; answer from the queue below either way
+                logging.error(f"Failed to queue lesson {lesson_index} of curriculum {curriculum_id}: {e}")
+        # Still queued or being generated: move it to the front and ask the client to come back
+        if await job_queue.promote(curriculum_id, lesson_index, content_type):
+            return JSONResponse(
+                content={
+                    "curriculum_id": curriculum_id,
+                    "lesson_index": lesson_index,
+                    "content_type": content_type,
+                    "status": "generating",
+                    "status_endpoint": f"/content/status/{curriculum_id}"
+                },
+                status_code=202,
+                headers={"Retry-After": str(LESSON_RETRY_AFTER)}
+            )
         raise HTTPException(
             status_code=404,
             detail=f"{content_type.capitalize()} content not found for lesson {lesson_index}"
         )
 
+    await content_generator.on_lesson_fetched(curriculum_id, lesson_index)
+
     # Assuming one content item per type per lesson
     content = content_list[0]
     try:
@@ -1,5 +1,8 @@
 -- AI Language Tutor Database Schema
 
+-- Let the api_cache maintenance task reclaim free pages with PRAGMA incremental_vacuum
+PRAGMA auto_vacuum = INCREMENTAL;
+
 -- Table for storing extracted metadata from user queries
 CREATE TABLE IF NOT EXISTS metadata_extractions (
     id TEXT PRIMARY KEY DEFAULT (lower(hex(randomblob(16)))),
@@ -107,4 +110,59 @@ CREATE TABLE IF NOT EXISTS api_cache (
 ) WITHOUT ROWID;
 
 -- Index for faster cache lookups
-CREATE INDEX IF NOT EXISTS idx_api_cache_key_category ON api_cache(cache_key, category);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_api_cache_key_category ON api_cache(cache_key, category);
+
+-- Index for age- and size-based expiry of cache rows
+CREATE INDEX IF NOT EXISTS idx_api_cache_category_created ON api_cache(category, created_at);
+
+-- Token usage of every LLM call, attributed to the curriculum, content type and lesson it was made for.
+-- No foreign key: what a deleted curriculum cost is still worth keeping.
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    curriculum_id TEXT,
+    content_type TEXT,
+    lesson_index INTEGER, -- NULL for calls not tied to one lesson (curriculum, batched calls)
+    model TEXT,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    cached_tokens INTEGER, -- Prompt tokens served from the provider's prefix cache
+    total_tokens INTEGER,
+    latency_ms REAL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Index for per-curriculum usage aggregation
+CREATE INDEX IF NOT EXISTS idx_llm_usage_curriculum ON llm_usage(curriculum_id, content_type);
+
+-- Durable content generation: one job per curriculum, one unit per lesson and content type.
+-- Times used for leases and throughput are unix epoch seconds (REAL) so they compare cheaply.
+CREATE TABLE IF NOT EXISTS generation_jobs (
+    curriculum_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK(status IN ('queued', 'running', 'completed', 'failed', 'cancelled')),
+    lessons_per_call INTEGER, -- NULL: use the worker's default
+    expected_units INTEGER, -- Full lesson x content type grid; fewer units are queued in lazy mode
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT,
+    first_lesson_ready_at REAL, -- When the first lesson had all of its content types
+    FOREIGN KEY (curriculum_id) REFERENCES curricula(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS generation_units (
+    curriculum_id TEXT NOT NULL,
+    lesson_index INTEGER NOT NULL,
+    content_type TEXT NOT NULL CHECK(content_type IN ('flashcards', 'exercises', 'simulation')),
+    status TEXT NOT NULL DEFAULT 'queued' CHECK(status IN ('queued', 'leased', 'done', 'failed', 'cancelled')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    priority INTEGER NOT NULL DEFAULT 0, -- Higher is generated sooner; raised when a user asks for the lesson
+    lease_owner TEXT, -- Worker holding the unit while status = 'leased'
+    lease_expires_at REAL, -- An expired lease makes the unit claimable again
+    last_error TEXT,
+    finished_at REAL,
+    PRIMARY KEY (curriculum_id, lesson_index, content_type),
+    FOREIGN KEY (curriculum_id) REFERENCES generation_jobs(curriculum_id) ON DELETE CASCADE
+);
+
+-- Index for queue depth and throughput queries
+CREATE INDEX IF NOT EXISTS idx_generation_units_status ON generation_units(status, finished_at);
@@ -0,0 +1,418 @@
+"""
+Content Validation
+Generated curricula, flashcards, exercises and stories are checked against
+the pydantic models of dspy_app.py before they are cached or saved. Output
+that doesn't parse first goes through a cheap local repair pass (code fences,
+surrounding prose, trailing commas, truncated arrays); list items that still
+fail validation are dropped and only those are requested again, instead of
+regenerating the whole document. Validation outcomes are counted per content
+type.
+"""
+
+import json
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+logger = logging.getLogger(__name__)
+
+# learning_content.lesson_index is limited to 0-24 by the schema
+MAX_LESSONS = 25
+
+
+class ContentValidationError(ValueError):
+    """Generated content could not be parsed or repaired into a valid document"""
+
+
+# Models mirror dspy_app.py (which configures an LM at import, so it can't be
+# imported here). Per-item rules are the same; list lengths are only bounded,
+# since the app's prompts and dspy_app's signatures ask for different counts.
+
+class SubTopic(BaseModel):
+    sub_topic: str = Field(description="Clear and practical lesson title in native language")
+    keywords: List[str] = Field(description="1-3 high-level categories describing the lesson focus in native language", min_length=1, max_length=3)
+    description: str = Field(description="One sentence explaining what the learner will achieve after completing the lesson, in native language")
+
+
+class Curriculum(BaseModel):
+    lesson_topic: str = Field(description="Overall learning theme in native language")
+    sub_topics: List[SubTopic] = Field(description="Lessons of the curriculum", min_length=1, max_length=MAX_LESSONS)
+
+
+class Exercise(BaseModel):
+    sentence: str = Field(description="Fully contextualized sentence in target language containing one blank (___)")
+    answer: str = Field(description="Single correct fill-in word/phrase in target language")
+    choices: List[str] = Field(description="List of four total options in randomized order, all in target language", min_length=4, max_length=4)
+    explanation: str = Field(description="Concise 1-2 sentence rationale written entirely in the native language")
+
+    @field_validator('sentence')
+    @classmethod
+    def validate_sentence_has_blank(cls, v):
+        if v.count('___') != 1:
+            raise ValueError('Sentence must contain exactly one blank (___)')
+        return v
+
+
+class Flashcard(BaseModel):
+    word: str = Field(description="Key word or phrase in target language drawn from the lesson")
+    definition: str = Field(description="Learner-friendly explanation in native language")
+    example: str = Field(description="Clear, natural sentence in target language demonstrating the word in context with the lesson")
+
+
+class StorySegment(BaseModel):
+    speaker: str = Field(description="Named or role-based character label in native language")
+    target_language_text: str = Field(description="Sentence or dialogue line in target language")
+    base_language_translation: str = Field(description="Simple, clear translation in native language")
+
+
+class Story(BaseModel):
+    title: str = Field(description="Engaging title in native language")
+    setting: str = Field(description="Brief setup paragraph in native language explaining the story's background and relevance")
+    content: List[StorySegment] = Field(description="Story segments", min_length=1)
+
+
+class ContentSpec(NamedTuple):
+    key: str                             # list the items live in
+    item: Type[BaseModel]                # model every item must satisfy
+    document: Optional[Type[BaseModel]]  # model for the whole object, if the content is one
+    noun: str                            # how replacement prompts refer to the items
+    max_items: Optional[int] = None
+
+
+CONTENT_SPECS: Dict[str, ContentSpec] = {
+    "curriculum": ContentSpec("sub_topics", SubTopic, Curriculum, "sub_topics entries", MAX_LESSONS),
+    "flashcards": ContentSpec("flashcards", Flashcard, None, "flashcards"),
+    "exercises": ContentSpec("exercises", Exercise, None, "exercises"),
+    "simulation": ContentSpec("content", StorySegment, Story, "story segments (\"content\" entries)"),
+}
+
+# Appended after the (static) mode instructions so the shared prefix stays identical
+REPLACEMENT_MARKER = "# Replacement items"
+REPLACEMENT_INSTRUCTIONS = """
+
+{marker}
+Some {noun} generated for the input in the user message were invalid and have been removed.
+The user message also lists the ones that were kept and why the others were rejected.
+Generate exactly {count} new {noun} following the format described above, different from the kept ones.
+Return a single JSON object of the form {{"items": [...]}} containing only the new entries.
+"""
+
+CODE_FENCE = re.compile(r"```(?:json)?\s*(.*?)\s*(?:```|\Z)", re.DOTALL | re.IGNORECASE)
+
+
+# ---------- Local repair ----------
+
+def _strip_trailing_commas(text: str) -> str:
+    """Remove commas directly before a closing bracket, outside of strings"""
+    out: List[str] = []
+    in_string = escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "}]":
+            end = len(out) - 1
+            while end >= 0 and out[end].isspace():
+                end -= 1
+            if end >= 0 and out[end] == ",":
+                del out[end]
+        out.append(ch)
+    return "".join(out)
+
+
+def _close_truncated(text: str) -> Optional[str]:
+    """Cut a document back to its last complete object or array and close what is still open.
+
+    A response cut off mid-list keeps every element that was finished. Text after
+    a complete top-level value (trailing prose) is dropped too.
+    """
+    closers: List[str] = []
+    in_string = escaped = False
+    cut: Optional[str] = None
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if not closers or closers.pop() != ch:
+                return None
+            if not closers:
+                return text[:i + 1]
+            cut = text[:i + 1] + "".join(reversed(closers))
+    return cut
+
+
+def parse_json(text: str) -> Tuple[Any, bool]:
+    """Parse an LLM response, repairing it locally if needed. Returns (document, repaired)."""
+    try:
+        return json.loads(text), False
+    except (TypeError, json.JSONDecodeError):
+        if not isinstance(text, str):
+            raise ContentValidationError(f"Expected a JSON string, got {type(text).__name__}")
+
+    fenced = CODE_FENCE.search(text)
+    # A stray fence after the document leaves nothing inside it
+    candidate = fenced.group(1) if fenced and fenced.group(1).strip() else text
+    # Skip any prose before the document
+    starts = [position for position in (candidate.find("{"), candidate.find("[")) if position >= 0]
+    if not starts:
+        raise ContentValidationError("Response contains no JSON object or array")
+    candidate = _strip_trailing_commas(candidate[min(starts):])
+
+    for repaired in (candidate, _close_truncated(candidate)):
+        if repaired is None:
+            continue
+        try:
+            return json.loads(repaired), True
+        except json.JSONDecodeError:
+            continue
+    raise ContentValidationError("Response is not valid JSON and could not be repaired")
+
+
+# ---------- Validation ----------
+
+def _locate_items(content_type: str, document: Any) -> Optional[Tuple[Optional[str], List[Any]]]:
+    """(key, items) of the content's item list; key is None for a bare array"""
+    key = CONTENT_SPECS[content_type].key
+    if CONTENT_SPECS[content_type].document is not None:
+        if isinstance(document, dict) and isinstance(document.get(key), list):
+            return key, document[key]
+        return None
+    if isinstance(document, list):
+        return None, document
+    if isinstance(document, dict):
+        # The prompts ask for a bare array, which json_object mode wraps under some key
+        if isinstance(document.get(key), list):
+            return key, document[key]
+        lists = [(name, value) for name, value in document.items() if isinstance(value, list)]
+        if len(lists) == 1:
+            return lists[0]
+    return None
+
+
+def _first_error(error: ValidationError) -> str:
+    detail = error.errors()[0]
+    location = ".".join(str(part) for part in detail["loc"])
+    return f"{location}: {detail['msg']}" if location else detail["msg"]
+
+
+class CheckedContent:
+    """One response checked against its content type: kept items, rejected items, and why"""
+
+    def __init__(
+        self,
+        content_type: str,
+        document: Any = None,
+        key: Optional[str] = None,
+        items: Optional[List[Any]] = None,
+        repaired: bool = False,
+        error: Optional[str] = None
+    ):
+        self.content_type = content_type
+        self.document = document
+        self.key = key
+        # Items in their original positions, None where one was rejected
+        self.items: List[Any] = items or []
+        self.rejected: Dict[int, str] = {}
+        self.repaired = repaired
+        self.error = error
+
+    @property
+    def valid(self) -> bool:
+        """Usable as it came back from the model"""
+        return self.error is None and not self.rejected and not self.repaired
+
+    def kept(self) -> List[Any]:
+        return [item for item in self.items if item is not None]
+
+    def fill(self, replacements: List[Any]):
+        """Put replacement items into the positions of rejected ones, in order"""
+        replacements = list(replacements)
+        for position in sorted(self.rejected):
+            if not replacements:
+                break
+            self.items[position] = replacements.pop(0)
+            del self.rejected[position]
+
+    def content(self) -> Any:
+        """The document with only the kept items"""
+        items = self.kept()
+        max_items = CONTENT_SPECS[self.content_type].max_items
+        if max_items is not None:
+            items = items[:max_items]
+        if self.key is None:
+            return items
+        return {**self.document, self.key: items}
+
+
+def check_content(content_type: str, response: Any) -> CheckedContent:
+    """Parse (and locally repair) a response and validate it item by item"""
+    spec = CONTENT_SPECS[content_type]
+    if isinstance(response, str):
+        try:
+            document, repaired = parse_json(response)
+        except ContentValidationError as e:
+            return CheckedContent(content_type, error=str(e))
+    else:
+        document, repaired = response, False
+
+    located = _locate_items(content_type, document)
+    if located is None:
+        return CheckedContent(content_type, document, repaired=repaired, error=f"No {spec.key} list")
+    key, raw_items = located
+
+    checked = CheckedContent(content_type, document, key, list(raw_items), repaired)
+    for position, item in enumerate(raw_items):
+        try:
+            spec.item.model_validate(item)
+        except ValidationError as e:
+            checked.items[position] = None
+            checked.rejected[position] = _first_error(e)
+
+    if not checked.kept():
+        checked.error = f"No valid {spec.noun}"
+    elif spec.document is not None:
+        try:
+            spec.document.model_validate(checked.content())
+        except ValidationError as e:
+            checked.error = _first_error(e)
+    return checked
+
+
+class ValidationStats:
+    """Validation outcomes of the responses for one content type"""
+
+    def __init__(self):
+        self.checked = 0
+        self.valid = 0
+        self.repaired = 0
+        self.unusable = 0
+        self.items_rejected = 0
+        self.items_replaced = 0
+        self.partial_requests = 0
+        self.full_requests = 0
+        self.failed = 0
+
+    def record(self, checked: CheckedContent):
+        self.checked += 1
+        self.valid += int(checked.valid)
+        self.repaired += int(checked.repaired)
+        self.unusable += int(checked.error is not None)
+        self.items_rejected += len(checked.rejected)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "checked": self.checked,
+            "valid": self.valid,
+            # Responses that weren't usable exactly as the model returned them
+            "failure_rate": round(1 - self.valid / self.checked, 4) if self.checked else None,
+            "repaired_locally": self.repaired,
+            "unusable": self.unusable,
+            "items_rejected": self.items_rejected,
+            "items_replaced": self.items_replaced,
+            "partial_rerequests": self.partial_requests,
+            "full_rerequests": self.full_requests,
+            "failed": self.failed
+        }
+
+
+Complete = Callable[[str, str], Awaitable[str]]
+
+
+class ContentValidator:
+    """Validates generated content, repairing it locally or re-requesting only what failed"""
+
+    def __init__(self):
+        self._stats: Dict[str, ValidationStats] = {content_type: ValidationStats() for content_type in CONTENT_SPECS}
+
+    def check(self, content_type: str, response: Any) -> CheckedContent:
+        """Check and count one response (e.g. a lesson split out of a batched call)"""
+        checked = check_content(content_type, response)
+        self._stats[content_type].record(checked)
+        return checked
+
+    async def generate(self, content_type: str, prompt: str, instructions: str, complete: Complete) -> Any:
+        """Request content and return a validated document.
+
+        A response with nothing usable is requested once more in full; rejected
+        items of an otherwise usable response are re-requested on their own.
+        Raises ContentValidationError if no valid document could be produced.
+        """
+        stats = self._stats[content_type]
+        checked = self.check(content_type, await complete(prompt, instructions))
+        if checked.error is not None:
+            logger.warning(f"Unusable {content_type} response ({checked.error}), requesting it again")
+            stats.full_requests += 1
+            checked = self.check(content_type, await complete(prompt, instructions))
+            if checked.error is not None:
+                stats.failed += 1
+                raise ContentValidationError(f"Invalid {content_type} response: {checked.error}")
+
+        if checked.rejected:
+            checked.fill(await self._request_replacements(checked, prompt, instructions, complete))
+        return checked.content()
+
+    async def _request_replacements(
+        self,
+        checked: CheckedContent,
+        prompt: str,
+        instructions: str,
+        complete: Complete
+    ) -> List[Any]:
+        spec = CONTENT_SPECS[checked.content_type]
+        stats = self._stats[checked.content_type]
+        count = len(checked.rejected)
+        problems = "\n".join(f"- item {position + 1}: {error}" for position, error in sorted(checked.rejected.items()))
+        replacement_prompt = (
+            f"{prompt}\n\nKept {spec.noun}:\n{json.dumps(checked.kept(), ensure_ascii=False)}"
+            f"\n\nRejected {spec.noun}:\n{problems}"
+        )
+        replacement_instructions = instructions + REPLACEMENT_INSTRUCTIONS.format(
+            marker=REPLACEMENT_MARKER, noun=spec.noun, count=count
+        )
+
+        stats.partial_requests += 1
+        logger.info(f"Re-requesting {count} rejected {checked.content_type} item(s): {problems}")
+        try:
+            document, _ = parse_json(await complete(replacement_prompt, replacement_instructions))
+        except Exception as e:
+            # The kept items are still usable on their own
+            logger.warning(f"Replacement request for {checked.content_type} failed, keeping {len(checked.kept())} items: {e}")
+            return []
+
+        items = document.get("items") if isinstance(document, dict) else None
+        if not isinstance(items, list):
+            located = _locate_items(checked.content_type, document)
+            items = located[1] if located else []
+        replacements = []
+        for item in items:
+            try:
+                spec.item.model_validate(item)
+            except ValidationError:
+                continue
+            replacements.append(item)
+        replacements = replacements[:count]
+        stats.items_replaced += len(replacements)
+        return replacements
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {content_type: stats.stats() for content_type, stats in self._stats.items()}
+
+
+content_validator = ContentValidator()
@@ -0,0 +1,126 @@
+"""
+LLM HTTP Connection Pool
+The AsyncOpenAI client gets an explicitly configured httpx client instead of
+the library defaults: sized connection limits, long-lived keep-alive and,
+when the h2 package is installed, optional HTTP/2. Connections can be opened
+ahead of the first burst of generations (prewarm), and every request is
+traced so health checks can report pool utilization and how often a request
+had to pay for a new TCP/TLS handshake.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 50))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 20))
+KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 120))
+HTTP2 = os.getenv("LLM_HTTP2", "0").lower() in ("1", "true", "yes")
+# Connections opened by prewarm() at startup; 0 turns prewarming off
+PREWARM_CONNECTIONS = int(os.getenv("LLM_PREWARM_CONNECTIONS", 4))
+PREWARM_TIMEOUT = float(os.getenv("LLM_PREWARM_TIMEOUT", 5))
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class HttpPool:
+    """The httpx client behind an AsyncOpenAI client, with connection counters"""
+
+    def __init__(
+        self,
+        max_connections: int = MAX_CONNECTIONS,
+        max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = KEEPALIVE_EXPIRY,
+        http2: bool = HTTP2
+    ):
+        if http2 and not _http2_available():
+            logger.warning("LLM_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        # DefaultAsyncHttpxClient keeps the openai library's other defaults (redirects, timeouts)
+        self.client = DefaultAsyncHttpxClient(
+            limits=self.limits,
+            http2=http2,
+            event_hooks={"request": [self._on_request], "response": [self._on_response]}
+        )
+        self.requests = 0
+        self.responses = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.prewarmed = 0
+
+    async def _on_request(self, request: httpx.Request):
+        self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def _on_response(self, response: httpx.Response):
+        self.responses += 1
+
+    async def _trace(self, event: str, info: Dict[str, Any]):
+        # httpcore reports connection setup steps through the "trace" request extension
+        if event == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+        elif event == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+
+    async def prewarm(self, client: AsyncOpenAI, connections: int = PREWARM_CONNECTIONS) -> int:
+        """Open keep-alive connections with a few concurrent cheap requests. Returns idle connections after."""
+        if connections <= 0:
+            return 0
+        # Any response, even an error status, leaves a reusable connection behind
+        light = client.with_options(max_retries=0, timeout=PREWARM_TIMEOUT)
+        results = await asyncio.gather(*(light.models.list() for _ in range(connections)), return_exceptions=True)
+        unreachable = [r for r in results if isinstance(r, Exception) and not hasattr(r, "status_code")]
+        if unreachable:
+            logger.warning(f"LLM connection prewarm: {len(unreachable)}/{connections} requests failed: {unreachable[0]}")
+        self.prewarmed = self._connection_counts()["idle"]
+        logger.info(f"Prewarmed {self.prewarmed} LLM connection(s)")
+        return self.prewarmed
+
+    def _connection_counts(self) -> Dict[str, int]:
+        # The transport's connection pool is not public API; report zeros rather than fail
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"open": len(connections), "idle": idle, "active": len(connections) - idle}
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        counts = self._connection_counts()
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry_s": self.limits.keepalive_expiry,
+            **{f"{state}_connections": count for state, count in counts.items()},
+            "utilization": round(counts["active"] / self.limits.max_connections, 3) if self.limits.max_connections else None,
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+            "responses": self.responses,
+            # Share of answered requests that went out on an already open connection
+            "connection_reuse": (
+                round(max(0.0, 1 - self.connections_opened / self.responses), 3) if self.responses else None
+            ),
+            "prewarmed": self.prewarmed,
+            "closed": self.client.is_closed
+        }
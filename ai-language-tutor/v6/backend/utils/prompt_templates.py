@@ -0,0 +1,103 @@
+"""
+Prompt Templates
+Instruction templates from config are compiled once, at import, instead of
+being scanned by a chain of str.replace calls on every request. Compiling also
+lays the prompt out for provider-side prefix caching: the learner-specific
+metadata header moves to the end and inline placeholders become neutral
+references to it, so everything before the metadata is byte-identical for
+every request of a template. Rendered instructions are memoized per
+(template, native language, target language, proficiency), so repeated
+requests get the very same string object back and its hash is computed once
+wherever it is used as a cache-key component.
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, List
+
+from backend import config
+
+PLACEHOLDER = re.compile(r"\{(native_language|target_language|proficiency)\}")
+
+# The "# Metadata:" block the config templates start with
+METADATA_HEADER = re.compile(r"\A\s*# Metadata:[^\n]*\n(?:#[^\n]*\n)*")
+
+# (label in the metadata block, field), in the order the block lists them
+METADATA_FIELDS = [
+    ("Native language", "native_language"),
+    ("Target language", "target_language"),
+    ("Proficiency level", "proficiency"),
+]
+
+# How the static part of a template refers to each field
+NEUTRAL_REFERENCES = {
+    "native_language": "the native language",
+    "target_language": "the target language",
+    "proficiency": "the proficiency level",
+}
+
+
+class PromptTemplate:
+    """A template compiled into static instructions plus a trailing metadata block"""
+
+    __slots__ = ("name", "source", "static", "fields")
+
+    def __init__(self, name: str, source: str):
+        self.name = name
+        self.source = source
+        self.fields: List[str] = sorted(set(PLACEHOLDER.findall(source)))
+        if self.fields:
+            body = METADATA_HEADER.sub("", source, count=1)
+            self.static = PLACEHOLDER.sub(lambda match: NEUTRAL_REFERENCES[match.group(1)], body).strip()
+        else:
+            self.static = source
+
+    def render(self, native_language: str, target_language: str, proficiency: str) -> str:
+        if not self.fields:
+            return self.static
+        values = {
+            "native_language": native_language,
+            "target_language": target_language,
+            "proficiency": proficiency
+        }
+        metadata = "\n".join(f"# {label}: {values[field]}" for label, field in METADATA_FIELDS)
+        return f"{self.static}\n\n# Metadata:\n{metadata}\n"
+
+
+TEMPLATES: Dict[str, PromptTemplate] = {
+    name: PromptTemplate(name, source)
+    for name, source in {
+        "metadata": config.language_metadata_extraction_prompt,
+        "curriculum": config.curriculum_instructions,
+        "flashcards": config.flashcard_mode_instructions,
+        "exercises": config.exercise_mode_instructions,
+        "simulation": config.simulation_mode_instructions,
+    }.items()
+}
+
+_BY_SOURCE: Dict[str, PromptTemplate] = {template.source: template for template in TEMPLATES.values()}
+
+
+def get_template(template: str) -> PromptTemplate:
+    """The compiled form of a template, looked up by name or by its source text"""
+    compiled = TEMPLATES.get(template) or _BY_SOURCE.get(template)
+    if compiled is None:
+        # Not one of the config templates; compile it once and keep it
+        compiled = _BY_SOURCE[template] = PromptTemplate("custom", template)
+    return compiled
+
+
+@lru_cache(maxsize=512)
+def render_instructions(template: str, native_language: str, target_language: str, proficiency: str) -> str:
+    """Fill a template (name or source text) with the learner's metadata, memoized"""
+    return get_template(template).render(native_language, target_language, proficiency)
+
+
+def stats() -> Dict[str, int]:
+    info = render_instructions.cache_info()
+    return {
+        "templates": len(_BY_SOURCE),
+        "rendered": info.currsize,
+        "hits": info.hits,
+        "misses": info.misses
+    }
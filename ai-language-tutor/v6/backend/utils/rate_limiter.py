@@ -0,0 +1,243 @@
+"""
+LLM Rate Limiter
+Process-wide governor for calls to the completions API: caps requests in
+flight and keeps within requests-per-minute and tokens-per-minute budgets.
+Interactive requests are always admitted ahead of background generation.
+"""
+
+import asyncio
+import functools
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+# Lower rank is admitted first
+PRIORITY_RANKS = {INTERACTIVE: 0, BACKGROUND: 1}
+
+# Priority of LLM calls made from the current task; background entry points opt in
+_current_priority: ContextVar[str] = ContextVar("llm_priority", default=INTERACTIVE)
+
+
+def current_priority() -> str:
+    return _current_priority.get()
+
+
+def background_priority(func):
+    """Decorator: LLM calls made while the decorated coroutine runs queue behind interactive ones"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = _current_priority.set(BACKGROUND)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _current_priority.reset(token)
+    return wrapper
+
+
+@contextmanager
+def llm_priority(priority: str) -> Iterator[None]:
+    """LLM calls made in this block, and in tasks started from it, run at the given priority"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+# Completion tokens assumed per call until the API reports actual usage
+EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", 1024))
+
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """Rough token count for a request: ~4 characters per prompt token plus the expected completion"""
+    prompt_chars = sum(len(message.get("content") or "") for message in messages)
+    return prompt_chars // 4 + EXPECTED_COMPLETION_TOKENS
+
+
+class TokenBucket:
+    """Refills continuously up to `capacity` at `capacity` per minute"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def delay_for(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they already are)"""
+        missing = min(amount, self.capacity) - self.available()
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Correct an earlier estimate; a negative balance is repaid by future refills"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class _PriorityStats:
+    def __init__(self):
+        self.admitted = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float):
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "admitted": self.admitted,
+            "queue_depth": self.waiting,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 3) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 3)
+        }
+
+
+class RateLimiter:
+    """Admits LLM calls in priority order once a concurrency slot and budget are free.
+
+    Set rpm or tpm to 0/None to disable that budget.
+    """
+
+    def __init__(self, max_concurrency: int = 8, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.in_flight = 0
+        # Heap of [rank, sequence, tokens, future]; cancelled waiters are skipped lazily
+        self._waiters: List[list] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._stats = {priority: _PriorityStats() for priority in PRIORITY_RANKS}
+        self.throttled = 0
+
+    def _budget_delay(self, tokens: float) -> float:
+        delay = 0.0
+        if self.requests:
+            delay = max(delay, self.requests.delay_for(1))
+        if self.tokens:
+            delay = max(delay, self.tokens.delay_for(tokens))
+        return delay
+
+    def _try_admit(self, tokens: float) -> bool:
+        if self.in_flight >= self.max_concurrency or self._budget_delay(tokens) > 0:
+            return False
+        self.in_flight += 1
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(tokens)
+        return True
+
+    def _dispatch(self):
+        """Admit waiters from the head of the queue while capacity allows"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._try_admit(tokens):
+                break
+            heapq.heappop(self._waiters)
+            future.set_result(None)
+
+        # Blocked on a budget rather than a slot: nothing else will wake us, so set a timer
+        if self._waiters and self._timer is None and self.in_flight < self.max_concurrency:
+            delay = self._budget_delay(self._waiters[0][2])
+            self.throttled += 1
+            self._timer = asyncio.get_running_loop().call_later(max(delay, 0.001), self._dispatch)
+
+    async def acquire(self, priority: str = INTERACTIVE, tokens: float = 0) -> float:
+        """Wait for admission; returns the time spent queued in seconds"""
+        stats = self._stats.get(priority, self._stats[BACKGROUND])
+        started = time.monotonic()
+        if not self._waiters and self._try_admit(tokens):
+            stats.record(0.0)
+            return 0.0
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [PRIORITY_RANKS.get(priority, PRIORITY_RANKS[BACKGROUND]), next(self._sequence), tokens, future])
+        stats.waiting += 1
+        try:
+            self._dispatch()
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as we were cancelled: hand the slot to the next waiter
+                self.release()
+            else:
+                future.cancel()
+            raise
+        finally:
+            stats.waiting -= 1
+        wait = time.monotonic() - started
+        stats.record(wait)
+        return wait
+
+    def release(self, estimated_tokens: float = 0, actual_tokens: Optional[float] = None):
+        """Free the slot and reconcile the token budget with the usage the API reported"""
+        self.in_flight -= 1
+        if self.tokens and actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+        if self._waiters:
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str] = None, tokens: float = 0) -> AsyncIterator[Dict[str, Any]]:
+        """Hold a slot for one call. Set usage["total_tokens"] to reconcile the TPM budget."""
+        priority = priority or current_priority()
+        wait = await self.acquire(priority, tokens)
+        usage: Dict[str, Any] = {"priority": priority, "wait": wait, "total_tokens": None}
+        try:
+            yield usage
+        finally:
+            self.release(tokens, usage["total_tokens"])
+
+    @property
+    def queue_depth(self) -> int:
+        """Calls waiting for a slot"""
+        return sum(stats.waiting for stats in self._stats.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Return in-flight count, per-priority queue depth/wait times and remaining budgets"""
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queue_depth,
+            "priorities": {priority: stats.as_dict() for priority, stats in self._stats.items()},
+            "throttled": self.throttled,
+            "rpm": {"limit": self.requests.capacity, "available": round(self.requests.available(), 1)} if self.requests else None,
+            "tpm": {"limit": self.tokens.capacity, "available": round(self.tokens.available(), 1)} if self.tokens else None
+        }
+
+
+# Budgets for the whole process (LLM_MAX_CONCURRENCY, LLM_RPM, LLM_TPM; 0 disables a budget)
+limiter = RateLimiter(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", 8)),
+    rpm=float(os.getenv("LLM_RPM", 0)),
+    tpm=float(os.getenv("LLM_TPM", 0))
+)
@@ -0,0 +1,140 @@
+"""
+LLM Token Usage
+Records prompt, completion and cached-prompt token counts for every LLM call
+and attributes them to the curriculum, content type and lesson being
+generated. Attribution travels in a ContextVar, like the limiter priority, so
+get_completions needs no extra arguments. Records are buffered and written to
+the llm_usage table in batches.
+"""
+
+import asyncio
+import logging
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from backend.db import db
+from backend.utils.llm_backends import Completion
+
+logger = logging.getLogger(__name__)
+
+ATTRIBUTION_FIELDS = ("curriculum_id", "content_type", "lesson_index")
+
+# Buffered records are written once this many have accumulated (and on explicit flushes)
+FLUSH_SIZE = int(os.getenv("LLM_USAGE_FLUSH_SIZE", 50))
+
+
+class UsageScope:
+    """Attribution for the LLM calls made inside a usage_scope block.
+
+    Fields can be filled in after the calls were made (e.g. the curriculum_id
+    once the curriculum has been saved); records take them when the block exits.
+    """
+
+    def __init__(self, attribution: Dict[str, Any]):
+        self.attribution = attribution
+        self.records: List[Dict[str, Any]] = []
+        self.closed = False
+
+    def __setitem__(self, field: str, value: Any):
+        self.attribution[field] = value
+
+
+_current_scope: ContextVar[Optional[UsageScope]] = ContextVar("llm_usage_scope", default=None)
+
+
+@contextmanager
+def usage_scope(**attribution) -> Iterator[UsageScope]:
+    """Attribute LLM calls made in this block (and tasks it starts) to a curriculum/content type/lesson"""
+    parent = _current_scope.get()
+    inherited = dict(parent.attribution) if parent is not None else {}
+    scope = UsageScope({**inherited, **attribution})
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+        scope.closed = True
+        for record in scope.records:
+            record.update({field: scope.attribution.get(field) for field in ATTRIBUTION_FIELDS})
+        usage_recorder.add(scope.records)
+
+
+class UsageRecorder:
+    """Buffers per-call usage records and writes them to the database in batches"""
+
+    def __init__(self, flush_size: int = FLUSH_SIZE):
+        self.flush_size = flush_size
+        self.pending: List[Dict[str, Any]] = []
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.unreported = 0
+        self.write_errors = 0
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def record(self, completion: Completion, model: str, latency: float):
+        """Account for one successful completion in the current usage scope"""
+        self.calls += 1
+        if completion.prompt_tokens is None and completion.total_tokens is None:
+            # The provider didn't report usage; keep the call count honest anyway
+            self.unreported += 1
+        self.prompt_tokens += completion.prompt_tokens or 0
+        self.completion_tokens += completion.completion_tokens or 0
+        self.cached_tokens += completion.cached_tokens or 0
+
+        record = {
+            "model": model,
+            "prompt_tokens": completion.prompt_tokens,
+            "completion_tokens": completion.completion_tokens,
+            "cached_tokens": completion.cached_tokens,
+            "total_tokens": completion.total_tokens,
+            "latency_ms": round(latency * 1000, 1)
+        }
+        scope = _current_scope.get()
+        if scope is not None and not scope.closed:
+            scope.records.append(record)
+        else:
+            # No scope, or a task that outlived the block it was started in
+            attribution = scope.attribution if scope is not None else {}
+            record.update({field: attribution.get(field) for field in ATTRIBUTION_FIELDS})
+            self.add([record])
+
+    def add(self, records: List[Dict[str, Any]]):
+        """Queue finished records for writing"""
+        if not records:
+            return
+        self.pending.extend(records)
+        if len(self.pending) >= self.flush_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self) -> int:
+        """Write all buffered records in one transaction. Returns rows written."""
+        if not self.pending:
+            return 0
+        rows, self.pending = self.pending, []
+        try:
+            await db.save_llm_usage_many(rows)
+        except Exception as e:
+            # Accounting must never break generation; keep (a bounded number of) rows for the next flush
+            self.write_errors += 1
+            self.pending = (rows + self.pending)[-self.flush_size * 20:]
+            logger.error(f"Failed to write {len(rows)} LLM usage records: {e}")
+            return 0
+        return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "calls_without_usage": self.unreported,
+            "pending_records": len(self.pending),
+            "write_errors": self.write_errors
+        }
+
+
+usage_recorder = UsageRecorder()
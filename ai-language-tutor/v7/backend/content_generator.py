@@ -1,18 +1,67 @@
 import json
 import asyncio
-from typing import Dict, Any, Optional, List
+import os
+import time
+from typing import Dict, Any, Optional, List, NamedTuple, Tuple, Callable, Awaitable
 from backend.utils import generate_completions
-from backend import config
+from backend.utils.rate_limiter import INTERACTIVE, background_priority, current_priority, llm_priority
+from backend.utils.prompt_templates import render_instructions
+from backend.utils.token_usage import usage_recorder, usage_scope
+from backend.utils.content_validation import content_validator
+from backend.utils.lesson_batches import (
+    LESSONS_PER_CALL,
+    batch_instructions,
+    batch_prompt,
+    batch_stats,
+    split_batch_response
+)
 from backend.db import db
 from backend.db_cache import api_cache
+from backend.cache import AsyncLRUCache
+from backend.job_queue import job_queue
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Content generated for every lesson, in generation order
+CONTENT_TYPES = ["flashcards", "exercises", "simulation"]
+
+# LLM calls (one lesson x content type, or one content type for a batch of lessons) in flight per curriculum
+UNITS_IN_FLIGHT = int(os.getenv("GENERATION_UNITS_IN_FLIGHT", 9))
+
+# "eager" queues every lesson of a new curriculum; "lazy" queues lesson 0 and
+# each following lesson when the one before it is first opened
+GENERATION_MODES = ("eager", "lazy")
+GENERATION_MODE = os.getenv("GENERATION_MODE", "eager").lower()
+# How long an on-demand lesson request is remembered, so repeat fetches skip the database
+LAZY_REQUEST_TTL = float(os.getenv("GENERATION_LAZY_REQUEST_TTL", 10 * 60))
+
+
+def _is_first_lesson(unit: Tuple[int, str]) -> bool:
+    return unit[0] == 0
+
+
+class LessonRequest(NamedTuple):
+    """What an on-demand lesson request found"""
+    exists: bool
+    # Some of the lesson's content was missing, so it was queued (now or earlier)
+    pending: bool
+    # job_queue.abandoned_units when the lesson was looked up
+    abandoned: int
+
 
 class ContentGenerator:
     """Service for generating and storing all learning content"""
     
+    def __init__(self, mode: str = GENERATION_MODE):
+        if mode not in GENERATION_MODES:
+            logger.warning(f"Unknown GENERATION_MODE {mode!r}, using eager generation")
+            mode = "eager"
+        self.mode = mode
+        # Single-flight for on-demand lesson requests: concurrent fetches queue a lesson once
+        self.lesson_requests = AsyncLRUCache(maxsize=10_000, ttl={"default": LAZY_REQUEST_TTL})
+        self.on_demand_lessons = 0
+    
     async def generate_curriculum_from_metadata(
         self,
         metadata_extraction_id: str,
@@ -22,30 +71,26 @@ class ContentGenerator:
     ) -> str:
         """Generate curriculum based on extracted metadata"""
         # Format curriculum instructions with metadata
-        instructions = (
-            config.curriculum_instructions
-            .replace("{native_language}", metadata['native_language'])
-            .replace("{target_language}", metadata['target_language'])
-            .replace("{proficiency}", metadata['proficiency'])
+        instructions = render_instructions(
+            "curriculum", metadata['native_language'], metadata['target_language'], metadata['proficiency']
         )
         
-        # Generate curriculum
-        logger.info(f"Generating curriculum for {metadata['target_language']} ({metadata['proficiency']})")
-        curriculum_response = await generate_completions.get_completions(query, instructions)
-        
-        try:
-            # Parse curriculum response
-            curriculum = json.loads(curriculum_response)
-        except json.JSONDecodeError:
-            logger.error(f"Failed to parse curriculum response: {curriculum_response[:200]}...")
-            curriculum = {"lesson_topic": "Language Learning Journey", "sub_topics": []}
-        
-        # Save curriculum to database
-        curriculum_id = await db.save_curriculum(
-            metadata_extraction_id=metadata_extraction_id,
-            curriculum=curriculum,
-            user_id=user_id
-        )
+        # Attribute the call to the curriculum it produces, once that has an ID
+        with usage_scope(content_type="curriculum") as usage:
+            # Generate curriculum
+            logger.info(f"Generating curriculum for {metadata['target_language']} ({metadata['proficiency']})")
+            # Repaired or partially re-requested if needed; raises rather than saving an empty curriculum
+            curriculum = await content_validator.generate(
+                "curriculum", query, instructions, generate_completions.get_completions
+            )
+            
+            # Save curriculum to database
+            curriculum_id = await db.save_curriculum(
+                metadata_extraction_id=metadata_extraction_id,
+                curriculum=curriculum,
+                user_id=user_id
+            )
+            usage["curriculum_id"] = curriculum_id
         
         return curriculum_id
     
@@ -56,126 +101,246 @@ class ContentGenerator:
         lesson: Dict[str, Any],
         metadata: Dict[str, Any]
     ) -> Dict[str, str]:
-        """Generate all content types for a single lesson"""
-        content_ids = {}
-        lesson_topic = lesson.get('sub_topic', f'Lesson {lesson_index + 1}')
-        lesson_context = f"{lesson_topic}: {lesson.get('description', '')}"
+        """Generate and save all content types for a single lesson"""
+        items = await self.generate_lesson_content_items(
+            curriculum_id=curriculum_id,
+            lesson_index=lesson_index,
+            lesson=lesson,
+            metadata=metadata
+        )
+        content_ids = await db.save_learning_content_many(items)
+        return {item['content_type']: content_id for item, content_id in zip(items, content_ids)}
+    
+    async def generate_lesson_content_items(
+        self,
+        curriculum_id: str,
+        lesson_index: int,
+        lesson: Dict[str, Any],
+        metadata: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """Generate all content types for a single lesson, concurrently, without saving them.
         
-        # Generate flashcards
+        Returns rows for db.save_learning_content_many, so callers can write a
+        whole batch of lessons in one transaction.
+        """
+        items = await asyncio.gather(*(
+            self.generate_content_item(curriculum_id, content_type, lesson_index, lesson, metadata)
+            for content_type in CONTENT_TYPES
+        ))
+        return [item for item in items if item is not None]
+    
+    async def generate_content_item(
+        self,
+        curriculum_id: str,
+        content_type: str,
+        lesson_index: int,
+        lesson: Dict[str, Any],
+        metadata: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """Generate one content type for one lesson; None if generation failed"""
+        lesson_context = self._lesson_context(lesson_index, lesson)
         try:
-            flashcards_instructions = (
-                config.flashcard_mode_instructions
-                .replace("{native_language}", metadata['native_language'])
-                .replace("{target_language}", metadata['target_language'])
-                .replace("{proficiency}", metadata['proficiency'])
-            )
-            
-            flashcards_response = await api_cache.get_or_set(
-                category="flashcards",
-                key_text=lesson_context,
-                coro=generate_completions.get_completions,
-                context={
-                    'native_language': metadata['native_language'],
-                    'target_language': metadata['target_language'],
-                    'proficiency': metadata['proficiency'],
-                    'lesson_index': lesson_index
-                },
-                prompt=lesson_context,
-                instructions=flashcards_instructions
+            instructions = render_instructions(
+                content_type, metadata['native_language'], metadata['target_language'], metadata['proficiency']
             )
             
-            # Save flashcards
-            content_ids['flashcards'] = await db.save_learning_content(
-                curriculum_id=curriculum_id,
-                content_type='flashcards',
-                lesson_index=lesson_index,
-                lesson_topic=lesson_topic,
-                content=flashcards_response
-            )
+            with usage_scope(curriculum_id=curriculum_id, content_type=content_type, lesson_index=lesson_index):
+                # Only validated content reaches the cache
+                response = await api_cache.get_or_set(
+                    category=content_type,
+                    key_text=lesson_context,
+                    coro=content_validator.generate,
+                    context=self._cache_context(metadata, lesson_index),
+                    content_type=content_type,
+                    prompt=lesson_context,
+                    instructions=instructions,
+                    complete=generate_completions.get_completions
+                )
         except Exception as e:
-            logger.error(f"Failed to generate flashcards for lesson {lesson_index}: {e}")
+            logger.error(f"Failed to generate {content_type} for lesson {lesson_index}: {e}")
+            return None
         
-        # Generate exercises
-        try:
-            exercises_instructions = (
-                config.exercise_mode_instructions
-                .replace("{native_language}", metadata['native_language'])
-                .replace("{target_language}", metadata['target_language'])
-                .replace("{proficiency}", metadata['proficiency'])
-            )
-            
-            exercises_response = await api_cache.get_or_set(
-                category="exercises",
-                key_text=lesson_context,
-                coro=generate_completions.get_completions,
-                context={
-                    'native_language': metadata['native_language'],
-                    'target_language': metadata['target_language'],
-                    'proficiency': metadata['proficiency'],
-                    'lesson_index': lesson_index
-                },
-                prompt=lesson_context,
-                instructions=exercises_instructions
-            )
-            
-            # Save exercises
-            content_ids['exercises'] = await db.save_learning_content(
-                curriculum_id=curriculum_id,
-                content_type='exercises',
-                lesson_index=lesson_index,
-                lesson_topic=lesson_topic,
-                content=exercises_response
-            )
-        except Exception as e:
-            logger.error(f"Failed to generate exercises for lesson {lesson_index}: {e}")
+        return self._content_item(curriculum_id, content_type, lesson_index, lesson, response)
+    
+    async def generate_batch_content_items(
+        self,
+        curriculum_id: str,
+        lessons: List[Tuple[int, Dict[str, Any]]],
+        metadata: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """Generate all content types for several (lesson_index, lesson) pairs without saving them.
+        
+        Makes one LLM call per content type for all of the lessons together, then
+        generates any lesson the batched response left out or got wrong on its own.
+        """
+        results = await asyncio.gather(*(
+            self._generate_batched_type(curriculum_id, content_type, lessons, metadata)
+            for content_type in CONTENT_TYPES
+        ))
+        
+        # Same row order as the per-lesson path: lesson by lesson, then content type
+        items = [item for result in results for item in result]
+        items.sort(key=lambda item: (item['lesson_index'], CONTENT_TYPES.index(item['content_type'])))
+        return items
+    
+    async def _generate_batched_type(
+        self,
+        curriculum_id: str,
+        content_type: str,
+        lessons: List[Tuple[int, Dict[str, Any]]],
+        metadata: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        contexts = {index: self._lesson_context(index, lesson) for index, lesson in lessons}
+        contents: Dict[int, Any] = {}
+        
+        # Lessons that are already cached don't need to be in the batch
+        for index, lesson_context in contexts.items():
+            cached = await api_cache.get(content_type, lesson_context, context=self._cache_context(metadata, index))
+            if cached is not None:
+                contents[index] = cached
+        
+        missing = {index: lesson_context for index, lesson_context in contexts.items() if index not in contents}
+        if len(missing) > 1:
+            contents.update(await self._request_batch(curriculum_id, content_type, missing, metadata))
+        
+        items = []
+        for index, lesson in lessons:
+            if index in contents:
+                items.append(self._content_item(curriculum_id, content_type, index, lesson, contents[index]))
+                continue
+            # Fall back to the single-lesson call
+            item = await self.generate_content_item(curriculum_id, content_type, index, lesson, metadata)
+            if item is not None:
+                items.append(item)
+        return items
+    
+    async def _request_batch(
+        self,
+        curriculum_id: str,
+        content_type: str,
+        lesson_contexts: Dict[int, str],
+        metadata: Dict[str, Any]
+    ) -> Dict[int, Any]:
+        """Make one batched call and cache every lesson it returned valid content for"""
+        instructions = render_instructions(
+            content_type, metadata['native_language'], metadata['target_language'], metadata['proficiency']
+        )
+        system_prompt = batch_instructions(instructions)
+        prompt = batch_prompt(lesson_contexts.items())
         
-        # Generate simulation
+        started = time.perf_counter()
+        failed = False
         try:
-            simulation_instructions = (
-                config.simulation_mode_instructions
-                .replace("{native_language}", metadata['native_language'])
-                .replace("{target_language}", metadata['target_language'])
-                .replace("{proficiency}", metadata['proficiency'])
-            )
-            
-            simulation_response = await api_cache.get_or_set(
-                category="simulation",
-                key_text=lesson_context,
-                coro=generate_completions.get_completions,
-                context={
-                    'native_language': metadata['native_language'],
-                    'target_language': metadata['target_language'],
-                    'proficiency': metadata['proficiency'],
-                    'lesson_index': lesson_index
-                },
-                prompt=lesson_context,
-                instructions=simulation_instructions
-            )
-            
-            # Save simulation
-            content_ids['simulation'] = await db.save_learning_content(
-                curriculum_id=curriculum_id,
-                content_type='simulation',
-                lesson_index=lesson_index,
-                lesson_topic=lesson_topic,
-                content=simulation_response
-            )
+            # One call for several lessons: attributed to the curriculum, not to a lesson
+            with usage_scope(curriculum_id=curriculum_id, content_type=content_type, lesson_index=None):
+                response = await generate_completions.get_completions(prompt, system_prompt)
+            accepted = split_batch_response(content_type, response, list(lesson_contexts))
         except Exception as e:
-            logger.error(f"Failed to generate simulation for lesson {lesson_index}: {e}")
+            logger.error(f"Batched {content_type} generation failed for lessons {list(lesson_contexts)}: {e}")
+            accepted = {}
+            failed = True
+        batch_stats.record(
+            instructions,
+            [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
+            lesson_contexts,
+            list(accepted),
+            time.perf_counter() - started,
+            failed=failed
+        )
+        if not failed and len(accepted) < len(lesson_contexts):
+            logger.warning(
+                f"Batched {content_type} call returned valid content for {len(accepted)}/{len(lesson_contexts)} "
+                f"lessons, generating the rest one by one"
+            )
         
-        return content
+        stored = {}
+        for index, content in accepted.items():
+            stored[index] = await api_cache.set(
+                content_type,
+                lesson_contexts[index],
+                content,
+                context=self._cache_context(metadata, index)
+            )
+        return stored
+    
+    def _lesson_context(self, lesson_index: int, lesson: Dict[str, Any]) -> str:
+        lesson_topic = lesson.get('sub_topic', f'Lesson {lesson_index + 1}')
+        return f"{lesson_topic}: {lesson.get('description', '')}"
+    
+    def _cache_context(self, metadata: Dict[str, Any], lesson_index: int) -> Dict[str, Any]:
+        return {
+            'native_language': metadata['native_language'],
+            'target_language': metadata['target_language'],
+            'proficiency': metadata['proficiency'],
+            'lesson_index': lesson_index
+        }
+    
+    def _content_item(
+        self,
+        curriculum_id: str,
+        content_type: str,
+        lesson_index: int,
+        lesson: Dict[str, Any],
+        content: Any
+    ) -> Dict[str, Any]:
+        return {
+            'curriculum_id': curriculum_id,
+            'content_type': content_type,
+            'lesson_index': lesson_index,
+            'lesson_topic': lesson.get('sub_topic', f'Lesson {lesson_index + 1}'),
+            'content': content
+        }
     
+    @background_priority
     async def generate_all_content_for_curriculum(
         self,
         curriculum_id: str,
-        max_concurrent_lessons: int = 3
+        max_in_flight: int = UNITS_IN_FLIGHT,
+        lessons_per_call: Optional[int] = None
     ):
-        """Generate all learning content for a curriculum"""
-        # Get curriculum details
+        """Generate all learning content for a curriculum that doesn't exist yet.
+        
+        Keeps up to max_in_flight calls running (see generate_in_window). With
+        lessons_per_call > 1 (default: LESSONS_PER_CALL) each content type is
+        requested for that many lessons in one call instead of once per lesson.
+        """
+        if lessons_per_call is None:
+            lessons_per_call = LESSONS_PER_CALL
+        
+        loaded = await self.load_curriculum(curriculum_id)
+        if loaded is None:
+            return
+        lessons, metadata = loaded
+        
+        # Content saved by an earlier, interrupted run is kept
+        missing: Dict[int, List[Tuple[int, str]]] = {}
+        for unit in await self.missing_units(curriculum_id, lessons):
+            missing.setdefault(unit[0], []).append(unit)
+        logger.info(f"Starting content generation for {len(missing)} of {len(lessons)} lessons")
+        
+        next_lessons = sorted(missing)
+        
+        async def claim(count: int) -> List[Tuple[int, str]]:
+            chosen, next_lessons[:count] = next_lessons[:count], []
+            return [unit for lesson_index in chosen for unit in missing[lesson_index]]
+        
+        async def save(units: List[Tuple[int, str]], items: List[Dict[str, Any]]):
+            # One transaction per finished group of lessons instead of one commit per item
+            await db.save_learning_content_many(items)
+        
+        await self.generate_in_window(curriculum_id, lessons, metadata, claim, save, lessons_per_call, max_in_flight)
+        
+        # Mark curriculum as content generated
+        await db.mark_curriculum_content_generated(curriculum_id)
+        await usage_recorder.flush()
+        logger.info(f"Completed content generation for curriculum {curriculum_id}")
+    
+    async def load_curriculum(self, curriculum_id: str) -> Optional[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+        """Get a curriculum's lessons and generation metadata; None if it is missing or unreadable"""
         curriculum_data = await db.get_curriculum(curriculum_id)
         if not curriculum_data:
             logger.error(f"Curriculum not found: {curriculum_id}")
-            return
+            return None
         
         # Parse curriculum JSON
         try:
@@ -183,44 +348,214 @@ class ContentGenerator:
             lessons = curriculum.get('sub_topics', [])
         except json.JSONDecodeError:
             logger.error(f"Failed to parse curriculum JSON for {curriculum_id}")
-            return
+            return None
         
-        # Prepare metadata
         metadata = {
             'native_language': curriculum_data['native_language'],
             'target_language': curriculum_data['target_language'],
             'proficiency': curriculum_data['proficiency']
         }
+        return lessons, metadata
+    
+    async def missing_units(self, curriculum_id: str, lessons: List[Dict[str, Any]]) -> List[Tuple[int, str]]:
+        """The (lesson_index, content_type) cells of a curriculum's grid that have no content yet, in lesson order"""
+        existing = await db.get_generated_units(curriculum_id)
+        return [
+            (lesson_index, content_type)
+            for lesson_index in range(len(lessons))
+            for content_type in CONTENT_TYPES
+            if (lesson_index, content_type) not in existing
+        ]
+    
+    async def enqueue_content_generation(self, curriculum_id: str, lessons_per_call: Optional[int] = None) -> int:
+        """Queue a curriculum's missing content for the generation worker. Returns units pending.
+        
+        Only lesson x content type cells without content are queued, so this
+        also resumes a curriculum whose generation failed or stopped midway.
+        Eager mode queues every lesson; lazy mode only lesson 0, later lessons
+        are queued by request_lesson as the learner gets to them.
+        """
+        loaded = await self.load_curriculum(curriculum_id)
+        if loaded is None:
+            return 0
+        lessons, _ = loaded
+        missing = await self.missing_units(curriculum_id, lessons)
+        if not missing:
+            # Everything was generated, only marking the curriculum was lost
+            await db.mark_curriculum_content_generated(curriculum_id)
+            return 0
+        units = [unit for unit in missing if unit[0] == 0] if self.mode == "lazy" else missing
+        if not units:
+            return 0
+        return await job_queue.enqueue(
+            curriculum_id,
+            units,
+            lessons_per_call=lessons_per_call,
+            expected_units=len(missing)
+        )
+    
+    async def on_lesson_fetched(self, curriculum_id: str, lesson_index: int):
+        """Lazy mode: a learner opened a lesson, so get the next one ready"""
+        if self.mode != "lazy":
+            return
+        try:
+            await self.request_lesson(curriculum_id, lesson_index + 1)
+        except Exception as e:
+            # Serving the lesson matters more than prefetching the next one
+            logger.error(f"Failed to queue lesson {lesson_index + 1} of curriculum {curriculum_id}: {e}")
+    
+    async def request_lesson(self, curriculum_id: str, lesson_index: int) -> bool:
+        """Queue a lesson's missing content on demand. True if the lesson exists in the curriculum.
+        
+        Concurrent requests for the same lesson share one lookup, and the answer
+        is remembered for a while so every fetch (or poll while it is being
+        generated) doesn't hit the database again. A lesson that was still
+        being generated is looked up again once any unit has failed or been
+        cancelled since, so its own failed units get queued again.
+        """
+        key = (curriculum_id, lesson_index)
+        request = await self.lesson_requests.get_or_set(key, self._request_lesson, curriculum_id, lesson_index)
+        if request.pending and request.abandoned != job_queue.abandoned_units:
+            self.lesson_requests.invalidate(key)
+            request = await self.lesson_requests.get_or_set(key, self._request_lesson, curriculum_id, lesson_index)
+        return request.exists
+    
+    async def _request_lesson(self, curriculum_id: str, lesson_index: int) -> LessonRequest:
+        # Read first, so a unit failing during the lookup makes the next request look again
+        abandoned = job_queue.abandoned_units
+        loaded = await self.load_curriculum(curriculum_id)
+        if loaded is None:
+            return LessonRequest(False, False, abandoned)
+        lessons, _ = loaded
+        if not 0 <= lesson_index < len(lessons):
+            return LessonRequest(False, False, abandoned)
+        
+        # Content that already exists (generated earlier, or copied from another curriculum) is kept
+        missing = await self.missing_units(curriculum_id, lessons)
+        units = [unit for unit in missing if unit[0] == lesson_index]
+        # Units already waiting or being generated are left as they are
+        queued = await job_queue.pending_units(curriculum_id, lesson_index) if units else set()
+        new_units = [unit for unit in units if unit not in queued]
+        if new_units:
+            await job_queue.enqueue(curriculum_id, new_units, expected_units=len(missing))
+            self.on_demand_lessons += 1
+        return LessonRequest(True, bool(units), abandoned)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "on_demand_lessons": self.on_demand_lessons,
+            "lesson_requests": self.lesson_requests.stats()
+        }
+    
+    async def generate_in_window(
+        self,
+        curriculum_id: str,
+        lessons: List[Dict[str, Any]],
+        metadata: Dict[str, Any],
+        claim: Callable[[int], Awaitable[List[Tuple[int, str]]]],
+        save: Callable[[List[Tuple[int, str]], List[Dict[str, Any]]], Awaitable[Any]],
+        lessons_per_call: int = 1,
+        max_in_flight: int = UNITS_IN_FLIGHT,
+        urgent: Optional[Callable[[Tuple[int, str]], bool]] = None
+    ):
+        """Generate (lesson_index, content_type) units with a sliding window of LLM calls.
         
-        logger.info(f"Starting content generation for {len(lessons)} lessons")
+        claim(n) hands out the units of up to n more lessons ([] once there are
+        none left). It is called whenever a call finishes and frees a slot, so a
+        slow call only holds up its own lesson instead of every lesson after it.
+        A call is one lesson and content type, or with lessons_per_call > 1 one
+        content type for the claimed lessons together. save(units, items) gets
+        each lesson as soon as all of its units have settled; units without an
+        item failed.
         
-        # Process lessons in batches to avoid overwhelming the API
-        for i in range(0, len(lessons), max_concurrent_lessons):
-            batch = lessons[i:i + max_concurrent_lessons]
-            batch_indices = list(range(i, min(i + max_concurrent_lessons, len(lessons))))
-            
-            # Generate content for batch concurrently
-            tasks = [
-                self.generate_content_for_lesson(
-                    curriculum_id=curriculum_id,
-                    lesson_index=idx,
-                    lesson=lesson,
-                    metadata=metadata
+        Calls for urgent units (default: lesson 0, which users open right away)
+        go to the rate limiter as interactive instead of background requests.
+        """
+        urgent = urgent or _is_first_lesson
+        batched = lessons_per_call > 1
+        running: Dict[asyncio.Task, List[Tuple[int, str]]] = {}
+        claimed: Dict[int, List[Tuple[int, str]]] = {}
+        unsettled: Dict[int, int] = {}
+        produced: Dict[int, List[Dict[str, Any]]] = {}
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(running) < max_in_flight:
+                    units = await claim(lessons_per_call if batched else 1)
+                    if not units:
+                        exhausted = True
+                        break
+                    for lesson_index, content_type in units:
+                        claimed.setdefault(lesson_index, []).append((lesson_index, content_type))
+                        unsettled[lesson_index] = unsettled.get(lesson_index, 0) + 1
+                    if batched:
+                        calls = [
+                            [unit for unit in units if unit[1] == content_type]
+                            for content_type in CONTENT_TYPES
+                            if any(unit[1] == content_type for unit in units)
+                        ]
+                    else:
+                        calls = [[unit] for unit in units]
+                    for call_units in calls:
+                        # The task inherits the priority set here
+                        priority = INTERACTIVE if any(urgent(unit) for unit in call_units) else current_priority()
+                        with llm_priority(priority):
+                            task = asyncio.create_task(self._generate_call(curriculum_id, call_units, lessons, metadata))
+                        running[task] = call_units
+                
+                if not running:
+                    break
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                
+                finished = []
+                for task in done:
+                    for item in task.result():
+                        produced.setdefault(item['lesson_index'], []).append(item)
+                    for lesson_index, _ in running.pop(task):
+                        unsettled[lesson_index] -= 1
+                        if unsettled[lesson_index] == 0:
+                            finished.append(lesson_index)
+                if finished:
+                    finished.sort()
+                    units = [unit for lesson_index in finished for unit in claimed.pop(lesson_index)]
+                    items = [item for lesson_index in finished for item in produced.pop(lesson_index, [])]
+                    items.sort(key=lambda item: (item['lesson_index'], CONTENT_TYPES.index(item['content_type'])))
+                    for lesson_index in finished:
+                        del unsettled[lesson_index]
+                    await save(units, items)
+        finally:
+            # Cancelled (deadline, admin, shutdown) or failed: don't leave calls running behind us
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+    
+    async def _generate_call(
+        self,
+        curriculum_id: str,
+        units: List[Tuple[int, str]],
+        lessons: List[Dict[str, Any]],
+        metadata: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """One slot of generate_in_window: a single content item, or one content type for several lessons"""
+        content_type = units[0][1]
+        try:
+            if len(units) == 1:
+                lesson_index = units[0][0]
+                item = await self.generate_content_item(
+                    curriculum_id, content_type, lesson_index, lessons[lesson_index], metadata
                 )
-                for idx, lesson in zip(batch_indices, batch)
-            ]
-            
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            for idx, result in zip(batch_indices, results):
-                if isinstance(result, Exception):
-                    logger.error(f"Failed to generate content for lesson {idx}: {result}")
-                else:
-                    logger.info(f"Generated content for lesson {idx}: {result}")
-        
-        # Mark curriculum as content generated
-        await db.mark_curriculum_content_generated(curriculum_id)
-        logger.info(f"Completed content generation for curriculum {curriculum_id}")
+                return [item] if item is not None else []
+            return await self._generate_batched_type(
+                curriculum_id,
+                content_type,
+                [(lesson_index, lessons[lesson_index]) for lesson_index, _ in units],
+                metadata
+            )
+        except Exception as e:
+            logger.error(f"Failed to generate {content_type} for lessons {[index for index, _ in units]}: {e}")
+            return []
     
     async def process_metadata_extraction(
         self,
@@ -287,8 +622,8 @@ class ContentGenerator:
         }
         
         if generate_content:
-            # Start content generation in background
-            asyncio.create_task(self.generate_all_content_for_curriculum(curriculum_id))
+            # Queue content generation; the generation worker picks it up and survives restarts
+            await self.enqueue_content_generation(curriculum_id)
             result['content_generation_started'] = True
         
         return result
@@ -1,10 +1,11 @@
 import aiosqlite
 import json
 import os
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Set, Tuple
 from datetime import datetime
 import uuid
 import logging
+from backend.db_pool import get_pool
 
 logger = logging.getLogger(__name__)
 
@@ -17,10 +18,12 @@ class Database:
     
     def __init__(self, db_path: str = DB_PATH):
         self.db_path = db_path
+        # Shared reader/writer connections (falls back to per-call connections until opened)
+        self.pool = get_pool(db_path)
     
     async def initialize(self):
         """Initialize database with schema"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.write() as db:
             # Read and execute schema - look for it in parent directory
             schema_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'schema.sql')
             with open(schema_path, 'r') as f:
@@ -38,9 +41,7 @@ class Database:
         user_id: Optional[int] = None
     ) -> Optional[Dict[str, Any]]:
         """Find existing curriculum for similar query and metadata"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            
+        async with self.pool.read() as db:
             # First try to find exact query match for the user
             if user_id:
                 async with db.execute("""
@@ -81,7 +82,7 @@ class Database:
         """Save extracted metadata and return extraction ID"""
         extraction_id = str(uuid.uuid4())
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.write() as db:
             await db.execute("""
                 INSERT INTO metadata_extractions 
                 (id, user_id, query, native_language, target_language, proficiency, title, description, metadata_json)
@@ -111,7 +112,7 @@ class Database:
         """Save generated curriculum and return curriculum ID"""
         curriculum_id = str(uuid.uuid4())
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.write() as db:
             await db.execute("""
                 INSERT INTO curricula 
                 (id, metadata_extraction_id, user_id, lesson_topic, curriculum_json)
@@ -137,7 +138,7 @@ class Database:
         """Copy an existing curriculum for a new user"""
         new_curriculum_id = str(uuid.uuid4())
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.write() as db:
             # Get source curriculum
             async with db.execute("""
                 SELECT lesson_topic, curriculum_json FROM curricula WHERE id = ?
@@ -199,7 +200,7 @@ class Database:
         """Save learning content (flashcards, exercises, or simulation)"""
         content_id = str(uuid.uuid4())
         
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.write() as db:
             await db.execute("""
                 INSERT INTO learning_content 
                 (id, curriculum_id, content_type, lesson_index, lesson_topic, content_json)
@@ -217,9 +218,50 @@ class Database:
         logger.info(f"Saved {content_type} for lesson {lesson_index}")
         return content_id
     
+    async def save_learning_content_many(self, items: List[Dict[str, Any]]) -> List[str]:
+        """Save several learning content rows in one transaction.
+        
+        Each item has the same fields as save_learning_content's arguments:
+        curriculum_id, content_type, lesson_index, lesson_topic and content.
+        Returns the new content IDs in the same order.
+        """
+        if not items:
+            return []
+        
+        async with self.pool.write() as db:
+            content_ids = await self.insert_learning_content(db, items)
+            await db.commit()
+        
+        logger.info(f"Saved {len(content_ids)} learning content items in one transaction")
+        return content_ids
+    
+    async def insert_learning_content(self, db: aiosqlite.Connection, items: List[Dict[str, Any]]) -> List[str]:
+        """Insert learning content rows on an open connection without committing.
+        
+        Lets other modules (e.g. the generation job queue) write content in the
+        same transaction as their own bookkeeping.
+        """
+        rows = [
+            (
+                str(uuid.uuid4()),
+                item['curriculum_id'],
+                item['content_type'],
+                item['lesson_index'],
+                item['lesson_topic'],
+                json.dumps(item['content']) if isinstance(item['content'], (dict, list)) else item['content']
+            )
+            for item in items
+        ]
+        await db.executemany("""
+            INSERT INTO learning_content 
+            (id, curriculum_id, content_type, lesson_index, lesson_topic, content_json)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+        return [row[0] for row in rows]
+    
     async def mark_curriculum_content_generated(self, curriculum_id: str):
         """Mark curriculum as having all content generated"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.write() as db:
             await db.execute("""
                 UPDATE curricula 
                 SET is_content_generated = 1 
@@ -229,8 +271,7 @@ class Database:
     
     async def get_metadata_extraction(self, extraction_id: str) -> Optional[Dict[str, Any]]:
         """Get metadata extraction by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.read() as db:
             async with db.execute("""
                 SELECT * FROM metadata_extractions WHERE id = ?
             """, (extraction_id,)) as cursor:
@@ -241,8 +282,7 @@ class Database:
     
     async def get_curriculum(self, curriculum_id: str) -> Optional[Dict[str, Any]]:
         """Get curriculum by ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.read() as db:
             async with db.execute("""
                 SELECT c.*, m.native_language, m.target_language, m.proficiency
                 FROM curricula c
@@ -274,8 +314,7 @@ class Database:
         
         query += " ORDER BY lesson_index"
         
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.read() as db:
             async with db.execute(query, params) as cursor:
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
@@ -286,8 +325,7 @@ class Database:
         limit: int = 20
     ) -> List[Dict[str, Any]]:
         """Get user's metadata extraction history"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.read() as db:
             async with db.execute("""
                 SELECT * FROM metadata_extractions 
                 WHERE user_id = ? 
@@ -303,8 +341,7 @@ class Database:
         limit: int = 20
     ) -> List[Dict[str, Any]]:
         """Get user's curricula"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.read() as db:
             async with db.execute("""
                 SELECT c.*, m.native_language, m.target_language, m.proficiency, m.title
                 FROM curricula c
@@ -322,8 +359,7 @@ class Database:
         limit: int = 20
     ) -> List[Dict[str, Any]]:
         """Get user's complete learning journeys"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.read() as db:
             async with db.execute("""
                 SELECT * FROM user_learning_journeys 
                 WHERE user_id = ? 
@@ -332,10 +368,79 @@ class Database:
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
     
+    async def save_llm_usage_many(self, records: List[Dict[str, Any]]):
+        """Save LLM token usage records (see backend.utils.token_usage) in one transaction"""
+        if not records:
+            return
+        
+        rows = [
+            (
+                record.get('curriculum_id'),
+                record.get('content_type'),
+                record.get('lesson_index'),
+                record.get('model'),
+                record.get('prompt_tokens'),
+                record.get('completion_tokens'),
+                record.get('cached_tokens'),
+                record.get('total_tokens'),
+                record.get('latency_ms')
+            )
+            for record in records
+        ]
+        
+        async with self.pool.write() as db:
+            await db.executemany("""
+                INSERT INTO llm_usage
+                (curriculum_id, content_type, lesson_index, model, prompt_tokens,
+                 completion_tokens, cached_tokens, total_tokens, latency_ms)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            await db.commit()
+    
+    async def get_curriculum_usage(self, curriculum_id: str) -> Dict[str, Any]:
+        """Aggregate LLM token usage for a curriculum: totals, per content type and per lesson"""
+        totals_sql = """
+            SELECT COUNT(*) AS calls,
+                   COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+                   COALESCE(SUM(completion_tokens), 0) AS completion_tokens,
+                   COALESCE(SUM(cached_tokens), 0) AS cached_tokens,
+                   COALESCE(SUM(total_tokens), 0) AS total_tokens,
+                   ROUND(COALESCE(SUM(latency_ms), 0), 1) AS latency_ms
+        """
+        async with self.pool.read() as db:
+            async with db.execute(
+                totals_sql + " FROM llm_usage WHERE curriculum_id = ?", (curriculum_id,)
+            ) as cursor:
+                totals = dict(await cursor.fetchone())
+            
+            async with db.execute(
+                totals_sql.replace("SELECT", "SELECT content_type,", 1)
+                + " FROM llm_usage WHERE curriculum_id = ? GROUP BY content_type ORDER BY content_type",
+                (curriculum_id,)
+            ) as cursor:
+                by_content_type = {row['content_type']: dict(row) for row in await cursor.fetchall()}
+            
+            # Batched calls cover several lessons and have no lesson_index
+            async with db.execute(
+                totals_sql.replace("SELECT", "SELECT lesson_index, content_type,", 1)
+                + """ FROM llm_usage WHERE curriculum_id = ? AND lesson_index IS NOT NULL
+                GROUP BY lesson_index, content_type ORDER BY lesson_index, content_type""",
+                (curriculum_id,)
+            ) as cursor:
+                by_lesson = [dict(row) for row in await cursor.fetchall()]
+        
+        for row in by_content_type.values():
+            row.pop('content_type')
+        return {
+            'curriculum_id': curriculum_id,
+            'totals': totals,
+            'by_content_type': by_content_type,
+            'by_lesson': by_lesson
+        }
+    
     async def get_curriculum_content_status(self, curriculum_id: str) -> Optional[Dict[str, Any]]:
         """Get content generation status for a curriculum"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.read() as db:
             async with db.execute("""
                 SELECT * FROM curriculum_content_status WHERE curriculum_id = ?
             """, (curriculum_id,)) as cursor:
@@ -344,6 +449,38 @@ class Database:
                     return dict(row)
         return None
 
+    async def get_generated_units(self, curriculum_id: str) -> Set[Tuple[int, str]]:
+        """(lesson_index, content_type) cells of a curriculum that already have content"""
+        async with self.pool.read() as db:
+            async with db.execute("""
+                SELECT DISTINCT lesson_index, content_type FROM learning_content WHERE curriculum_id = ?
+            """, (curriculum_id,)) as cursor:
+                return {(lesson_index, content_type) for lesson_index, content_type in await cursor.fetchall()}
+
+    async def get_incomplete_curricula(self, job_statuses: Tuple[str, ...] = ('failed',), limit: int = 100) -> List[Dict[str, Any]]:
+        """Curricula without all their content that no generation job is working on, oldest first
+
+        That is curricula whose job ended in one of job_statuses, and ones that
+        never got a job (e.g. the process stopped before queuing it). A failed
+        job's curriculum can also be marked generated by an older release, so
+        the job status decides rather than the flag.
+        """
+        placeholders = ", ".join("?" for _ in job_statuses)
+        async with self.pool.read() as db:
+            async with db.execute(f"""
+                SELECT
+                    s.curriculum_id, s.lessons_with_flashcards, s.lessons_with_exercises, s.lessons_with_simulations,
+                    j.status AS job_status, j.error AS job_error
+                FROM curriculum_content_status s
+                JOIN curricula c ON c.id = s.curriculum_id
+                LEFT JOIN generation_jobs j ON j.curriculum_id = s.curriculum_id
+                WHERE j.status IN ({placeholders})
+                   OR (j.curriculum_id IS NULL AND c.is_content_generated = 0)
+                ORDER BY s.created_at
+                LIMIT ?
+            """, (*job_statuses, limit)) as cursor:
+                return [dict(row) for row in await cursor.fetchall()]
+
     async def get_full_curriculum_details(self, curriculum_id: str, include_content: bool = True) -> Optional[Dict[str, Any]]:
         """Get full curriculum details, optionally including all content."""
         curriculum = await self.get_curriculum(curriculum_id)
@@ -410,8 +547,7 @@ class Database:
         query += " ORDER BY c.created_at DESC LIMIT ?"
         params.append(limit)
         
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.pool.read() as db:
             async with db.execute(query, params) as cursor:
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
@@ -8,6 +8,8 @@ import aiosqlite
 import logging
 from pathlib import Path
 from typing import Dict, Any, List
+from backend.db_pool import get_pool
+from backend.db_pragmas import check_pragmas
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +18,7 @@ class DatabaseInitializer:
     
     def __init__(self, db_path: str = None):
         self.db_path = db_path or os.getenv("DATABASE_PATH", "./ai_tutor.db")
+        self.pool = get_pool(self.db_path)
         self.schema_path = self._find_schema_file()
     
     def _find_schema_file(self) -> str:
@@ -51,6 +54,7 @@ class DatabaseInitializer:
             "views_exist": False,
             "can_write": False,
             "record_count": {},
+            "pragmas": {},
             "errors": []
         }
         
@@ -63,11 +67,17 @@ class DatabaseInitializer:
                 return health_status
             
             # Try to connect to database
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.pool.read() as db:
                 health_status["database_accessible"] = True
                 
+                # Report the journal mode, sync level, etc. SQLite actually applied
+                health_status["pragmas"] = await check_pragmas(db)
+                
                 # Check if required tables exist
-                required_tables = ['metadata_extractions', 'curricula', 'learning_content', 'api_cache']
+                required_tables = [
+                    'metadata_extractions', 'curricula', 'learning_content', 'api_cache', 'llm_usage',
+                    'generation_jobs', 'generation_units'
+                ]
                 existing_tables = await self._get_existing_tables(db)
                 
                 missing_tables = [table for table in required_tables if table not in existing_tables]
@@ -144,7 +154,7 @@ class DatabaseInitializer:
                 logger.info(f"Created directory: {db_dir}")
             
             # Create database and load schema
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.pool.write() as db:
                 # Read schema file
                 with open(self.schema_path, 'r') as f:
                     schema = f.read()
@@ -182,6 +192,10 @@ class DatabaseInitializer:
             )
             
             if needs_creation:
+                # Pooled connections would keep pointing at the old file
+                reopen_pool = self.pool.is_open
+                await self.pool.close()
+
                 if health_check["database_exists"] and force_recreate:
                     # Backup existing database
                     backup_path = f"{self.db_path}.backup"
@@ -196,6 +210,8 @@ class DatabaseInitializer:
                 
                 # Create database
                 creation_success = await self.create_database()
+                if reopen_pool:
+                    await self.pool.open()
                 if not creation_success:
                     result["errors"].append("Failed to create database")
                     return result
@@ -243,7 +259,7 @@ class DatabaseInitializer:
                 return result
             
             # Database exists but has issues
-            async with aiosqlite.connect(self.db_path) as db:
+            async with self.pool.write() as db:
                 # Check and repair missing tables
                 if not health_check["tables_exist"]:
                     with open(self.schema_path, 'r') as f:
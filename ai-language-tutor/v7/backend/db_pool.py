@@ -0,0 +1,170 @@
+"""
+SQLite Connection Pool
+Shares a few long-lived read connections and one serialized writer between
+Database, ApiCache and DatabaseInitializer instead of opening a new
+aiosqlite connection (and thread) per call.
+"""
+
+import asyncio
+import os
+import time
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Any, List, Optional
+
+import aiosqlite
+
+from backend.db_pragmas import open_connection
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv("DATABASE_PATH", "./ai_tutor.db")
+POOL_READERS = int(os.getenv("DATABASE_POOL_READERS", 4))
+
+
+class _WaitStats:
+    """Acquisition counters for one side (read or write) of the pool"""
+
+    def __init__(self):
+        self.acquisitions = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float):
+        self.acquisitions += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "acquisitions": self.acquisitions,
+            "waiting": self.waiting,
+            "avg_wait_ms": round(self.total_wait / self.acquisitions * 1000, 3) if self.acquisitions else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 3)
+        }
+
+
+class ConnectionPool:
+    """Pool of long-lived read connections plus a single serialized writer.
+
+    Until open() is called (e.g. in scripts), read() and write() fall back to a
+    fresh connection per call, so callers never need to care whether the pool is up.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, readers: int = POOL_READERS):
+        self.db_path = db_path
+        self.readers = max(1, readers)
+        self._read_queue: Optional[asyncio.Queue] = None
+        self._read_connections: List[aiosqlite.Connection] = []
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._read_stats = _WaitStats()
+        self._write_stats = _WaitStats()
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await open_connection(self.db_path)
+        conn.row_factory = aiosqlite.Row
+        return conn
+
+    async def open(self):
+        """Open the reader and writer connections (no-op if already open)"""
+        if self.is_open:
+            return
+        self._writer = await self._connect()
+        self._read_queue = asyncio.Queue()
+        for _ in range(self.readers):
+            conn = await self._connect()
+            self._read_connections.append(conn)
+            self._read_queue.put_nowait(conn)
+        logger.info(f"Opened SQLite pool for {self.db_path}: {self.readers} readers, 1 writer")
+
+    async def close(self):
+        """Close every pooled connection"""
+        if not self.is_open:
+            return
+        # Let an in-progress write finish before closing the writer
+        async with self._write_lock:
+            for conn in self._read_connections:
+                await conn.close()
+            await self._writer.close()
+            self._read_connections = []
+            self._read_queue = None
+            self._writer = None
+        logger.info(f"Closed SQLite pool for {self.db_path}")
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a read connection. Do not write through it."""
+        if not self.is_open:
+            conn = await self._connect()
+            try:
+                yield conn
+            finally:
+                await conn.close()
+            return
+
+        queue = self._read_queue
+        started = time.monotonic()
+        self._read_stats.waiting += 1
+        try:
+            conn = await queue.get()
+        finally:
+            self._read_stats.waiting -= 1
+        self._read_stats.record(time.monotonic() - started)
+        try:
+            yield conn
+        finally:
+            queue.put_nowait(conn)
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Hold the single writer connection. Callers commit; failures are rolled back."""
+        if not self.is_open:
+            conn = await self._connect()
+            try:
+                yield conn
+            finally:
+                await conn.close()
+            return
+
+        started = time.monotonic()
+        self._write_stats.waiting += 1
+        try:
+            await self._write_lock.acquire()
+        finally:
+            self._write_stats.waiting -= 1
+        self._write_stats.record(time.monotonic() - started)
+        try:
+            yield self._writer
+        except BaseException:
+            # Never leave a half-finished transaction on the shared writer
+            await self._writer.rollback()
+            raise
+        finally:
+            self._write_lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool size and wait metrics"""
+        return {
+            "open": self.is_open,
+            "readers": self.readers,
+            "idle_readers": self._read_queue.qsize() if self._read_queue else 0,
+            "read": self._read_stats.as_dict(),
+            "write": self._write_stats.as_dict()
+        }
+
+
+_pools: Dict[str, ConnectionPool] = {}
+
+
+def get_pool(db_path: str = DB_PATH) -> ConnectionPool:
+    """Return the shared pool for a database file, creating it on first use"""
+    key = os.path.abspath(db_path)
+    if key not in _pools:
+        _pools[key] = ConnectionPool(db_path)
+    return _pools[key]
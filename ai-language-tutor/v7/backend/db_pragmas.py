@@ -0,0 +1,101 @@
+"""
+SQLite Pragma Profile
+Applies one tuned set of pragmas (WAL, synchronous, mmap, cache, temp store,
+busy timeout) to every connection the DB layer opens, and reports the
+settings SQLite actually ended up using.
+"""
+
+import os
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Any, Optional
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+# Defaults favour concurrent readers alongside background writers; override via env
+PRAGMA_PROFILE: Dict[str, Any] = {
+    # Only takes effect on a new, empty file; must precede journal_mode, which initializes it
+    "auto_vacuum": os.getenv("SQLITE_AUTO_VACUUM", "INCREMENTAL"),
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", -64_000)),  # negative = KiB, i.e. ~64MB
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+}
+
+# SQLite reports these pragmas as integers
+_AUTO_VACUUM_NAMES = {0: "NONE", 1: "FULL", 2: "INCREMENTAL"}
+_SYNCHRONOUS_NAMES = {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"}
+_TEMP_STORE_NAMES = {0: "DEFAULT", 1: "FILE", 2: "MEMORY"}
+
+
+async def apply_pragmas(conn: aiosqlite.Connection, profile: Optional[Dict[str, Any]] = None):
+    """Apply the pragma profile to an open connection"""
+    profile = profile or PRAGMA_PROFILE
+    # busy_timeout first so switching journal mode waits instead of failing on a locked file
+    for name in ("busy_timeout", "auto_vacuum", "journal_mode", "synchronous", "mmap_size", "cache_size", "temp_store"):
+        if name in profile and profile[name] is not None:
+            async with conn.execute(f"PRAGMA {name} = {profile[name]}") as cursor:
+                await cursor.fetchall()
+
+
+async def open_connection(db_path: str, profile: Optional[Dict[str, Any]] = None) -> aiosqlite.Connection:
+    """Open a connection with the pragma profile applied. Caller closes it."""
+    conn = await aiosqlite.connect(db_path)
+    try:
+        await apply_pragmas(conn, profile)
+    except Exception:
+        await conn.close()
+        raise
+    return conn
+
+
+@asynccontextmanager
+async def connect(db_path: str, profile: Optional[Dict[str, Any]] = None) -> AsyncIterator[aiosqlite.Connection]:
+    """Drop-in replacement for ``async with aiosqlite.connect(path)`` that applies the profile"""
+    conn = await open_connection(db_path, profile)
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+
+async def read_effective_pragmas(conn: aiosqlite.Connection) -> Dict[str, Any]:
+    """Read back the settings SQLite is actually using on this connection"""
+    effective = {}
+    for name in PRAGMA_PROFILE:
+        async with conn.execute(f"PRAGMA {name}") as cursor:
+            row = await cursor.fetchone()
+        effective[name] = row[0] if row else None
+    effective["auto_vacuum"] = _AUTO_VACUUM_NAMES.get(effective["auto_vacuum"], effective["auto_vacuum"])
+    effective["journal_mode"] = str(effective["journal_mode"]).upper()
+    effective["synchronous"] = _SYNCHRONOUS_NAMES.get(effective["synchronous"], effective["synchronous"])
+    effective["temp_store"] = _TEMP_STORE_NAMES.get(effective["temp_store"], effective["temp_store"])
+    return effective
+
+
+async def check_pragmas(conn: aiosqlite.Connection) -> Dict[str, Any]:
+    """Compare effective settings with the profile, e.g. WAL silently refused on network filesystems"""
+    effective = await read_effective_pragmas(conn)
+    mismatches = []
+    for name, expected in PRAGMA_PROFILE.items():
+        if expected is None:
+            continue
+        actual = effective.get(name)
+        if isinstance(expected, str):
+            matches = str(actual).upper() == expected.upper()
+        else:
+            matches = actual == expected
+        if not matches:
+            mismatches.append(name)
+    if mismatches:
+        logger.warning(f"SQLite pragmas differ from profile: {mismatches} (effective: {effective})")
+    return {
+        "profile": dict(PRAGMA_PROFILE),
+        "effective": effective,
+        "mismatches": mismatches,
+        "ok": not mismatches
+    }
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Offline load test for ContentGenerator
+Runs metadata -> curriculum -> all lesson content for several curricula at once
+against the fake LLM backend and a throwaway database, then reports throughput,
+LLM call counts and how the rate limiter and retry policy behaved. With
+--compare it runs the workload one call per lesson and batched
+(--lessons-per-call) and reports the calls, tokens and time saved. With
+--compare-scheduling it runs the workload with the old fixed batches of
+lessons and with the sliding window, and reports the wall-clock difference.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Must be set before the backend modules read them at import time
+_tmp_dir = tempfile.mkdtemp(prefix="load_test_")
+os.environ.setdefault("DATABASE_PATH", os.path.join(_tmp_dir, "load_test.db"))
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+import logging
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# Backend modules are imported after the environment above is set
+from backend.utils.rate_limiter import background_priority
+
+
+async def run_load_test(
+    curricula: int,
+    lessons: int,
+    latency: str,
+    error_rate: float,
+    seed: int,
+    lessons_per_call: int = 1,
+    batch_drop_rate: float = 0.0,
+    label: str = "load test",
+    report: bool = True,
+    in_flight: Optional[int] = None,
+    schedule: str = "window"
+) -> Dict[str, Any]:
+    from backend.db import db
+    from backend.db_init import db_initializer
+    from backend.content_generator import UNITS_IN_FLIGHT, content_generator
+    from backend.utils import generate_completions
+    from backend.utils.llm_backends import FakeBackend
+    from backend.utils.rate_limiter import limiter
+    from backend.utils.retry import retry_policy
+
+    fake = FakeBackend(
+        latency=latency,
+        error_rate=error_rate,
+        lessons=lessons,
+        seed=seed,
+        batch_drop_rate=batch_drop_rate
+    )
+    generate_completions.set_backend(fake)
+
+    await db_initializer.initialize_database()
+    await db.pool.open()
+
+    async def one_curriculum(n: int) -> float:
+        started = time.perf_counter()
+        metadata = {
+            "native_language": "English",
+            "target_language": "Spanish",
+            "proficiency": "beginner",
+            "title": f"Load test {n}",
+            "description": "Synthetic learning journey"
+        }
+        # The label keeps runs in one process from hitting each other's cache entries
+        query = f"{label} curriculum {n}"
+        extraction_id = await db.save_metadata_extraction(query=query, metadata=metadata, user_id=n)
+        curriculum_id = await content_generator.generate_curriculum_from_metadata(
+            metadata_extraction_id=extraction_id,
+            query=query,
+            metadata=metadata,
+            user_id=n
+        )
+        if schedule == "fixed":
+            await fixed_batch_generation(curriculum_id, lessons_per_call)
+        else:
+            await content_generator.generate_all_content_for_curriculum(
+                curriculum_id,
+                max_in_flight=in_flight or UNITS_IN_FLIGHT,
+                lessons_per_call=lessons_per_call
+            )
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    try:
+        durations = await asyncio.gather(*(one_curriculum(n) for n in range(curricula)))
+    finally:
+        await db.pool.close()
+    elapsed = time.perf_counter() - started
+
+    durations = sorted(durations)
+    result = {
+        "elapsed": elapsed,
+        "median": durations[len(durations) // 2],
+        "calls": fake.calls,
+        "tokens": fake.tokens
+    }
+    if not report:
+        return result
+
+    limiter_stats = limiter.stats()
+    retry_stats = retry_policy.stats()
+    print(f"Curricula: {curricula} x {lessons} lessons, latency {latency}, error rate {error_rate:.0%}, "
+          f"lessons per call {lessons_per_call}, {schedule} schedule")
+    print(f"Wall clock: {elapsed:.2f}s")
+    print(f"Per curriculum: min {durations[0]:.2f}s, median {durations[len(durations) // 2]:.2f}s, max {durations[-1]:.2f}s")
+    print(f"LLM calls: {fake.calls} ({fake.calls / elapsed:.1f}/s), tokens: {fake.tokens}, injected errors: {fake.errors}")
+    print(f"Retries: {retry_stats['retries']}, failed calls: {retry_stats['failures']}")
+    print(f"Limiter: max concurrency {limiter_stats['max_concurrency']}, "
+          f"background avg wait {limiter_stats['priorities']['background']['avg_wait_ms']}ms, "
+          f"max wait {limiter_stats['priorities']['background']['max_wait_ms']}ms")
+    if lessons_per_call > 1:
+        from backend.utils.lesson_batches import batch_stats
+        stats = batch_stats.stats()
+        print(f"Batches: {stats['batched_calls']} calls, {stats['lessons_accepted']}/{stats['lessons_requested']} "
+              f"lessons accepted, {stats['fallback_lessons']} regenerated one by one")
+    print(f"Database: {os.environ['DATABASE_PATH']}")
+    return result
+
+
+@background_priority
+async def fixed_batch_generation(curriculum_id: str, lessons_per_call: int, lessons_per_batch: int = 3):
+    """Baseline: how generate_all_content_for_curriculum scheduled lessons before the sliding window.
+    
+    Lessons went in fixed batches of lessons_per_batch (or lessons_per_call when
+    batching), content types one after another within a lesson, and the next
+    batch only started once the slowest call of the previous one returned.
+    """
+    from backend.content_generator import CONTENT_TYPES, content_generator
+    from backend.db import db
+
+    lessons, metadata = await content_generator.load_curriculum(curriculum_id)
+
+    async def sequential(lesson_index: int, lesson: Dict[str, Any]) -> List[Dict[str, Any]]:
+        items = []
+        for content_type in CONTENT_TYPES:
+            item = await content_generator.generate_content_item(curriculum_id, content_type, lesson_index, lesson, metadata)
+            if item is not None:
+                items.append(item)
+        return items
+
+    indexed_lessons = list(enumerate(lessons))
+    step = lessons_per_call if lessons_per_call > 1 else lessons_per_batch
+    for i in range(0, len(indexed_lessons), step):
+        batch = indexed_lessons[i:i + step]
+        if lessons_per_call > 1:
+            items = await content_generator.generate_batch_content_items(curriculum_id, batch, metadata)
+        else:
+            results = await asyncio.gather(*(sequential(index, lesson) for index, lesson in batch))
+            items = [item for result in results for item in result]
+        await db.save_learning_content_many(items)
+    await db.mark_curriculum_content_generated(curriculum_id)
+
+
+def _saving(before: float, after: float) -> str:
+    return f"{(before - after) / before:.0%}" if before else "n/a"
+
+
+async def compare_batching(curricula: int, lessons: int, latency: str, seed: int, lessons_per_call: int, batch_drop_rate: float):
+    """Run the same workload one call per lesson and batched, and report the difference"""
+    baseline = await run_load_test(curricula, lessons, latency, 0.0, seed, label="per-lesson", report=False)
+    batched = await run_load_test(
+        curricula, lessons, latency, 0.0, seed,
+        lessons_per_call=lessons_per_call,
+        batch_drop_rate=batch_drop_rate,
+        label="batched",
+        report=False
+    )
+
+    print(f"Curricula: {curricula} x {lessons} lessons, latency {latency}, "
+          f"{lessons_per_call} lessons per call, batch drop rate {batch_drop_rate:.0%}")
+    print(f"{'':<22}{'per lesson':>12}{'batched':>12}{'saved':>8}")
+    for name, key, fmt in [
+        ("LLM calls", "calls", "{:.0f}"),
+        ("Tokens (fake count)", "tokens", "{:.0f}"),
+        ("Wall clock (s)", "elapsed", "{:.2f}"),
+        ("Median curriculum (s)", "median", "{:.2f}"),
+    ]:
+        print(f"{name:<22}{fmt.format(baseline[key]):>12}{fmt.format(batched[key]):>12}"
+              f"{_saving(baseline[key], batched[key]):>8}")
+
+
+async def compare_scheduling(curricula: int, lessons: int, latency: str, seed: int, lessons_per_call: int, in_flight: int):
+    """Run the same workload with fixed lesson batches and with the sliding window, and report the difference"""
+    fixed = await run_load_test(
+        curricula, lessons, latency, 0.0, seed,
+        lessons_per_call=lessons_per_call,
+        label="fixed-batches",
+        report=False,
+        schedule="fixed"
+    )
+    window = await run_load_test(
+        curricula, lessons, latency, 0.0, seed,
+        lessons_per_call=lessons_per_call,
+        label="sliding-window",
+        report=False,
+        in_flight=in_flight
+    )
+
+    print(f"Curricula: {curricula} x {lessons} lessons, latency {latency}, "
+          f"lessons per call {lessons_per_call}, {in_flight} calls in flight per curriculum")
+    print(f"{'':<22}{'fixed':>12}{'window':>12}{'saved':>8}")
+    for name, key, fmt in [
+        ("LLM calls", "calls", "{:.0f}"),
+        ("Wall clock (s)", "elapsed", "{:.2f}"),
+        ("Median curriculum (s)", "median", "{:.2f}"),
+    ]:
+        print(f"{name:<22}{fmt.format(fixed[key]):>12}{fmt.format(window[key]):>12}"
+              f"{_saving(fixed[key], window[key]):>8}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline ContentGenerator load test using the fake LLM backend")
+    parser.add_argument("--curricula", type=int, default=5, help="Curricula generated concurrently")
+    parser.add_argument("--lessons", type=int, default=5, help="Lessons per curriculum")
+    parser.add_argument(
+        "--latency",
+        default="lognormal:800,0.4",
+        help="Fake LLM latency: fixed:MS, uniform:MIN,MAX, normal:MEAN,STDDEV or lognormal:MEDIAN,SIGMA"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls failing with 429/503")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for fake content, latency and errors")
+    parser.add_argument("--lessons-per-call", type=int, default=1, help="Lessons per batched content call (1 = off)")
+    parser.add_argument(
+        "--batch-drop-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of lessons the fake backend leaves out of batched responses"
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Run once per lesson and once with --lessons-per-call, and compare calls, tokens and latency"
+    )
+    parser.add_argument(
+        "--in-flight",
+        type=int,
+        default=None,
+        help="LLM calls kept in flight per curriculum (default: GENERATION_UNITS_IN_FLIGHT)"
+    )
+    parser.add_argument(
+        "--compare-scheduling",
+        action="store_true",
+        help="Run with fixed batches of lessons and with the sliding window, and compare wall-clock time"
+    )
+
+    args = parser.parse_args()
+    if args.compare_scheduling:
+        from backend.content_generator import UNITS_IN_FLIGHT
+        asyncio.run(compare_scheduling(
+            args.curricula, args.lessons, args.latency, args.seed,
+            args.lessons_per_call, args.in_flight or UNITS_IN_FLIGHT
+        ))
+    elif args.compare:
+        asyncio.run(compare_batching(
+            args.curricula, args.lessons, args.latency, args.seed,
+            max(2, args.lessons_per_call), args.batch_drop_rate
+        ))
+    else:
+        asyncio.run(run_load_test(
+            args.curricula, args.lessons, args.latency, args.error_rate, args.seed,
+            lessons_per_call=args.lessons_per_call,
+            batch_drop_rate=args.batch_drop_rate,
+            in_flight=args.in_flight
+        ))
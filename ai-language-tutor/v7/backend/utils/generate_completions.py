@@ -1,19 +1,29 @@
-from openai import AsyncOpenAI, OpenAI
 import asyncio
 import json
+import time
 from typing import AsyncIterator
 from typing import Union, List, Dict, Literal
 from dotenv import load_dotenv
 import os
 from pydantic import BaseModel
+from backend.utils.rate_limiter import limiter, estimate_tokens
+from backend.utils.retry import admitted, retry_policy
+from backend.utils.llm_backends import LLMBackend, create_backend
+from backend.utils.token_usage import usage_recorder
 
 load_dotenv()
 
-# Initialize the async client
-client = AsyncOpenAI(
-    base_url=os.getenv("BASE_URL"),
-    api_key=os.getenv("API_KEY"),
-)
+# Wall-clock cap on one LLM request; the client's own timeout only bounds each network read,
+# so a connection that keeps trickling bytes could otherwise hold a limiter slot forever
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", 90))
+
+# Provider behind get_completions (LLM_BACKEND=openai, or fake for offline load tests)
+llm_backend: LLMBackend = create_backend()
+
+def set_backend(new_backend: LLMBackend):
+    """Swap the provider, e.g. to a FakeBackend with custom latency in a load-test script"""
+    global llm_backend
+    llm_backend = new_backend
 
 class Message(BaseModel):
     role: Literal["user", "assistant"]
@@ -52,6 +62,8 @@ async def get_completions(
 
     processed_prompt = process_input(formatted_query)
 
+    # Static instructions first (their metadata is at the very end), conversation last,
+    # so providers that cache prompt prefixes can reuse everything up to the metadata
     messages = [{"role": "system", "content": instructions}]
 
     if isinstance(processed_prompt, str):
@@ -72,10 +84,23 @@ async def get_completions(
     else:
         raise TypeError("Unexpected processed input type.")
 
-    response = await client.chat.completions.create(
-        model=os.getenv("MODEL", "gemini-2.0-flash"),
-        messages=messages,
-        response_format={"type": "json_object"}
-    )
-
-    return response.choices[0].message.content  # adjust based on your client
+    estimated_tokens = estimate_tokens(messages)
+
+    async def attempt() -> str:
+        # Wait for a slot under the process-wide concurrency and RPM/TPM budgets
+        async with limiter.slot(tokens=estimated_tokens) as usage:
+            # Retry/hedge timing starts here, not while queued for the slot
+            admitted()
+            started = time.monotonic()
+            # A timed-out attempt raises TimeoutError, which retry_policy retries
+            completion = await asyncio.wait_for(
+                llm_backend.complete(messages, response_format={"type": "json_object"}),
+                LLM_CALL_TIMEOUT
+            )
+            usage["total_tokens"] = completion.total_tokens
+        # Attributed to the curriculum/content type/lesson of the enclosing usage_scope
+        usage_recorder.record(completion, llm_backend.model, time.monotonic() - started)
+        return completion.content
+
+    # Each retry or hedge is a separate request and takes its own limiter slot
+    return await retry_policy.run(attempt)
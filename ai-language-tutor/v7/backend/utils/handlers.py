@@ -4,6 +4,8 @@ from typing import Callable, Dict, Any
 from backend import config
 from backend.content_generator import content_generator
 from backend.utils import generate_completions
+from backend.utils.prompt_templates import render_instructions
+from backend.utils.token_usage import usage_scope
 
 async def handle_generation_request(
     data: Any,
@@ -32,18 +34,14 @@ async def handle_generation_request(
         )
 
     # Format instructions with metadata
-    instructions = (
-        instructions_template
-        .replace("{native_language}", data.native_language)
-        .replace("{target_language}", data.target_language)
-        .replace("{proficiency}", data.proficiency)
-    )
+    instructions = render_instructions(instructions_template, data.native_language, data.target_language, data.proficiency)
 
     # Generate new content
-    response = await generate_completions.get_completions(
-        data.query,
-        instructions
-    )
+    with usage_scope(content_type=mode):
+        response = await generate_completions.get_completions(
+            data.query,
+            instructions
+        )
 
     # Save generated content to database
     content_id = await content_generator.save_content(
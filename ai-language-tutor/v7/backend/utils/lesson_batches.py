@@ -0,0 +1,138 @@
+"""
+Multi-lesson Batches
+Opt-in mode where one LLM call produces one content type (flashcards,
+exercises or simulation) for several lessons at once, so the long mode
+instructions are sent once per batch instead of once per lesson. The batched
+response is validated and split per lesson; lessons that come back missing or
+malformed are regenerated one by one by the caller.
+"""
+
+import os
+import re
+from typing import Any, Dict, List, Sequence, Tuple
+
+from backend.utils.content_validation import ContentValidationError, content_validator, parse_json
+from backend.utils.rate_limiter import estimate_tokens
+
+# Lessons per batched call; 0 or 1 keeps the one-call-per-lesson path
+LESSONS_PER_CALL = int(os.getenv("LESSONS_PER_CALL", 1))
+
+# Appended after the (static) mode instructions so the shared prefix stays identical
+BATCH_MARKER = "# Batch mode"
+BATCH_INSTRUCTIONS = f"""
+
+{BATCH_MARKER}
+The user message lists several lessons, one per line, as "Lesson <index>: <lesson topic and description>".
+Generate the content described above separately for each listed lesson, treating every lesson as if it were the only input.
+Return a single JSON object of the form {{"lessons": [{{"lesson_index": <index>, "content": <the JSON you would return for that lesson alone>}}]}} with exactly one entry per listed lesson, in the same order.
+"""
+
+LESSON_LINE = re.compile(r"^Lesson (\d+): (.*)$", re.MULTILINE)
+
+
+def batch_instructions(instructions: str) -> str:
+    return instructions + BATCH_INSTRUCTIONS
+
+
+def batch_prompt(lessons: Sequence[Tuple[int, str]]) -> str:
+    """User message listing (lesson_index, lesson_context) pairs"""
+    return "\n".join(f"Lesson {index}: {' '.join(context.split())}" for index, context in lessons)
+
+
+def parse_batch_prompt(prompt: str) -> List[Tuple[int, str]]:
+    return [(int(index), context) for index, context in LESSON_LINE.findall(prompt)]
+
+
+def split_batch_response(content_type: str, response: str, lesson_indices: Sequence[int]) -> Dict[int, Any]:
+    """Map lesson_index -> content for every lesson of the batch whose content is valid.
+
+    Lessons that are missing, duplicated, unexpected or malformed are left out;
+    an unparseable response yields an empty dict.
+    """
+    try:
+        document, _ = parse_json(response)
+    except ContentValidationError:
+        return {}
+    entries = document.get("lessons") if isinstance(document, dict) else document
+    if not isinstance(entries, list):
+        return {}
+
+    wanted = set(lesson_indices)
+    seen: Dict[int, int] = {}
+    accepted: Dict[int, Any] = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            index = int(entry.get("lesson_index"))
+        except (TypeError, ValueError):
+            continue
+        seen[index] = seen.get(index, 0) + 1
+        if index not in wanted:
+            continue
+        # Lessons with rejected items are regenerated on their own, where only those get re-requested
+        checked = content_validator.check(content_type, entry.get("content"))
+        if checked.error is None and not checked.rejected:
+            accepted[index] = checked.content()
+    # An index the model answered twice is ambiguous: regenerate it on its own
+    return {index: content for index, content in accepted.items() if seen[index] == 1}
+
+
+def _prompt_tokens(messages: List[Dict[str, str]]) -> int:
+    # estimate_tokens adds the expected completion, which is the same on both paths
+    return estimate_tokens(messages) - estimate_tokens([])
+
+
+class BatchStats:
+    """Counts batched calls and estimates what they saved over one call per lesson"""
+
+    def __init__(self):
+        self.calls = 0
+        self.failed_calls = 0
+        self.lessons_requested = 0
+        self.lessons_accepted = 0
+        self.prompt_tokens = 0
+        self.per_lesson_prompt_tokens = 0
+        self.batch_seconds = 0.0
+
+    def record(
+        self,
+        instructions: str,
+        batch_messages: List[Dict[str, str]],
+        lesson_prompts: Dict[int, str],
+        accepted: Sequence[int],
+        seconds: float,
+        failed: bool = False
+    ):
+        """Account for one batched call; rejected lessons are charged as the per-lesson calls they fall back to"""
+        self.calls += 1
+        self.failed_calls += int(failed)
+        self.lessons_requested += len(lesson_prompts)
+        self.lessons_accepted += len(accepted)
+        self.batch_seconds += seconds
+        self.prompt_tokens += _prompt_tokens(batch_messages)
+        for index, prompt in lesson_prompts.items():
+            single = _prompt_tokens([{"role": "system", "content": instructions}, {"role": "user", "content": prompt}])
+            self.per_lesson_prompt_tokens += single
+            if index not in accepted:
+                self.prompt_tokens += single
+
+    def stats(self) -> Dict[str, Any]:
+        fallbacks = self.lessons_requested - self.lessons_accepted
+        return {
+            "lessons_per_call": LESSONS_PER_CALL,
+            "batched_calls": self.calls,
+            "failed_batched_calls": self.failed_calls,
+            "lessons_requested": self.lessons_requested,
+            "lessons_accepted": self.lessons_accepted,
+            "fallback_lessons": fallbacks,
+            # Calls made (batches plus fallbacks) against one call per lesson
+            "calls_saved": self.lessons_requested - self.calls - fallbacks,
+            "estimated_prompt_tokens": self.prompt_tokens,
+            "estimated_per_lesson_prompt_tokens": self.per_lesson_prompt_tokens,
+            "estimated_prompt_tokens_saved": self.per_lesson_prompt_tokens - self.prompt_tokens,
+            "avg_batch_latency_ms": round(self.batch_seconds / self.calls * 1000, 1) if self.calls else None
+        }
+
+
+batch_stats = BatchStats()
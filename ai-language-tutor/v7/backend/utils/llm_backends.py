@@ -0,0 +1,377 @@
+"""
+LLM Backends
+The provider behind get_completions. "openai" talks to any OpenAI-compatible
+API; "fake" is a deterministic local stand-in that returns schema-valid
+metadata/curriculum/flashcards/exercises/simulation JSON with configurable
+latency and error rates, so the generation pipeline can be load-tested
+without spending tokens. Select with LLM_BACKEND.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from backend import config
+from backend.utils.http_pool import HttpPool
+from backend.utils.prompt_templates import get_template
+from backend.utils.lesson_batches import BATCH_MARKER, parse_batch_prompt
+
+
+class Completion(NamedTuple):
+    content: str
+    total_tokens: Optional[int] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    # Prompt tokens the provider served from its prefix cache
+    cached_tokens: Optional[int] = None
+
+
+class LLMBackend(ABC):
+    """A chat-completions provider. Implementations raise openai exceptions for API failures."""
+
+    name = "base"
+    model = "unknown"
+
+    @abstractmethod
+    async def complete(self, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None) -> Completion:
+        ...
+
+    async def prewarm(self) -> int:
+        """Open connections ahead of the first requests; returns how many are ready"""
+        return 0
+
+    async def aclose(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name}
+
+    def http_pool_stats(self) -> Optional[Dict[str, Any]]:
+        """Connection pool utilization, for backends that talk HTTP"""
+        return None
+
+
+class OpenAIBackend(LLMBackend):
+    """Any OpenAI-compatible endpoint (BASE_URL, API_KEY, MODEL)"""
+
+    name = "openai"
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None, model: Optional[str] = None):
+        self.model = model or os.getenv("MODEL", "gemini-2.0-flash")
+        # Sized, keep-alive connection pool shared by every request of this backend
+        self.http_pool = HttpPool()
+        self.client = AsyncOpenAI(
+            base_url=base_url or os.getenv("BASE_URL"),
+            api_key=api_key or os.getenv("API_KEY"),
+            # Retries are handled by retry_policy so they can be logged, hedged and counted
+            max_retries=0,
+            timeout=float(os.getenv("LLM_TIMEOUT", 60)),
+            http_client=self.http_pool.client,
+        )
+
+    async def complete(self, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None) -> Completion:
+        kwargs = {"response_format": response_format} if response_format else {}
+        response = await self.client.chat.completions.create(model=self.model, messages=messages, **kwargs)
+        content = response.choices[0].message.content
+        usage = response.usage
+        if usage is None:
+            return Completion(content)
+        details = getattr(usage, "prompt_tokens_details", None)
+        return Completion(
+            content,
+            total_tokens=usage.total_tokens,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            cached_tokens=getattr(details, "cached_tokens", None)
+        )
+
+    async def prewarm(self) -> int:
+        return await self.http_pool.prewarm(self.client)
+
+    async def aclose(self):
+        # Also closes the pool's httpx client
+        await self.client.close()
+
+    def http_pool_stats(self) -> Optional[Dict[str, Any]]:
+        return self.http_pool.stats()
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Build a latency sampler (seconds) from "fixed:MS", "uniform:MIN_MS,MAX_MS",
+    "normal:MEAN_MS,STDDEV_MS" or "lognormal:MEDIAN_MS,SIGMA"."""
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",") if value.strip()]
+    kind = kind.strip().lower()
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0] / 1000
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == "normal" and len(values) == 2:
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1])) / 1000
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+def _signature(template: str) -> str:
+    """Static part of a template, used to recognise its rendered instructions"""
+    return get_template(template).static.strip()
+
+
+_STATUS_ERRORS = {
+    400: openai.BadRequestError,
+    409: openai.ConflictError,
+    429: openai.RateLimitError,
+    500: openai.InternalServerError,
+    503: openai.InternalServerError,
+}
+
+
+def _header(instructions: str, label: str) -> Optional[str]:
+    """Read a "# Native language: X" style metadata header from rendered instructions"""
+    match = re.search(rf"#\s*{label}:\s*(.+)", instructions)
+    return match.group(1).strip() if match else None
+
+
+class FakeBackend(LLMBackend):
+    """Deterministic offline provider.
+
+    The same request always produces the same content. Latency and injected errors
+    are drawn from a generator seeded by (seed, request, n-th time it was seen),
+    so a whole run is reproducible and a retried request can succeed.
+    """
+
+    name = "fake"
+    model = "fake"
+
+    TEMPLATES = {
+        "metadata": config.language_metadata_extraction_prompt,
+        "curriculum": config.curriculum_instructions,
+        "flashcards": config.flashcard_mode_instructions,
+        "exercises": config.exercise_mode_instructions,
+        "simulation": config.simulation_mode_instructions,
+    }
+
+    # Share of a call's latency spent generating output; a batch of n lessons
+    # produces n lessons' worth of output, so it takes correspondingly longer
+    OUTPUT_LATENCY_SHARE = 0.8
+
+    # Prompt prefix caching modelled on hosted providers: prompts of at least
+    # 1024 tokens are cached in 128-token blocks, ~4 characters per token
+    PREFIX_CACHE_MIN_TOKENS = 1024
+    PREFIX_CACHE_BLOCK_TOKENS = 128
+
+    def __init__(
+        self,
+        latency: str = "lognormal:800,0.4",
+        error_rate: float = 0.0,
+        error_statuses: Tuple[int, ...] = (429, 503),
+        timeout_rate: float = 0.0,
+        lessons: int = 5,
+        seed: int = 0,
+        batch_drop_rate: float = 0.0
+    ):
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.timeout_rate = timeout_rate
+        self.lessons = lessons
+        self.seed = seed
+        # Chance that a lesson is left out of a multi-lesson response
+        self.batch_drop_rate = batch_drop_rate
+        self.signatures = {mode: _signature(template) for mode, template in self.TEMPLATES.items()}
+        self._seen: Dict[str, int] = {}
+        self._cached_prefixes: set = set()
+        self.calls = 0
+        self.errors = 0
+        self.tokens = 0
+
+    def detect_mode(self, instructions: str) -> Optional[str]:
+        for mode, signature in self.signatures.items():
+            if signature and signature in instructions:
+                return mode
+        return None
+
+    async def complete(self, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None) -> Completion:
+        request_key = hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+        occurrence = self._seen.get(request_key, 0)
+        self._seen[request_key] = occurrence + 1
+        self.calls += 1
+        call_rng = random.Random(f"{self.seed}:{request_key}:{occurrence}")
+
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        batch = parse_batch_prompt(user) if BATCH_MARKER in system else []
+
+        latency = self.sample_latency(call_rng)
+        if len(batch) > 1:
+            latency *= 1 + (len(batch) - 1) * self.OUTPUT_LATENCY_SHARE
+        await asyncio.sleep(latency)
+
+        roll = call_rng.random()
+        request = httpx.Request("POST", "http://fake-llm/v1/chat/completions")
+        if roll < self.timeout_rate:
+            self.errors += 1
+            raise openai.APITimeoutError(request=request)
+        if roll < self.timeout_rate + self.error_rate:
+            self.errors += 1
+            status = call_rng.choice(self.error_statuses)
+            response = httpx.Response(status, request=request, json={"error": {"message": "injected by fake backend"}})
+            error_class = _STATUS_ERRORS.get(status, openai.APIStatusError)
+            raise error_class(f"Fake backend error {status}", response=response, body=None)
+
+        mode = self.detect_mode(system)
+        if batch:
+            document = {"lessons": [
+                {
+                    "lesson_index": index,
+                    "content": self._generate(mode, system, lesson, random.Random(f"{self.seed}:{request_key}:{index}"))
+                }
+                for index, lesson in batch
+                if call_rng.random() >= self.batch_drop_rate
+            ]}
+        else:
+            document = self._generate(mode, system, user, random.Random(f"{self.seed}:{request_key}"))
+        content = json.dumps(document, ensure_ascii=False)
+        prompt = "".join(m.get("content") or "" for m in messages)
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        self.tokens += prompt_tokens + completion_tokens
+        return Completion(
+            content,
+            total_tokens=prompt_tokens + completion_tokens,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=self._cached_prefix_tokens(prompt)
+        )
+
+    def _cached_prefix_tokens(self, prompt: str) -> int:
+        """Tokens of the prompt's leading blocks that an earlier prompt already started with"""
+        if len(prompt) // 4 < self.PREFIX_CACHE_MIN_TOKENS:
+            return 0
+        block = self.PREFIX_CACHE_BLOCK_TOKENS * 4
+        cached = 0
+        hit = True
+        for end in range(block, len(prompt) + 1, block):
+            prefix = hashlib.sha256(prompt[:end].encode()).digest()
+            if hit and prefix in self._cached_prefixes:
+                cached = end // 4
+            else:
+                hit = False
+                self._cached_prefixes.add(prefix)
+        return cached
+
+    def _generate(self, mode: Optional[str], instructions: str, query: str, rng: random.Random) -> Any:
+        native = _header(instructions, "Native language") or "English"
+        target = _header(instructions, "Target language") or "Spanish"
+        proficiency = _header(instructions, "Proficiency level") or "beginner"
+        topic = " ".join(query.split()[:6]) or "everyday conversation"
+        tag = f"{rng.randrange(16 ** 6):06x}"
+
+        if mode == "metadata":
+            return {
+                "native_language": native.lower(),
+                "target_language": target.lower(),
+                "proficiency": rng.choice(["beginner", "intermediate", "advanced"]),
+                "title": f"{target} for {topic}"[:60],
+                "description": f"A practical journey into {target} through {topic}."
+            }
+        if mode == "curriculum":
+            return {
+                "lesson_topic": f"{target} for {topic}",
+                "sub_topics": [
+                    {
+                        "sub_topic": f"Lesson {i + 1}: {topic} {tag}-{i}",
+                        "keywords": [f"topic {i + 1}", proficiency][:rng.randint(1, 2)],
+                        "description": f"Learners will handle situation {i + 1} about {topic} in {target}."
+                    }
+                    for i in range(self.lessons)
+                ]
+            }
+        if mode == "flashcards":
+            return {
+                "flashcards": [
+                    {
+                        "word": f"{target.lower()}-word-{tag}-{i}",
+                        "definition": f"Definition {i + 1} in {native}",
+                        "example": f"Example sentence {i + 1} using {target.lower()}-word-{tag}-{i}."
+                    }
+                    for i in range(10)
+                ]
+            }
+        if mode == "exercises":
+            exercises = []
+            for i in range(5):
+                choices = [f"option-{tag}-{i}-{c}" for c in range(4)]
+                answer = choices[0]
+                rng.shuffle(choices)
+                exercises.append({
+                    "sentence": f"Sentence {i + 1} about {topic} with a ___ in it.",
+                    "answer": answer,
+                    "choices": choices,
+                    "explanation": f"'{answer}' is the only option that fits this context."
+                })
+            return {"exercises": exercises}
+        if mode == "simulation":
+            speakers = ["Narrator", "Alex", "Sam"]
+            return {
+                "title": f"A story about {topic}",
+                "setting": f"A short scene in {target} about {topic}.",
+                "content": [
+                    {
+                        "speaker": speakers[i % len(speakers)],
+                        "target_language_text": f"Line {i + 1} in {target} ({tag}).",
+                        "phonetics": "",
+                        "base_language_translation": f"Line {i + 1} in {native}."
+                    }
+                    for i in range(10)
+                ]
+            }
+        return {"response": f"Fake response to: {topic}"}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "errors": self.errors,
+            "tokens": self.tokens,
+            "distinct_requests": len(self._seen)
+        }
+
+
+BACKENDS: Dict[str, Type[LLMBackend]] = {
+    OpenAIBackend.name: OpenAIBackend,
+    FakeBackend.name: FakeBackend,
+}
+
+
+def register_backend(name: str, backend_class: Type[LLMBackend]):
+    """Make another provider selectable with LLM_BACKEND=<name>"""
+    BACKENDS[name] = backend_class
+
+
+def create_backend(name: Optional[str] = None) -> LLMBackend:
+    name = (name or os.getenv("LLM_BACKEND", "openai")).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend {name!r}; available: {sorted(BACKENDS)}")
+    if name == FakeBackend.name:
+        return FakeBackend(
+            latency=os.getenv("LLM_FAKE_LATENCY", "lognormal:800,0.4"),
+            error_rate=float(os.getenv("LLM_FAKE_ERROR_RATE", 0)),
+            error_statuses=tuple(int(s) for s in os.getenv("LLM_FAKE_ERROR_STATUSES", "429,503").split(",")),
+            timeout_rate=float(os.getenv("LLM_FAKE_TIMEOUT_RATE", 0)),
+            lessons=int(os.getenv("LLM_FAKE_LESSONS", 5)),
+            seed=int(os.getenv("LLM_FAKE_SEED", 0)),
+            batch_drop_rate=float(os.getenv("LLM_FAKE_BATCH_DROP_RATE", 0))
+        )
+    return BACKENDS[name]()
@@ -0,0 +1,143 @@
+"""
+Generation Task Registry
+Background generations are started through the registry instead of a bare
+asyncio.create_task. The event loop only keeps weak references to tasks, so
+the registry holds strong ones until they finish; it also puts a deadline on
+every generation, cancels whatever is still running at shutdown and lets the
+admin endpoints list and cancel in-flight generations.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Coroutine, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Wall-clock budget for generating all content of one curriculum
+GENERATION_TIMEOUT = float(os.getenv("GENERATION_TIMEOUT", 15 * 60))
+# Finished generations kept for the admin listing
+HISTORY_SIZE = int(os.getenv("GENERATION_HISTORY_SIZE", 50))
+
+
+class GenerationTask:
+    """One supervised background generation"""
+
+    def __init__(self, key: str, kind: str, timeout: Optional[float]):
+        self.key = key
+        self.kind = kind
+        self.timeout = timeout
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.cancel_reason: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        end = self.finished if self.finished is not None else time.time()
+        return {
+            "key": self.key,
+            "kind": self.kind,
+            "status": self.status,
+            "started_at": self.started,
+            "elapsed_s": round(end - self.started, 2),
+            "deadline_at": self.started + self.timeout if self.timeout else None,
+            "cancel_reason": self.cancel_reason,
+            "error": self.error
+        }
+
+
+class TaskRegistry:
+    """Strong references, deadlines and cancellation for background generations"""
+
+    def __init__(self, timeout: Optional[float] = GENERATION_TIMEOUT, history: int = HISTORY_SIZE):
+        self.timeout = timeout
+        self.active: Dict[str, GenerationTask] = {}
+        self.recent: Deque[GenerationTask] = deque(maxlen=history)
+        self.counts = {"started": 0, "completed": 0, "failed": 0, "timed_out": 0, "cancelled": 0, "deduplicated": 0}
+
+    def start(
+        self,
+        key: str,
+        coro: Coroutine,
+        kind: str = "content",
+        timeout: Optional[float] = None
+    ) -> GenerationTask:
+        """Run coro in the background under key; a generation already running under key is reused"""
+        running = self.active.get(key)
+        if running is not None:
+            # Close the unused coroutine so it doesn't warn about never being awaited
+            coro.close()
+            self.counts["deduplicated"] += 1
+            return running
+
+        entry = GenerationTask(key, kind, timeout if timeout is not None else self.timeout)
+        self.active[key] = entry
+        self.counts["started"] += 1
+        entry.task = asyncio.get_running_loop().create_task(self._supervise(entry, coro), name=f"{kind}:{key}")
+        return entry
+
+    async def _supervise(self, entry: GenerationTask, coro: Coroutine):
+        deadline = asyncio.timeout(entry.timeout)
+        try:
+            async with deadline:
+                await coro
+        except TimeoutError as e:
+            if not deadline.expired():
+                # A timeout from inside the generation, not our deadline
+                entry.status = "failed"
+                entry.error = f"Timed out: {e}"
+            else:
+                entry.status = "timed_out"
+                entry.error = f"Exceeded {entry.timeout:g}s deadline"
+            logger.error(f"Generation {entry.key} {entry.status}: {entry.error}")
+        except asyncio.CancelledError:
+            entry.status = "cancelled"
+            entry.cancel_reason = entry.cancel_reason or "cancelled"
+            logger.warning(f"Generation {entry.key} cancelled ({entry.cancel_reason})")
+            raise
+        except Exception as e:
+            entry.status = "failed"
+            entry.error = str(e)
+            logger.error(f"Generation {entry.key} failed: {e}")
+        else:
+            entry.status = "completed"
+        finally:
+            entry.finished = time.time()
+            self.counts[entry.status] += 1
+            if self.active.get(entry.key) is entry:
+                del self.active[entry.key]
+            self.recent.append(entry)
+
+    def cancel(self, key: str, reason: str = "admin") -> bool:
+        """Cancel a running generation; False if nothing is running under key"""
+        entry = self.active.get(key)
+        if entry is None or entry.task is None or entry.task.done():
+            return False
+        entry.cancel_reason = reason
+        entry.task.cancel()
+        return True
+
+    async def shutdown(self, grace: float = 5.0):
+        """Cancel every running generation and wait (up to grace seconds) for them to unwind"""
+        tasks = [entry.task for entry in self.active.values() if entry.task is not None]
+        for key in list(self.active):
+            self.cancel(key, reason="shutdown")
+        if tasks:
+            await asyncio.wait(tasks, timeout=grace)
+            logger.info(f"Cancelled {len(tasks)} running generation(s) at shutdown")
+
+    def list(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {
+            "active": [entry.as_dict() for entry in self.active.values()],
+            "recent": [entry.as_dict() for entry in reversed(self.recent)]
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"active": len(self.active), "timeout_s": self.timeout, **self.counts}
+
+
+task_registry = TaskRegistry()
@@ -0,0 +1,146 @@
+"""
+Shared test setup: a throwaway database and the offline fake LLM backend.
+
+backend reads its settings when it is imported, so the environment is set
+here, before any test module imports it.
+
+Run from v7/: python -m pytest tests
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+_tmp_dir = tempfile.mkdtemp(prefix="ai-tutor-tests-")
+os.environ["DATABASE_PATH"] = os.path.join(_tmp_dir, "test.db")
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["LLM_FAKE_LATENCY"] = "fixed:5"
+os.environ.setdefault("API_KEY", "test")
+
+import httpx
+import openai
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.utils import generate_completions
+from backend.utils.llm_backends import FakeBackend
+
+LESSONS = 3
+
+
+class ScriptedBackend(FakeBackend):
+    """Fake backend that records which content types it was asked for and refuses some of them"""
+
+    def __init__(self, refuse: Iterable[str] = (), **kwargs):
+        kwargs.setdefault("latency", os.environ["LLM_FAKE_LATENCY"])
+        super().__init__(lessons=LESSONS, **kwargs)
+        self.refuse = set(refuse)
+        # (content type, user prompt) of every call
+        self.requested: List[Tuple[Optional[str], str]] = []
+
+    def modes_requested(self, containing: str = "") -> Set[Optional[str]]:
+        """Content types asked for in calls whose prompt contains the given text"""
+        return {mode for mode, prompt in self.requested if containing in prompt}
+
+    async def complete(self, messages, response_format=None):
+        mode = self.detect_mode(messages[0]["content"])
+        self.requested.append((mode, messages[-1]["content"]))
+        if mode in self.refuse:
+            # A 400 isn't retried, so the unit fails on the spot
+            request = httpx.Request("POST", "http://fake-llm/v1/chat/completions")
+            response = httpx.Response(400, request=request, json={"error": {"message": "refused"}})
+            raise openai.BadRequestError("Refused by test backend", response=response, body=None)
+        return await super().complete(messages, response_format)
+
+
+@pytest.fixture(scope="session")
+def client():
+    """The app with its startup (database, generation worker) run once for the whole session.
+
+    Coroutines that use the app's database connections must run on its loop:
+    client.portal.call(coroutine_function, *args).
+    """
+    from backend.main import app
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def db_path(tmp_path) -> str:
+    """A database of its own with the schema loaded, for tests that don't need the app"""
+    from backend.db_init import DatabaseInitializer
+    path = str(tmp_path / "own.db")
+    assert asyncio.run(DatabaseInitializer(path).create_database())
+    return path
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Swap in a fresh fake backend for one test"""
+    def use(backend: FakeBackend) -> FakeBackend:
+        monkeypatch.setattr(generate_completions, "llm_backend", backend)
+        return backend
+    return use
+
+
+def curriculum(lessons: int = LESSONS) -> Dict[str, Any]:
+    """A curriculum document, so tests don't depend on (or share) generated ones.
+
+    Lesson titles are unique, so no LLM response is served from the API cache.
+    """
+    tag = uuid.uuid4().hex[:8]
+    return {
+        "lesson_topic": "Spanish for travel",
+        "sub_topics": [
+            {
+                "sub_topic": f"Lesson {i + 1}: at the station ({tag})",
+                "keywords": ["travel"],
+                "description": f"Situation {i + 1} of a trip to Madrid."
+            }
+            for i in range(lessons)
+        ]
+    }
+
+
+async def create_curriculum(lessons: int = LESSONS, database=None) -> str:
+    """Save a metadata extraction and a curriculum without calling the LLM. Returns the curriculum ID.
+
+    Saved to the app's database unless another backend.db.Database is given.
+    """
+    from backend.db import db
+    database = database or db
+    extraction_id = await database.save_metadata_extraction(
+        query="I want to travel in Spain",
+        metadata={
+            "native_language": "english",
+            "target_language": "spanish",
+            "proficiency": "beginner",
+            "title": "Spanish for travel",
+            "description": "Getting around Spain"
+        },
+        user_id=1
+    )
+    return await database.save_curriculum(extraction_id, curriculum(lessons), user_id=1)
+
+
+async def curriculum_tag(curriculum_id: str) -> str:
+    """The unique tag in a test curriculum's lesson titles, found in every prompt about its lessons"""
+    from backend.db import db
+    row = await db.get_curriculum(curriculum_id)
+    title = json.loads(row["curriculum_json"])["sub_topics"][0]["sub_topic"]
+    return title[title.rindex("(") + 1:-1]
+
+
+def wait_for(condition: Callable[[], Any], timeout: float = 10.0, interval: float = 0.05) -> Any:
+    """Poll until condition() is truthy and return its value; fail the test on timeout"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value = condition()
+        if value:
+            return value
+        time.sleep(interval)
+    pytest.fail(f"Timed out after {timeout}s waiting for {condition}")
@@ -0,0 +1,135 @@
+"""
+ApiCache: the in-process L1 in front of the api_cache table, and coalesced misses.
+
+Run from v7/: python -m pytest tests
+"""
+
+import asyncio
+import json
+import sqlite3
+import time
+
+from backend.db_cache import ApiCache
+
+MAX_AGE = 100
+
+
+def api_cache(db_path: str) -> ApiCache:
+    return ApiCache(db_path=db_path, max_age={"default": MAX_AGE})
+
+
+def insert_row(db_path: str, cache_key: str, content, age: float, category: str = "flashcards"):
+    """An api_cache row created `age` seconds ago"""
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "INSERT INTO api_cache (cache_key, category, content_json, created_at) VALUES (?, ?, ?, datetime('now', ?))",
+            (cache_key, category, json.dumps(content), f"-{age} seconds")
+        )
+
+
+def l1_seconds_left(cache: ApiCache, category: str, cache_key: str) -> float:
+    return cache.l1.cache[(category, cache_key)].expires_at - time.monotonic()
+
+
+def test_warm_l1_skips_expired_rows_and_keeps_the_rest_of_each_rows_lifetime(db_path):
+    insert_row(db_path, "fresh", {"n": 1}, age=0)
+    insert_row(db_path, "nearly-expired", {"n": 2}, age=MAX_AGE - 10)
+    insert_row(db_path, "expired", {"n": 3}, age=MAX_AGE + 10)
+    cache = api_cache(db_path)
+
+    assert asyncio.run(cache.warm_l1()) == 2
+    assert ("flashcards", "expired") not in cache.l1.cache
+    assert MAX_AGE - 5 < l1_seconds_left(cache, "flashcards", "fresh") <= MAX_AGE
+    assert 5 < l1_seconds_left(cache, "flashcards", "nearly-expired") <= 10
+
+
+def test_rows_read_through_to_l1_expire_with_the_row(db_path):
+    cache = api_cache(db_path)
+    key = cache._cache_key("a prompt")
+    insert_row(db_path, key, {"n": 1}, age=MAX_AGE - 10)
+
+    assert asyncio.run(cache.get("flashcards", "a prompt")) == {"n": 1}
+    assert 5 < l1_seconds_left(cache, "flashcards", key) <= 10
+
+
+def generator(content):
+    """A coroutine function standing in for an LLM call, counting its calls"""
+    async def generate():
+        generate.calls += 1
+        await asyncio.sleep(0.01)
+        return content
+    generate.calls = 0
+    return generate
+
+
+def test_generated_content_is_written_through_to_the_table_and_l1(db_path):
+    cache = api_cache(db_path)
+    generate = generator('{"flashcards": []}')
+
+    assert asyncio.run(cache.get_or_set("flashcards", "a prompt", generate)) == {"flashcards": []}
+    assert asyncio.run(cache.get_or_set("flashcards", "a prompt", generate)) == {"flashcards": []}
+    assert generate.calls == 1
+    # The second lookup was an L1 hit that never reached the table
+    assert cache.l1.stats()["hits"] == 1
+    assert cache.l2_hits == 0 and cache.l2_misses == 1
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT category, content_json FROM api_cache").fetchall()
+    assert rows == [("flashcards", '{"flashcards": []}')]
+
+
+def test_a_new_process_reads_the_table_once_then_serves_from_l1(db_path):
+    asyncio.run(api_cache(db_path).get_or_set("metadata", "a query", generator({"title": "Spanish"})))
+
+    # Same table, empty L1, as after a restart
+    cache = api_cache(db_path)
+    generate = generator({"title": "never generated"})
+    for _ in range(3):
+        assert asyncio.run(cache.get_or_set("metadata", "a query", generate)) == {"title": "Spanish"}
+    assert generate.calls == 0
+    assert cache.l2_hits == 1
+    assert cache.l1.stats()["hits"] == 2
+
+
+def test_context_keeps_entries_for_the_same_text_apart(db_path):
+    cache = api_cache(db_path)
+    spanish = asyncio.run(cache.get_or_set(
+        "flashcards", "greetings", generator({"language": "es"}), context={"target_language": "spanish"}
+    ))
+    french = asyncio.run(cache.get_or_set(
+        "flashcards", "greetings", generator({"language": "fr"}), context={"target_language": "french"}
+    ))
+    assert (spanish, french) == ({"language": "es"}, {"language": "fr"})
+
+
+def test_concurrent_misses_for_one_entry_generate_it_once(db_path):
+    cache = api_cache(db_path)
+    generate = generator({"lesson": 1})
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_set("flashcards", "a prompt", generate) for _ in range(5)))
+
+    assert asyncio.run(run()) == [{"lesson": 1}] * 5
+    assert generate.calls == 1
+    stats = cache.stats()
+    assert stats["coalesced"] == 4 and stats["inflight"] == 0
+
+
+def test_a_failed_generation_reaches_every_waiter_and_is_retried_by_the_next_request(db_path):
+    cache = api_cache(db_path)
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("LLM unavailable")
+
+    async def run():
+        return await asyncio.gather(
+            *(cache.get_or_set("flashcards", "a prompt", fail) for _ in range(3)), return_exceptions=True
+        )
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(run()))
+    assert cache.coalesced == 2
+
+    generate = generator({"lesson": 1})
+    assert asyncio.run(cache.get_or_set("flashcards", "a prompt", generate)) == {"lesson": 1}
+    assert generate.calls == 1
@@ -0,0 +1,135 @@
+"""
+AsyncLRUCache: LRU eviction, single-flight misses, byte budget and TTLs.
+
+Run from v7/: python -m pytest tests
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from backend.cache import AsyncLRUCache, estimate_size
+
+
+def counting(value="value", delay: float = 0.01):
+    """A coroutine function that returns value after a delay and counts its calls"""
+    async def compute(*args):
+        compute.calls += 1
+        await asyncio.sleep(delay)
+        return value
+    compute.calls = 0
+    return compute
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    cache = AsyncLRUCache(maxsize=2)
+    cache.set(("a",), 1)
+    cache.set(("b",), 2)
+    # Reading a makes b the least recently used
+    assert cache.get(("a",)) == 1
+    cache.set(("c",), 3)
+
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) == 1 and cache.get(("c",)) == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_concurrent_misses_share_one_computation():
+    cache = AsyncLRUCache(maxsize=10)
+    compute = counting()
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_set(("key",), compute) for _ in range(10)))
+
+    assert asyncio.run(run()) == ["value"] * 10
+    assert compute.calls == 1
+    stats = cache.stats()
+    assert stats["misses"] == 1 and stats["coalesced"] == 9 and stats["inflight"] == 0
+
+    # Now cached: a hit that doesn't compute again
+    assert asyncio.run(cache.get_or_set(("key",), compute)) == "value"
+    assert compute.calls == 1 and cache.stats()["hits"] == 1
+
+
+def test_a_failed_computation_reaches_every_waiter_and_is_not_cached():
+    cache = AsyncLRUCache(maxsize=10)
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_set(("key",), fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert cache.get(("key",)) is None
+    assert cache.stats()["inflight"] == 0
+
+
+def test_waiters_take_over_when_the_leader_is_cancelled():
+    cache = AsyncLRUCache(maxsize=10)
+    compute = counting(delay=0.05)
+
+    async def run():
+        leader = asyncio.ensure_future(cache.get_or_set(("key",), compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get_or_set(("key",), compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await waiter
+
+    assert asyncio.run(run()) == "value"
+    # The waiter computed it again itself rather than failing with the leader
+    assert compute.calls == 2
+    assert cache.get(("key",)) == "value"
+
+
+def test_byte_budget_evicts_least_recently_used_entries_until_it_fits():
+    value = "x" * 1000
+    entry_size = estimate_size(value) + estimate_size(("k", 0))
+    cache = AsyncLRUCache(maxsize=None, max_bytes=entry_size * 3)
+    for i in range(5):
+        cache.set(("k", i), value)
+
+    assert cache.current_bytes <= cache.max_bytes
+    assert [cache.get(("k", i)) is not None for i in range(5)] == [False, False, True, True, True]
+    assert cache.stats()["evictions"] == 2
+
+
+def test_entry_larger_than_the_budget_is_not_stored_and_evicts_nothing():
+    cache = AsyncLRUCache(maxsize=None, max_bytes=2000)
+    cache.set(("small",), "x")
+    cache.set(("huge",), "x" * 5000)
+
+    assert cache.get(("huge",)) is None
+    assert cache.get(("small",)) == "x"
+
+
+def test_entries_expire_after_their_categorys_ttl():
+    cache = AsyncLRUCache(ttl={"short": 0.05, "default": 60})
+    cache.set(("a",), 1, category="short")
+    cache.set(("b",), 2)
+    cache.set(("c",), 3, category="short")
+    time.sleep(0.06)
+
+    assert cache.get(("a",)) is None
+    assert cache.get(("b",)) == 2
+    # Expired entries nobody asks for again are dropped by purge_expired
+    assert cache.purge_expired() == 1
+    assert cache.stats()["expirations"] == 2
+    assert cache.stats()["size"] == 1
+
+
+def test_ttl_override_replaces_the_categorys_and_a_used_up_one_is_not_stored():
+    cache = AsyncLRUCache(ttl={"default": 60})
+    cache.set(("short",), 1, ttl=0.05)
+    cache.set(("expired",), 2, ttl=-1)
+    time.sleep(0.06)
+
+    assert cache.get(("short",)) is None
+    assert cache.get(("expired",)) is None
+    assert cache.stats()["expirations"] == 1
@@ -0,0 +1,33 @@
+"""
+Content validation statistics.
+
+Run from v7/: python -m pytest tests
+"""
+
+import asyncio
+
+import pytest
+
+from backend.utils.content_validation import ContentValidationError, ContentValidator
+
+
+def scripted(*replies: str):
+    """A completion function returning the given replies in order"""
+    remaining = iter(replies)
+
+    async def complete(prompt: str, instructions: str) -> str:
+        return next(remaining)
+
+    return complete
+
+
+def test_full_rerequest_is_counted_as_a_checked_response():
+    validator = ContentValidator()
+    with pytest.raises(ContentValidationError):
+        asyncio.run(validator.generate("flashcards", "prompt", "instructions", scripted("no json", "still no json")))
+
+    stats = validator.stats()["flashcards"]
+    assert stats["checked"] == 2
+    assert stats["unusable"] == 2
+    assert stats["full_rerequests"] == 1
+    assert stats["failed"] == 1
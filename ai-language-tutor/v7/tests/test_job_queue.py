@@ -0,0 +1,127 @@
+"""
+JobQueue: leasing generation units, recovering them from dead workers, and promotion.
+
+Run from v7/: python -m pytest tests
+"""
+
+import asyncio
+from typing import List, Tuple
+
+from backend.content_generator import CONTENT_TYPES
+from backend.db import Database
+from backend.job_queue import PRIORITY_NEXT, PRIORITY_REQUESTED, JobQueue
+
+from conftest import LESSONS, create_curriculum
+
+
+async def queued_curriculum(db_path: str, queue: JobQueue) -> str:
+    """A curriculum in its own database with every unit of its grid queued"""
+    curriculum_id = await create_curriculum(database=Database(db_path))
+    units = [(lesson_index, content_type) for lesson_index in range(LESSONS) for content_type in CONTENT_TYPES]
+    assert await queue.enqueue(curriculum_id, units) == len(units)
+    return curriculum_id
+
+
+def claimed(units) -> List[Tuple[int, int]]:
+    """(lesson_index, attempts) of claimed units"""
+    return [(unit.lesson_index, unit.attempts) for unit in units]
+
+
+def test_claim_leases_whole_lessons_in_order_and_counts_an_attempt(db_path):
+    queue = JobQueue(db_path=db_path, lease_seconds=60, max_attempts=3)
+
+    async def run():
+        curriculum_id = await queued_curriculum(db_path, queue)
+        first = await queue.claim(curriculum_id, lessons=2)
+        rest = await queue.claim(curriculum_id, lessons=2)
+        # Everything is leased now
+        nothing = await queue.claim(curriculum_id, lessons=2)
+        return first, rest, nothing, await queue.get_job(curriculum_id)
+
+    first, rest, nothing, job = asyncio.run(run())
+    assert claimed(first) == [(0, 1)] * len(CONTENT_TYPES) + [(1, 1)] * len(CONTENT_TYPES)
+    assert claimed(rest) == [(2, 1)] * len(CONTENT_TYPES)
+    assert nothing == []
+    assert job["units"] == {"leased": LESSONS * len(CONTENT_TYPES)}
+
+
+def test_recover_requeues_the_leases_of_other_workers_only(db_path):
+    dead = JobQueue(db_path=db_path, lease_seconds=60, max_attempts=3)
+
+    async def run():
+        curriculum_id = await queued_curriculum(db_path, dead)
+        await dead.claim(curriculum_id, lessons=1)
+        # The worker that took the leases recovering them would steal its own work
+        own = await dead.recover()
+
+        # A restarted process: a new worker that doesn't wait for the leases to expire
+        restarted = JobQueue(db_path=db_path, lease_seconds=60, max_attempts=3)
+        recovered = await restarted.recover()
+        return own, recovered, await restarted.get_job(curriculum_id), await restarted.claim(curriculum_id, lessons=1)
+
+    own, recovered, job, units = asyncio.run(run())
+    assert own == 0
+    assert recovered == len(CONTENT_TYPES)
+    assert job["status"] == "queued" and job["units"] == {"queued": LESSONS * len(CONTENT_TYPES)}
+    # Lesson 0 again, with the interrupted attempt counted
+    assert claimed(units) == [(0, 2)] * len(CONTENT_TYPES)
+
+
+def test_an_expired_lease_can_be_claimed_by_another_worker(db_path):
+    slow = JobQueue(db_path=db_path, lease_seconds=0.05, max_attempts=3)
+    other = JobQueue(db_path=db_path, lease_seconds=60, max_attempts=3)
+
+    async def run():
+        curriculum_id = await queued_curriculum(db_path, slow)
+        await slow.claim(curriculum_id, lessons=LESSONS)
+        before = await other.claim(curriculum_id, lessons=1)
+        await asyncio.sleep(0.1)
+        return before, await other.claim(curriculum_id, lessons=1)
+
+    before, after = asyncio.run(run())
+    assert before == []
+    assert claimed(after) == [(0, 2)] * len(CONTENT_TYPES)
+
+
+def test_promoted_lesson_and_the_one_after_it_are_claimed_first(db_path):
+    queue = JobQueue(db_path=db_path, lease_seconds=60, max_attempts=3)
+
+    async def run():
+        curriculum_id = await queued_curriculum(db_path, queue)
+        assert await queue.promote(curriculum_id, 1, "flashcards")
+        return await queue.runnable_jobs(limit=1), curriculum_id, await queue.claim(curriculum_id, lessons=2)
+
+    runnable, curriculum_id, units = asyncio.run(run())
+    assert runnable == [curriculum_id]
+    assert [(unit.lesson_index, unit.priority) for unit in units] == (
+        [(1, PRIORITY_REQUESTED)] * len(CONTENT_TYPES) + [(2, PRIORITY_NEXT)] * len(CONTENT_TYPES)
+    )
+    assert queue.counts["promoted"] == 2 * len(CONTENT_TYPES)
+
+
+def test_promote_never_lowers_a_priority_and_ignores_units_with_nothing_pending(db_path):
+    # One attempt, so a unit that comes back without content fails rather than being queued again
+    queue = JobQueue(db_path=db_path, lease_seconds=60, max_attempts=1)
+
+    async def run():
+        curriculum_id = await queued_curriculum(db_path, queue)
+        await queue.promote(curriculum_id, 1, "flashcards")
+        # Lesson 0 is asked for next: lesson 1 keeps the higher priority it already has
+        await queue.promote(curriculum_id, 0, "flashcards")
+        units = await queue.claim(curriculum_id, lessons=LESSONS)
+
+        # Leased units are still pending, so the caller is told to wait for them
+        still_pending = await queue.promote(curriculum_id, 0, "flashcards")
+        await queue.complete([unit for unit in units if unit.lesson_index == 0], [])
+        return units, still_pending, [
+            await queue.promote(curriculum_id, 0, "flashcards"),
+            await queue.promote(curriculum_id, LESSONS, "flashcards"),
+            await queue.promote("no-such-curriculum", 0, "flashcards"),
+        ]
+
+    units, still_pending, nothing_pending = asyncio.run(run())
+    assert sorted({(unit.lesson_index, unit.priority) for unit in units}) == [
+        (0, PRIORITY_REQUESTED), (1, PRIORITY_REQUESTED), (2, PRIORITY_NEXT)
+    ]
+    assert still_pending
+    assert nothing_pending == [False, False, False]
@@ -0,0 +1,106 @@
+"""
+Lazy generation: lessons queued on demand as learners reach them (ContentGenerator.request_lesson).
+
+Run from v7/: python -m pytest tests
+"""
+
+from backend.content_generator import CONTENT_TYPES, ContentGenerator, content_generator
+from backend.db import db
+from backend.job_queue import job_queue
+
+from conftest import LESSONS, ScriptedBackend, create_curriculum, wait_for
+
+
+def lazy_curriculum(client):
+    """A curriculum queued by a lazy generator: only lesson 0 is queued"""
+    generator = ContentGenerator(mode="lazy")
+    curriculum_id = client.portal.call(create_curriculum)
+    assert client.portal.call(generator.enqueue_content_generation, curriculum_id) == len(CONTENT_TYPES)
+    return generator, curriculum_id
+
+
+def lesson_generated(client, curriculum_id: str, lesson_index: int) -> bool:
+    generated = client.portal.call(db.get_generated_units, curriculum_id)
+    return all((lesson_index, content_type) in generated for content_type in CONTENT_TYPES)
+
+
+def test_lazy_mode_queues_lesson_zero_then_lessons_as_they_are_requested(client, llm):
+    llm(ScriptedBackend())
+    generator, curriculum_id = lazy_curriculum(client)
+    wait_for(lambda: lesson_generated(client, curriculum_id, 0))
+    assert client.portal.call(db.get_generated_units, curriculum_id) == {
+        (0, content_type) for content_type in CONTENT_TYPES
+    }
+
+    client.portal.call(generator.on_lesson_fetched, curriculum_id, 0)
+    wait_for(lambda: lesson_generated(client, curriculum_id, 1))
+    assert generator.on_demand_lessons == 1
+    assert not lesson_generated(client, curriculum_id, 2)
+
+
+def test_repeated_requests_for_a_pending_lesson_queue_and_count_it_once(client, llm):
+    llm(ScriptedBackend())
+    generator, curriculum_id = lazy_curriculum(client)
+
+    for _ in range(5):
+        # e.g. a client polling through 202/Retry-After
+        assert client.portal.call(generator.request_lesson, curriculum_id, 2)
+    assert generator.on_demand_lessons == 1
+    stats = generator.lesson_requests.stats()
+    assert stats["misses"] == 1 and stats["hits"] == 4
+
+    # Already queued by someone else: looked up, but neither queued again nor counted
+    other = ContentGenerator(mode="lazy")
+    assert client.portal.call(other.request_lesson, curriculum_id, 2)
+    assert other.on_demand_lessons == 0
+    wait_for(lambda: lesson_generated(client, curriculum_id, 2))
+
+
+def test_lesson_whose_units_failed_is_queued_again_on_the_next_request(client, llm, monkeypatch):
+    monkeypatch.setattr(job_queue, "max_attempts", 1)
+    llm(ScriptedBackend(refuse={"exercises"}))
+    generator, curriculum_id = lazy_curriculum(client)
+    assert client.portal.call(generator.request_lesson, curriculum_id, 1)
+
+    def failed_units():
+        job = client.portal.call(job_queue.get_job, curriculum_id)
+        return job["units"].get("failed") == 2 and not job["units"].get("queued") and not job["units"].get("leased")
+
+    wait_for(failed_units)
+    assert not lesson_generated(client, curriculum_id, 1)
+
+    llm(ScriptedBackend())
+    assert client.portal.call(generator.request_lesson, curriculum_id, 1)
+    assert generator.on_demand_lessons == 2
+    wait_for(lambda: lesson_generated(client, curriculum_id, 1))
+    # Lesson 0 failed too, and is requeued when it is requested in turn
+    assert client.portal.call(generator.request_lesson, curriculum_id, 0)
+    wait_for(lambda: lesson_generated(client, curriculum_id, 0))
+
+
+def test_lessons_outside_the_curriculum_are_not_queued(client):
+    generator, curriculum_id = lazy_curriculum(client)
+    assert not client.portal.call(generator.request_lesson, curriculum_id, LESSONS)
+    assert not client.portal.call(generator.request_lesson, "no-such-curriculum", 0)
+    assert generator.on_demand_lessons == 0
+
+
+def test_lesson_read_survives_a_failing_on_demand_request(client, llm, monkeypatch):
+    async def broken(curriculum_id: str, lesson_index: int) -> bool:
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(content_generator, "mode", "lazy")
+    monkeypatch.setattr(content_generator, "request_lesson", broken)
+    curriculum_id = client.portal.call(create_curriculum)
+
+    # Nothing queued for it: a plain 404 rather than a 500
+    response = client.get(f"/curriculum/{curriculum_id}/lesson/0/flashcards")
+    assert response.status_code == 404
+
+    # Queued anyway (here directly): still promoted and answered with a 202
+    llm(ScriptedBackend(latency="fixed:500"))
+    client.portal.call(job_queue.enqueue, curriculum_id, [(0, content_type) for content_type in CONTENT_TYPES])
+    response = client.get(f"/curriculum/{curriculum_id}/lesson/0/flashcards")
+    assert response.status_code == 202
+    assert response.headers["retry-after"]
+    wait_for(lambda: lesson_generated(client, curriculum_id, 0))
@@ -0,0 +1,71 @@
+"""
+Resuming curricula whose generation failed (POST /admin/generations/resume).
+
+Run from v7/: python -m pytest tests
+"""
+
+from typing import Dict, Tuple
+
+from backend.content_generator import CONTENT_TYPES, content_generator
+from backend.db import db
+from backend.job_queue import job_queue
+
+from conftest import LESSONS, ScriptedBackend, create_curriculum, curriculum_tag, wait_for
+
+
+async def unit_states(curriculum_id: str) -> Dict[Tuple[int, str], Tuple[str, int]]:
+    """(lesson_index, content_type) -> (status, attempts) of a curriculum's generation units"""
+    async with db.pool.read() as conn:
+        async with conn.execute("""
+            SELECT lesson_index, content_type, status, attempts FROM generation_units WHERE curriculum_id = ?
+        """, (curriculum_id,)) as cursor:
+            return {(row[0], row[1]): (row[2], row[3]) for row in await cursor.fetchall()}
+
+
+def finished_job(client, curriculum_id: str):
+    job = client.portal.call(job_queue.get_job, curriculum_id)
+    return job if job and job["status"] in ("completed", "failed", "cancelled") else None
+
+
+def test_resume_requeues_only_the_missing_cells_of_a_failed_job(client, llm, monkeypatch):
+    monkeypatch.setattr(job_queue, "max_attempts", 1)
+    llm(ScriptedBackend(refuse={"exercises"}))
+    curriculum_id = client.portal.call(create_curriculum)
+    client.portal.call(content_generator.enqueue_content_generation, curriculum_id)
+
+    job = wait_for(lambda: finished_job(client, curriculum_id))
+    assert job["status"] == "failed"
+    assert job["units"] == {"done": LESSONS * (len(CONTENT_TYPES) - 1), "failed": LESSONS}
+    # A failed job leaves the curriculum incomplete, so resume can find it
+    assert client.portal.call(db.get_curriculum, curriculum_id)["is_content_generated"] == 0
+    assert curriculum_id in [
+        row["curriculum_id"] for row in client.portal.call(db.get_incomplete_curricula, ("failed",))
+    ]
+    before = client.portal.call(unit_states, curriculum_id)
+
+    backend = llm(ScriptedBackend())
+    response = client.post("/admin/generations/resume")
+    assert response.status_code == 200
+    resumed = {entry["curriculum_id"]: entry for entry in response.json()["resumed"]}
+    assert resumed[curriculum_id]["units_queued"] == LESSONS
+    assert resumed[curriculum_id]["job_status"] == "failed"
+
+    job = wait_for(lambda: finished_job(client, curriculum_id))
+    assert job["status"] == "completed"
+    # Other tests' incomplete curricula are resumed too; only look at this one's calls
+    tag = client.portal.call(curriculum_tag, curriculum_id)
+    assert backend.modes_requested(containing=tag) == {"exercises"}
+    after = client.portal.call(unit_states, curriculum_id)
+    for unit, (status, attempts) in after.items():
+        assert status == "done"
+        if unit[1] != "exercises":
+            # Content that was already generated is neither queued nor generated again
+            assert (status, attempts) == before[unit]
+    assert client.portal.call(db.get_generated_units, curriculum_id) == {
+        (lesson_index, content_type) for lesson_index in range(LESSONS) for content_type in CONTENT_TYPES
+    }
+    assert client.portal.call(db.get_curriculum, curriculum_id)["is_content_generated"] == 1
+
+    # Nothing is left to resume for it
+    response = client.post("/admin/generations/resume")
+    assert curriculum_id not in {entry["curriculum_id"] for entry in response.json()["resumed"]}
@@ -0,0 +1,174 @@
+"""
+Retry policy against a fake OpenAI-compatible server.
+
+The server is an httpx MockTransport behind a real AsyncOpenAI client, so the
+policy sees the same exceptions and headers it gets in production. The
+client's own retries are off; retrying is the policy's job.
+
+Run from v7/: python -m pytest tests
+"""
+
+import asyncio
+import json
+from typing import Awaitable, Callable, List
+
+import httpx
+import openai
+import pytest
+from openai import AsyncOpenAI
+
+from backend.utils.rate_limiter import RateLimiter
+from backend.utils.retry import RetryPolicy, admitted
+
+
+def completion_body(content: str) -> dict:
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "fake",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+    }
+
+
+def fake_client(handler: Callable[[httpx.Request], Awaitable[httpx.Response]]) -> AsyncOpenAI:
+    return AsyncOpenAI(
+        api_key="test",
+        base_url="http://fake-llm.test/v1",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+
+
+def completion_attempt(client: AsyncOpenAI, limiter: RateLimiter = None) -> Callable[[], Awaitable[str]]:
+    """A single-request attempt, shaped like the one in generate_completions"""
+    limiter = limiter or RateLimiter(max_concurrency=8)
+
+    async def attempt() -> str:
+        async with limiter.slot():
+            admitted()
+            response = await client.chat.completions.create(
+                model="fake", messages=[{"role": "user", "content": "hi"}]
+            )
+        return response.choices[0].message.content
+
+    return attempt
+
+
+class RecordingPolicy(RetryPolicy):
+    """Records the backoff delays instead of sleeping through them"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.delays: List[float] = []
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        delay = super().backoff(attempt, error)
+        self.delays.append(delay)
+        return delay
+
+
+def test_retries_429_and_503_then_succeeds_respecting_retry_after():
+    responses = [
+        httpx.Response(429, headers={"retry-after": "0.2"}, json={"error": {"message": "slow down"}}),
+        httpx.Response(503, json={"error": {"message": "unavailable"}}),
+        httpx.Response(200, json=completion_body(json.dumps({"ok": True})))
+    ]
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return responses[len(requests) - 1]
+
+    policy = RecordingPolicy(max_attempts=4, base_delay=0.01, max_delay=0.05)
+    result = asyncio.run(policy.run(completion_attempt(fake_client(handler))))
+
+    assert json.loads(result) == {"ok": True}
+    assert len(requests) == 3
+    assert policy.retries == 2 and policy.failures == 0
+    # The 429's Retry-After is a floor over the jittered backoff; the 503 has only the backoff cap
+    assert policy.delays[0] >= 0.2
+    assert policy.delays[1] <= 0.05
+    assert policy.recent[-1].attempts == 3
+
+
+def test_bad_request_is_not_retried():
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(400, json={"error": {"message": "bad request"}})
+
+    policy = RecordingPolicy(max_attempts=4, base_delay=0.01)
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(policy.run(completion_attempt(fake_client(handler))))
+
+    assert len(requests) == 1
+    assert policy.retries == 0 and policy.failures == 1
+    assert policy.delays == []
+
+
+def test_hedge_beats_slow_primary_and_loser_is_cancelled():
+    calls = 0
+    primary_cancelled = False
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls, primary_cancelled
+        calls += 1
+        if calls == 1:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                primary_cancelled = True
+                raise
+            return httpx.Response(200, json=completion_body("primary"))
+        return httpx.Response(200, json=completion_body("hedge"))
+
+    policy = RetryPolicy(hedge=True, hedge_after=0.05)
+
+    async def run() -> str:
+        result = await policy.run(completion_attempt(fake_client(handler)))
+        # Let the cancelled primary unwind
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == "hedge"
+    assert calls == 2
+    assert primary_cancelled
+    assert policy.hedges == 1 and policy.hedge_wins == 1
+
+
+def test_time_queued_for_a_limiter_slot_does_not_trigger_a_hedge():
+    calls = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, json=completion_body("ok"))
+
+    limiter = RateLimiter(max_concurrency=1)
+    policy = RetryPolicy(hedge=True, hedge_after=0.05)
+
+    async def run() -> str:
+        # Another call holds the only slot for well past the hedge threshold
+        async def busy():
+            async with limiter.slot():
+                await asyncio.sleep(0.2)
+
+        holder = asyncio.ensure_future(busy())
+        await asyncio.sleep(0)
+        result = await policy.run(completion_attempt(fake_client(handler), limiter))
+        await holder
+        return result
+
+    assert asyncio.run(run()) == "ok"
+    assert calls == 1
+    assert policy.hedges == 0
+    # The latency sample is the request itself, not the ~0.2s spent queued
+    assert max(policy.latencies) < 0.15